@@ -11,7 +11,7 @@ from datetime import datetime
 import os
 
 from db import init_db, SessionLocal, Document, Lead, Session as DBSession, Message, BotCommand, Client, ClientPhone, ClientChild
-from core.rag import RAGSystem
+from core.rag import get_rag
 from core.utils import format_phone
 
 # Инициализация
@@ -241,29 +241,22 @@ if page == "База знаний":
         st.subheader("Переиндексация RAG")
         st.write("Обновить векторный индекс для поиска по базе знаний.")
         
+        full_reindex = st.checkbox("Полная переиндексация (новая версия индекса, бот работает без перерыва)", value=False)
+        
         if st.button("Переиндексировать"):
             with st.spinner("Индексация..."):
-                rag = RAGSystem(park_id="nn")
-                rag.clear()
+                rag = get_rag("nn")
                 
-                # Индексируем из БД
+                # Документы из БД + файлы из knowledge/: эмбеддинги только для изменённых чанков
                 db = SessionLocal()
                 docs = db.query(Document).all()
-                
-                for doc in docs:
-                    rag.add_document(
-                        doc_id=f"db_{doc.id}",
-                        content=doc.content,
-                        category=doc.category,
-                        title=doc.title
-                    )
-                
-                # Плюс файлы из knowledge/
-                file_count = rag.index_knowledge_files()
-                
                 db.close()
                 
-            st.success(f"Проиндексировано: {len(docs)} документов из БД + {file_count} файлов")
+                chunks = rag.document_chunks(docs) + rag.knowledge_chunks()
+                diff = rag.rebuild(chunks) if full_reindex else rag.sync(chunks)
+                
+            st.success(f"Индекс обновлён: {len(docs)} документов из БД + файлы knowledge/ (версия {rag.store.name})")
+            st.text(rag.format_sync_summary(diff))
 
 
 # ============ КОМАНДЫ БОТА ============
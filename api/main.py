@@ -5,22 +5,31 @@ API для веб-чата на сайте.
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+import json
 import logging
 import uuid
 from datetime import datetime
 
-from core.agent import Agent
-from core.rag import RAGSystem
-from core.intent_router import detect_intent
+from core.agent import agent, TurnResult
+from core.answer_cache import answer_cache
+from config.prompts import prompt_compiler
+from core.metrics import llm_metrics
+from core.llm_gateway import llm_gateway
+from core.embedding_cache import embedding_cache
+from core.history import load_history, schedule_summary
+from core.rag import get_rag
+from core.intent_router import detect_intent, intent_batcher
 from db.database import SessionLocal
 from db.models import Session as DBSession, Message
 from core.lead_service import (
     get_or_create_lead,
-    update_lead_from_data,
     mark_lead_sent_to_manager,
-    lead_to_dict
+    lead_to_dict,
+    apply_lead_updates,
+    get_unextracted_messages
 )
 from core.notifications import send_to_managers, format_lead_message
 
@@ -48,9 +57,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Инициализация компонентов
-agent = Agent()
-rag = RAGSystem()
+# Инициализация компонентов (агент и RAG общие)
+rag = get_rag("nn")
 
 
 class ChatRequest(BaseModel):
@@ -70,7 +78,146 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "answer_cache": answer_cache.stats(),
+        "prompt_tokens": prompt_compiler.token_counts(),
+        "llm": llm_metrics.summary(),
+        "llm_hedging": llm_metrics.hedge_summary(),
+        "llm_gateway": llm_gateway.stats(),
+        "intent_batching": intent_batcher.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "rag_index": rag.store.name,
+        "rag_context_cache": rag.context_cache.stats()
+    }
+
+
+async def prepare_turn(db, request: ChatRequest) -> dict:
+    """
+    Подготовить ход диалога: сессия, сохранение сообщения, intent, история, RAG, лид.
+    
+    Returns:
+        Словарь с данными для генерации ответа и для finish_turn
+    """
+    # Генерируем или используем существующий session_id
+    session_id = request.session_id or f"web_{uuid.uuid4().hex[:12]}"
+    
+    # Ищем или создаём сессию
+    session = db.query(DBSession).filter(
+        DBSession.telegram_id == session_id
+    ).first()
+    
+    if not session:
+        session = DBSession(
+            telegram_id=session_id,
+            park_id="nn",
+            intent="unknown"
+        )
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+        logger.info(f"Created new web session: {session_id}")
+    
+    # Сохраняем сообщение пользователя
+    user_message = Message(
+        session_id=session.id,
+        role="user",
+        content=request.message
+    )
+    db.add(user_message)
+    db.commit()
+    
+    # Определяем intent если ещё не определён
+    if session.intent == "unknown":
+        detected_result = await detect_intent(request.message)
+        # detect_intent возвращает IntentResult, извлекаем строку
+        detected = detected_result.intent if hasattr(detected_result, 'intent') else str(detected_result)
+        if detected != "unknown":
+            session.intent = detected
+            db.commit()
+            logger.info(f"Detected intent: {detected}")
+    
+    # Получаем историю сообщений (по бюджету токенов, старое — в резюме)
+    window = load_history(db, session.id, before_id=user_message.id)
+    
+    # Типовые вопросы (general/events) — сначала ищем готовый ответ в кеше
+    cached = await answer_cache.lookup(request.message, session.intent, window.messages, window.summary)
+    
+    # Получаем RAG контекст (при попадании в кеш он не нужен)
+    rag_context = "" if cached.answer else await rag.aget_context(request.message, session.intent)
+    
+    # Для birthday — работаем с Lead
+    lead_data = {}
+    current_lead = None
+    pending_messages = []
+    
+    if session.intent == "birthday":
+        # Данные заявки из сообщения модель вернёт вместе с ответом (agent.generate_turn)
+        current_lead = get_or_create_lead(session_id, source="web", park_id="nn")
+        lead_data = lead_to_dict(current_lead)
+        pending_messages = get_unextracted_messages(current_lead, session.id, user_message.id)
+    
+    return {
+        "session": session,
+        "session_id": session_id,
+        "current_lead": current_lead,
+        "lead_data": lead_data,
+        "message_id": user_message.id,
+        "pending_messages": pending_messages,
+        "cached": cached,
+        "window": window,
+        "result": TurnResult(),
+        "agent_kwargs": {
+            "message": request.message,
+            "intent": session.intent,
+            "rag_context": rag_context,
+            "history": window.messages,
+            "summary": window.summary,
+            "lead_data": lead_data,
+        },
+    }
+
+
+def turn_kwargs(turn: dict) -> dict:
+    """Аргументы для agent.generate_turn / agent.stream_turn (birthday-ветка)."""
+    kwargs = dict(turn["agent_kwargs"])
+    kwargs.pop("intent")
+    kwargs["pending_messages"] = turn["pending_messages"]
+    return kwargs
+
+
+async def finish_turn(db, turn: dict, response: str):
+    """Сохранить ответ бота и данные заявки, при необходимости уведомить менеджеров."""
+    session = turn["session"]
+    session_id = turn["session_id"]
+    current_lead = turn["current_lead"]
+    
+    # Сохраняем ответ бота
+    bot_message = Message(
+        session_id=session.id,
+        role="assistant",
+        content=response
+    )
+    db.add(bot_message)
+    db.commit()
+    
+    # Выпавшие из окна сообщения сворачиваем в резюме (фоном)
+    schedule_summary(session.id, turn["window"])
+    
+    if not current_lead:
+        return
+    
+    # Данные заявки, которые модель вернула вместе с ответом
+    current_lead = apply_lead_updates(current_lead, turn["result"].lead_updates, message_id=turn["message_id"])
+    
+    # Отправляем уведомление менеджеру если нужно
+    if not current_lead.sent_to_manager:
+        if any(x in response.lower() for x in ["передал", "передаю заявку", "менеджер свяжется", "отдел праздников"]):
+            msg_text = format_lead_message("web", session_id, lead_to_dict(current_lead))
+            await send_to_managers(msg_text)
+            mark_lead_sent_to_manager(current_lead.id)
+            logger.info(f"Manager notification sent for Lead #{current_lead.id}")
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -79,106 +226,89 @@ async def chat(request: ChatRequest):
     Основной endpoint для чата.
     Принимает сообщение и session_id, возвращает ответ бота.
     """
+    db = SessionLocal()
     try:
-        db = SessionLocal()
-        
-        # Генерируем или используем существующий session_id
-        session_id = request.session_id or f"web_{uuid.uuid4().hex[:12]}"
-        
-        # Ищем или создаём сессию
-        session = db.query(DBSession).filter(
-            DBSession.telegram_id == session_id
-        ).first()
-        
-        if not session:
-            session = DBSession(
-                telegram_id=session_id,
-                park_id="nn",
-                intent="unknown"
-            )
-            db.add(session)
-            db.commit()
-            db.refresh(session)
-            logger.info(f"Created new web session: {session_id}")
-        
-        # Сохраняем сообщение пользователя
-        user_message = Message(
-            session_id=session.id,
-            role="user",
-            content=request.message
-        )
-        db.add(user_message)
-        db.commit()
-        
-        # Определяем intent если ещё не определён
-        if session.intent == "unknown":
-            detected_result = detect_intent(request.message)
-            # detect_intent возвращает IntentResult, извлекаем строку
-            detected = detected_result.intent if hasattr(detected_result, 'intent') else str(detected_result)
-            if detected != "unknown":
-                session.intent = detected
-                db.commit()
-                logger.info(f"Detected intent: {detected}")
-        
-        # Получаем историю сообщений
-        history = db.query(Message).filter(
-            Message.session_id == session.id
-        ).order_by(Message.id).all()
-        
-        history_list = [{"role": m.role, "content": m.content} for m in history]
+        turn = await prepare_turn(db, request)
         
-        # Получаем RAG контекст
-        rag_context = rag.get_context(request.message, session.intent)
+        # Генерируем ответ (для birthday — вместе с данными заявки)
+        if turn["current_lead"]:
+            turn["result"] = await agent.generate_turn(**turn_kwargs(turn))
+            response = turn["result"].reply
+        elif turn["cached"].answer:
+            response = turn["cached"].answer
+        else:
+            response = await agent.generate_response(**turn["agent_kwargs"])
+            answer_cache.store(turn["cached"], response)
         
-        # Для birthday — работаем с Lead
-        lead_data = {}
-        current_lead = None
-        
-        if session.intent == "birthday":
-            current_lead = get_or_create_lead(session_id, source="web", park_id="nn")
-            extracted = agent.extract_lead_data(request.message, {})
-            if extracted:
-                current_lead = update_lead_from_data(current_lead.id, extracted)
-            lead_data = lead_to_dict(current_lead)
-        
-        # Генерируем ответ
-        response = agent.generate_response(
-            message=request.message,
-            intent=session.intent,
-            rag_context=rag_context,
-            history=history_list,
-            lead_data=lead_data
-        )
-        
-        # Сохраняем ответ бота
-        bot_message = Message(
-            session_id=session.id,
-            role="assistant",
-            content=response
-        )
-        db.add(bot_message)
-        db.commit()
-        
-        # Отправляем уведомление менеджеру если нужно
-        if current_lead and not current_lead.sent_to_manager:
-            if any(x in response.lower() for x in ["передал", "передаю заявку", "менеджер свяжется", "отдел праздников"]):
-                final_data = agent.extract_lead_data(response, lead_data)
-                current_lead = update_lead_from_data(current_lead.id, final_data)
-                msg_text = format_lead_message("web", session_id, lead_to_dict(current_lead))
-                await send_to_managers(msg_text)
-                mark_lead_sent_to_manager(current_lead.id)
-                logger.info(f"Manager notification sent for Lead #{current_lead.id}")
-        
-        db.close()
+        await finish_turn(db, turn, response)
         
         return ChatResponse(
             reply=response,
-            session_id=session_id
+            session_id=turn["session_id"]
         )
         
     except Exception as e:
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Сформировать событие Server-Sent Events."""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Потоковый endpoint для чата (SSE).
+    События: `data: {"delta": "..."}` по мере генерации,
+    в конце `event: done` с полным ответом и session_id.
+    """
+    db = SessionLocal()
+    try:
+        turn = await prepare_turn(db, request)
+    except Exception as e:
+        db.close()
+        logger.error(f"Chat stream error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        response = ""
+        try:
+            if turn["current_lead"]:
+                chunks = agent.stream_turn(**turn_kwargs(turn), result=turn["result"])
+            elif turn["cached"].answer:
+                chunks = None
+            else:
+                chunks = agent.stream_response(**turn["agent_kwargs"])
+            
+            if chunks is None:
+                response = turn["cached"].answer
+                yield sse_event({"delta": response})
+            else:
+                async for chunk in chunks:
+                    response += chunk
+                    yield sse_event({"delta": chunk})
+                answer_cache.store(turn["cached"], response)
+            
+            await finish_turn(db, turn, response)
+            yield sse_event({"reply": response, "session_id": turn["session_id"]}, event="done")
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            yield sse_event({"detail": str(e)}, event="error")
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 if __name__ == "__main__":
@@ -6,24 +6,23 @@ from telegram.ext import ContextTypes
 import re
 
 from core import detect_intent, agent, rag, lead_collector
+from core.agent import TurnResult
+from core.answer_cache import answer_cache
+from core.history import load_history, schedule_summary
 from db import SessionLocal, Session as DBSession, Message, Lead, BotCommand
 from sqlalchemy.orm.attributes import flag_modified
 from config.settings import MANAGER_CHAT_ID
+from bot.streaming import send_streamed_reply, FALLBACK_REPLY
 from core.notifications import (
     send_to_managers, 
     format_lead_message, 
     format_escalation_message, 
-    needs_human_escalation,
-    needs_lost_item_flow,
     format_lost_item_message,
-    needs_booking_change_request,
     get_booking_change_type,
     format_booking_change_message,
-    needs_photo_request,
-    needs_photo_order,
     format_photo_request_message,
     format_photo_order_message,
-    needs_partnership_proposal,
+    detect_flow_flags,
     format_partnership_message
 )
 from core.lead_service import (
@@ -31,6 +30,8 @@ from core.lead_service import (
     update_lead_from_data,
     mark_lead_sent_to_manager,
     lead_to_dict,
+    apply_lead_updates,
+    get_unextracted_messages,
     save_amocrm_deal_id,
     save_amocrm_contact_id,
     mark_status_notified,
@@ -1077,6 +1078,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         # -----------------------------------------------
         
+        # Триггеры всех сценариев — одним проходом по сообщению
+        flags = detect_flow_flags(message_text)
+        
         # ============ ПОТЕРЯШКИ — обработка потерянных вещей ============
         # Проверяем, находимся ли мы уже в режиме опроса
         lost_data = session.lead_data or {}
@@ -1084,16 +1088,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         if lost_step:
             # Проверяем, не хочет ли пользователь выйти из опроса
-            exit_keywords = [
-                "ничего не потерял", "ничего не потеряла", "ничего не теряла", "ничего не терял",
-                "не потерял", "не потеряла", "не теряла", "не терял",
-                "я не про это", "я о другом", "хотел спросить", "хотела спросить",
-                "я спрашиваю", "речь не об этом", "не об этом",
-                "отмена", "стоп", "хватит", "выход", "exit", "cancel",
-                "можно купить", "где купить", "продаёте", "продаете",
-            ]
-            message_lower = message_text.lower()
-            if any(kw in message_lower for kw in exit_keywords):
+            if flags.lost_exit:
                 # Сбрасываем режим потеряшек
                 session.intent = "unknown"
                 session.lead_data = {}
@@ -1195,7 +1190,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             session.intent = "unknown"
             db.commit()
         
-        if needs_lost_item_flow(message_text):
+        if flags.lost_item:
             session.intent = "lost_item"
             session.lead_data = {"lost_step": "date"}
             flag_modified(session, "lead_data")
@@ -1209,7 +1204,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # ============ КОНЕЦ ПОТЕРЯШКИ ============
         
         # Проверяем запрос живого менеджера
-        if needs_human_escalation(message_text):
+        if flags.human_escalation:
             # Отправляем уведомление менеджерам
             escalation_msg = format_escalation_message(
                 platform="telegram",
@@ -1231,7 +1226,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # ============ ЗАПРОСЫ НА ИЗМЕНЕНИЕ БРОНИРОВАНИЯ ============
         # Проверяем, просит ли клиент изменить/отменить бронь текстом
-        if needs_booking_change_request(message_text):
+        if flags.booking_change:
             user_name = user.first_name or "Гость"
             change_type = get_booking_change_type(message_text)
             
@@ -1355,7 +1350,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     return
         
         # Проверяем триггер заказа фотографа (сначала — более специфичный)
-        if needs_photo_order(message_text):
+        if flags.photo_order:
             user_name = user.first_name or "Гость"
             
             # Проверяем телефон в CRM
@@ -1423,7 +1418,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Проверяем триггер запроса фотографий (получение готовых фото)
-        if needs_photo_request(message_text):
+        if flags.photo_request:
             user_name = user.first_name or "Гость"
             
             # Проверяем телефон в CRM
@@ -1516,7 +1511,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
         
         # Проверяем триггер предложения о сотрудничестве
-        if needs_partnership_proposal(message_text):
+        if flags.partnership:
             session.intent = "partnership"
             session.lead_data = {"partnership_step": "details"}
             flag_modified(session, "lead_data")
@@ -1532,7 +1527,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Определяем intent
 
         current_intent = session.intent
-        intent_result = detect_intent(message_text)
+        intent_result = await detect_intent(message_text)
         
         # Логика переключения intent
         if current_intent == "unknown":
@@ -1557,13 +1552,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             db.commit()
             logger.info(f"Intent switched: birthday -> events")
         
-        # Получаем историю сообщений
-        history = []
-        for msg in db.query(Message).filter(Message.session_id == session.id).order_by(Message.id.desc()).limit(10).all():
-            history.insert(0, {"role": msg.role, "content": msg.content})
+        # Получаем историю сообщений (по бюджету токенов, старое — в резюме)
+        window = load_history(db, session.id, before_id=user_message.id)
+        history = window.messages
         
-        # Получаем контекст из RAG
-        rag_context = rag.get_context(message_text, session.intent)
+        # Типовые вопросы (general/events) — сначала ищем готовый ответ в кеше
+        cached = await answer_cache.lookup(message_text, session.intent, history, window.summary)
+        
+        # Получаем контекст из RAG (при попадании в кеш он не нужен)
+        rag_context = "" if cached.answer else await rag.aget_context(message_text, session.intent)
         
         # Для birthday ветки — сохраняем данные в Lead (надёжно в БД)
         current_lead = None
@@ -1609,31 +1606,95 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     context.user_data["pending_new_date"] = message_text
                     return  # Ждём выбора пользователя
             
-            # Извлекаем данные из ВСЕЙ истории переписки (не только последнего сообщения)
-            # Это критически важно т.к. имя, телефон, дата могут быть в разных сообщениях
-            current_lead_data = lead_to_dict(current_lead)
-            
-            # Собираем все сообщения пользователя из истории
-            user_messages = [msg["content"] for msg in history if msg["role"] == "user"][-10:]
-            full_conversation = "\n".join(user_messages)
-            
-            extracted = agent.extract_lead_data(full_conversation, current_lead_data)
-            
-            # Обновляем Lead в БД
-            if extracted:
-                # Если имя не указано — берём из профиля
-                if not extracted.get("customer_name") and user.first_name:
-                    extracted["customer_name"] = user.first_name
+            # Данные заявки извлекаются тем же вызовом LLM, что и ответ (agent.stream_turn),
+            # и только из ещё не разобранных сообщений (водяной знак на Lead)
+            lead_data = lead_to_dict(current_lead)
+            # Добавляем first_name для имени из профиля
+            lead_data["first_name"] = user.first_name
+        
+        # Проверяем статус сделки в AmoCRM
+        deal_in_work = False
+        status_just_changed = False
+        
+        if current_lead and current_lead.amocrm_deal_id:
+            try:
+                deal_in_work = await amocrm_client.is_deal_in_work(int(current_lead.amocrm_deal_id))
                 
-                current_lead = update_lead_from_data(current_lead.id, extracted)
-                logger.info(f"Lead #{current_lead.id} updated with: {extracted}")
-            
-            # Проверяем: нужно подтвердить телефон для нового бронирования?
-            pending_phone = context.user_data.get("pending_phone_confirm")
+                # Если статус изменился и клиент ещё не уведомлён
+                if deal_in_work and not current_lead.status_notified:
+                    status_just_changed = True
+                    mark_status_notified(current_lead.id)
+                    logger.info(f"Lead #{current_lead.id} status changed to 'in work', notifying client")
+            except Exception as e:
+                logger.error(f"Failed to check deal status: {e}")
+        
+        # Показываем индикатор "печатает..."
+        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
+        
+        # Если статус только что изменился — сначала уведомляем
+        if status_just_changed:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, 
+                text="🎉 Отличные новости! Феи праздников уже начали работу над вашим мероприятием! 🧚‍♀️✨"
+            )
+        
+        # Генерируем ответ потоком и сразу показываем его пользователю (передаём флаг deal_in_work)
+        turn = TurnResult()
+        if current_lead:
+            # Birthday: ответ и данные заявки одним вызовом
+            chunks = agent.stream_turn(
+                message=message_text,
+                history=history,
+                rag_context=rag_context,
+                lead_data=lead_data,
+                deal_in_work=deal_in_work,
+                pending_messages=get_unextracted_messages(current_lead, session.id, user_message.id),
+                summary=window.summary,
+                result=turn
+            )
+        elif cached.answer:
+            chunks = None
+        else:
+            chunks = agent.stream_response(
+                message=message_text,
+                intent=session.intent,
+                history=history,
+                rag_context=rag_context,
+                lead_data=lead_data,
+                deal_in_work=deal_in_work,
+                summary=window.summary
+            )
+        
+        if chunks is None:
+            response = cached.answer
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=response)
+        else:
+            response = await send_streamed_reply(context.bot, update.effective_chat.id, chunks)
+            answer_cache.store(cached, response)
+        
+        # Сохраняем ответ (пустой — нет: пользователь видел запасной текст, в историю он не нужен)
+        if response:
+            assistant_message = Message(session_id=session.id, role="assistant", content=response)
+            db.add(assistant_message)
+            db.commit()
+        
+        # Выпавшие из окна сообщения сворачиваем в резюме (фоном)
+        schedule_summary(session.id, window)
+        
+        # Сохраняем данные заявки, которые модель вернула вместе с ответом
+        if current_lead:
+            current_lead = apply_lead_updates(
+                current_lead, turn.lead_updates,
+                fallback_name=user.first_name,
+                message_id=user_message.id
+            )
+            if turn.lead_updates:
+                logger.info(f"Lead #{current_lead.id} updated with: {turn.lead_updates}")
             lead_data = lead_to_dict(current_lead)
             
-            # Если есть pending телефон И только что получили kids_count — спрашиваем
-            if pending_phone and extracted and extracted.get("kids_count") and not lead_data.get("phone"):
+            # Нужно подтвердить телефон для нового бронирования: спрашиваем, как только узнали kids_count
+            pending_phone = context.user_data.get("pending_phone_confirm")
+            if pending_phone and turn.lead_updates.get("kids_count") and not lead_data.get("phone"):
                 keyboard = [
                     [InlineKeyboardButton(f"✅ Да, использовать {pending_phone}", callback_data="confirm_phone_yes")],
                     [InlineKeyboardButton("📱 Указать другой номер", callback_data="confirm_phone_no")]
@@ -1645,7 +1706,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text=f"📱 Использовать этот номер телефона для бронирования?\n\n{pending_phone}",
                     reply_markup=reply_markup
                 )
-                return  # Ждём выбора
             
             # РАННЯЯ ОТПРАВКА В CRM: Как только есть телефон — создаём сделку
             
@@ -1684,102 +1744,35 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 except Exception as e:
                     logger.error(f"Failed to send to AmoCRM: {e}")
             
-            elif has_valid_phone and current_lead.amocrm_deal_id:
-                # Телефон есть, сделка уже есть — ОБНОВЛЯЕМ!
+            elif current_lead.amocrm_deal_id:
+                # Сделка уже есть — синхронизируем поля, имя контакта и переписку
                 try:
                     await amocrm_client.update_deal_fields(
                         int(current_lead.amocrm_deal_id), 
                         lead_data
                     )
-                except Exception as e:
-                    logger.error(f"Failed to update AmoCRM deal: {e}")
-            
-            # Формируем lead_data для передачи в agent (добавляем first_name для имени из профиля)
-            lead_data["first_name"] = user.first_name
-        
-        # Проверяем статус сделки в AmoCRM
-        deal_in_work = False
-        status_just_changed = False
-        
-        if current_lead and current_lead.amocrm_deal_id:
-            try:
-                deal_in_work = await amocrm_client.is_deal_in_work(int(current_lead.amocrm_deal_id))
-                
-                # Если статус изменился и клиент ещё не уведомлён
-                if deal_in_work and not current_lead.status_notified:
-                    status_just_changed = True
-                    mark_status_notified(current_lead.id)
-                    logger.info(f"Lead #{current_lead.id} status changed to 'in work', notifying client")
-            except Exception as e:
-                logger.error(f"Failed to check deal status: {e}")
-        
-        # Показываем индикатор "печатает..."
-        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
-        
-        # Если статус только что изменился — сначала уведомляем
-        if status_just_changed:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id, 
-                text="🎉 Отличные новости! Феи праздников уже начали работу над вашим мероприятием! 🧚‍♀️✨"
-            )
-        
-        # Генерируем ответ (передаём флаг deal_in_work)
-        response = agent.generate_response(
-            message=message_text,
-            intent=session.intent,
-            history=history,
-            rag_context=rag_context,
-            lead_data=lead_data,
-            deal_in_work=deal_in_work
-        )
-        
-        # Сохраняем ответ
-        assistant_message = Message(session_id=session.id, role="assistant", content=response)
-        db.add(assistant_message)
-        db.commit()
-        
-        # КРИТИЧНО: Извлекаем данные из ОТВЕТА бота и сохраняем сразу
-        # Бот часто суммаризирует данные в своем ответе (например: "Спасибо, Наталья!")
-        if current_lead and session.intent == "birthday":
-            response_data = agent.extract_lead_data(response, lead_data)
-            if response_data:
-                current_lead = update_lead_from_data(current_lead.id, response_data)
-                logger.info(f"Lead #{current_lead.id} updated from bot response: {response_data}")
-                # Обновляем lead_data для следующих итераций
-                lead_data = lead_to_dict(current_lead)
-                
-                # Синхронизируем с AmoCRM если сделка уже создана
-                if current_lead.amocrm_deal_id:
-                    try:
-                        await amocrm_client.update_deal_fields(
-                            int(current_lead.amocrm_deal_id), 
-                            lead_data
-                        )
-                        
-                        # Обновляем имя контакта если клиент указал другое имя
-                        if current_lead.amocrm_contact_id and lead_data.get("customer_name"):
-                            await amocrm_client.update_contact_name(
-                                int(current_lead.amocrm_contact_id),
-                                lead_data["customer_name"]
-                            )
-                        
-                        # Обновляем переписку в AmoCRM (добавляем новую заметку)
-                        conversation_lines = []
-                        for msg in history[-20:]:
-                            role_emoji = "👤" if msg["role"] == "user" else "🤖"
-                            conversation_lines.append(f"{role_emoji} {msg['content'][:300]}")
-                        conversation = "\n\n".join(conversation_lines)
-                        await amocrm_client.add_note(
-                            int(current_lead.amocrm_deal_id), 
-                            f"📱 Обновление переписки:\n\n{conversation}"
+                    
+                    # Обновляем имя контакта если клиент указал другое имя
+                    if current_lead.amocrm_contact_id and lead_data.get("customer_name"):
+                        await amocrm_client.update_contact_name(
+                            int(current_lead.amocrm_contact_id),
+                            lead_data["customer_name"]
                         )
-                        
-                        logger.info(f"AmoCRM deal {current_lead.amocrm_deal_id} synced with new data")
-                    except Exception as e:
-                        logger.error(f"Failed to sync AmoCRM deal: {e}")
-        
-        # Отправляем ответ пользователю (ВСЕГДА)
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=response)
+                    
+                    # Обновляем переписку в AmoCRM (добавляем новую заметку)
+                    conversation_lines = []
+                    for msg in history[-20:]:
+                        role_emoji = "👤" if msg["role"] == "user" else "🤖"
+                        conversation_lines.append(f"{role_emoji} {msg['content'][:300]}")
+                    conversation = "\n\n".join(conversation_lines)
+                    await amocrm_client.add_note(
+                        int(current_lead.amocrm_deal_id), 
+                        f"📱 Обновление переписки:\n\n{conversation}"
+                    )
+                    
+                    logger.info(f"AmoCRM deal {current_lead.amocrm_deal_id} synced with new data")
+                except Exception as e:
+                    logger.error(f"Failed to sync AmoCRM deal: {e}")
         
         # Если бот сказал про "передам менеджеру" — создаём задачу в AmoCRM и уведомляем менеджеров
         if deal_in_work and current_lead and current_lead.amocrm_deal_id:
@@ -1816,23 +1809,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if is_confirmation:
             # "Заявка принята" — отправляем картинку для красоты
             logger.info(f"Bot announced confirmation for Lead #{current_lead.id} — sending photo!")
-            
-            # Извлекаем данные из ОТВЕТА бота и обновляем
-            final_data = agent.extract_lead_data(response, lead_data)
-            current_lead = update_lead_from_data(current_lead.id, final_data)
-            
-            # Обновляем сделку в AmoCRM (если есть)
-            if current_lead.amocrm_deal_id:
-                try:
-                    await amocrm_client.update_deal_fields(
-                        int(current_lead.amocrm_deal_id), 
-                        lead_to_dict(current_lead)
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to update AmoCRM deal: {e}")
-
-        
-
         
         # Если intent всё ещё unknown — показываем кнопки
         if session.intent == "unknown":
@@ -1848,10 +1824,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
     except Exception as e:
         logger.error(f"Error handling message: {e}")
-        await update.message.reply_text(
-            "Ой, что-то пошло не так 😅\n"
-            "Попробуйте ещё раз или позвоните нам: +7 (831) 213-50-50"
-        )
+        await update.message.reply_text(FALLBACK_REPLY)
     finally:
         db.close()
 
@@ -0,0 +1,60 @@
+"""Потоковый показ ответа в Telegram: одно сообщение, которое дописывается правками."""
+
+import logging
+import time
+
+from config.settings import STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Ответ, если модель ничего не написала (тот же, что при ошибке обработки сообщения)
+FALLBACK_REPLY = (
+    "Ой, что-то пошло не так 😅\n"
+    "Попробуйте ещё раз или позвоните нам: +7 (831) 213-50-50"
+)
+
+
+async def send_streamed_reply(bot, chat_id: int, chunks) -> str:
+    """
+    Показать потоковый ответ: первое сообщение — с первым куском текста,
+    дальше редактируем его не чаще STREAM_EDIT_INTERVAL (лимиты Telegram).
+    Пустой поток — пользователь получает FALLBACK_REPLY.
+    
+    Returns:
+        Полный текст ответа ("" — модель ничего не написала, сохранять нечего)
+    """
+    text = ""
+    shown = ""
+    sent = None
+    last_edit = 0.0
+    
+    async for chunk in chunks:
+        text += chunk
+        if not text.strip():
+            continue
+        
+        now = time.monotonic()
+        if sent is None:
+            sent = await bot.send_message(chat_id=chat_id, text=text)
+            shown, last_edit = text, now
+        elif now - last_edit >= STREAM_EDIT_INTERVAL:
+            try:
+                await bot.edit_message_text(chat_id=chat_id, message_id=sent.message_id, text=text)
+                shown = text
+            except Exception as e:
+                logger.warning(f"Failed to edit streamed message: {e}")
+            last_edit = now
+    
+    if sent is None:
+        logger.warning(f"Empty streamed reply for chat {chat_id}, sending fallback")
+        await bot.send_message(chat_id=chat_id, text=FALLBACK_REPLY)
+        return ""
+    
+    # Финальная версия ответа
+    if text != shown:
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=sent.message_id, text=text)
+        except Exception as e:
+            logger.error(f"Failed to finalize streamed message: {e}")
+    
+    return text
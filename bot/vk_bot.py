@@ -8,8 +8,10 @@ from vkbottle import Keyboard, KeyboardButtonColor, Text, PhotoMessageUploader
 import re
 import aiohttp
 
-from core.agent import Agent
-from core.rag import RAGSystem
+from core.agent import agent, TurnResult
+from core.answer_cache import answer_cache
+from core.history import load_history, schedule_summary
+from core.rag import get_rag
 from core.intent_router import detect_intent
 from db.database import SessionLocal
 from db.models import Session as DBSession, Message as DBMessage, Lead
@@ -33,17 +35,12 @@ from core.notifications import (
     send_to_managers, 
     format_lead_message, 
     format_escalation_message, 
-    needs_human_escalation,
-    needs_lost_item_flow,
     format_lost_item_message,
-    needs_booking_change_request,
     get_booking_change_type,
     format_booking_change_message,
-    needs_photo_request,
-    needs_photo_order,
     format_photo_request_message,
     format_photo_order_message,
-    needs_partnership_proposal,
+    detect_flow_flags,
     format_partnership_message
 
 )
@@ -52,6 +49,8 @@ from core.lead_service import (
     update_lead_from_data,
     mark_lead_sent_to_manager,
     lead_to_dict,
+    apply_lead_updates,
+    get_unextracted_messages,
     save_amocrm_deal_id,
     mark_status_notified
 )
@@ -63,9 +62,8 @@ def create_vk_bot(token: str, group_id: int):
     """Создать и настроить VK бота."""
     bot = Bot(token=token)
     
-    # Инициализируем агента и RAG
-    agent = Agent()
-    rag = RAGSystem(park_id="nn")
+    # RAG и агент общие с Telegram-ботом (у агента свой пул соединений на каждый event loop)
+    rag = get_rag("nn")
     
     # Загрузчик фотографий
     photo_uploader = PhotoMessageUploader(bot.api)
@@ -590,6 +588,9 @@ def create_vk_bot(token: str, group_id: int):
                 return
             # -----------------------------------------------
             
+            # Триггеры всех сценариев — одним проходом по сообщению
+            flags = detect_flow_flags(message_text)
+            
             # ============ ПОТЕРЯШКИ — обработка потерянных вещей ============
             # Проверяем, находимся ли мы уже в режиме опроса
             lost_data = session.lead_data or {}
@@ -597,16 +598,7 @@ def create_vk_bot(token: str, group_id: int):
             
             if lost_step:
                 # Проверяем, не хочет ли пользователь выйти из опроса
-                exit_keywords = [
-                    "ничего не потерял", "ничего не потеряла", "ничего не теряла", "ничего не терял",
-                    "не потерял", "не потеряла", "не теряла", "не терял",
-                    "я не про это", "я о другом", "хотел спросить", "хотела спросить",
-                    "я спрашиваю", "речь не об этом", "не об этом",
-                    "отмена", "стоп", "хватит", "выход", "exit", "cancel",
-                    "можно купить", "где купить", "продаёте", "продаете",
-                ]
-                message_lower = message_text.lower()
-                if any(kw in message_lower for kw in exit_keywords):
+                if flags.lost_exit:
                     # Сбрасываем режим потеряшек
                     session.intent = "unknown"
                     session.lead_data = {}
@@ -709,7 +701,7 @@ def create_vk_bot(token: str, group_id: int):
                 session.intent = "unknown"
                 db.commit()
             
-            if needs_lost_item_flow(message_text):
+            if flags.lost_item:
                 session.intent = "lost_item"
                 session.lead_data = {"lost_step": "date"}
                 flag_modified(session, "lead_data")
@@ -723,7 +715,7 @@ def create_vk_bot(token: str, group_id: int):
             # ============ КОНЕЦ ПОТЕРЯШКИ ============
             
             # Проверяем запрос живого менеджера
-            if needs_human_escalation(message_text):
+            if flags.human_escalation:
                 # Получаем имя пользователя
                 user_info = await message.get_user()
                 user_name = f"{user_info.first_name} {user_info.last_name}" if user_info else "Неизвестный"
@@ -749,7 +741,7 @@ def create_vk_bot(token: str, group_id: int):
             
             # ============ ЗАПРОСЫ НА ИЗМЕНЕНИЕ БРОНИРОВАНИЯ ============
             # Проверяем, просит ли клиент изменить/отменить бронь текстом
-            if needs_booking_change_request(message_text):
+            if flags.booking_change:
                 user_info = await message.get_user()
                 user_name = f"{user_info.first_name} {user_info.last_name}" if user_info else "Гость"
                 change_type = get_booking_change_type(message_text)
@@ -872,7 +864,7 @@ def create_vk_bot(token: str, group_id: int):
                         return
             
             # Проверяем триггер заказа фотографа (сначала — более специфичный)
-            if needs_photo_order(message_text):
+            if flags.photo_order:
                 user_info = await message.get_user()
                 user_name = f"{user_info.first_name} {user_info.last_name}".strip() if user_info else "Гость"
                 
@@ -946,7 +938,7 @@ def create_vk_bot(token: str, group_id: int):
                 return
             
             # Проверяем триггер запроса фотографий (получение готовых фото)
-            if needs_photo_request(message_text):
+            if flags.photo_request:
                 user_info = await message.get_user()
                 user_name = f"{user_info.first_name} {user_info.last_name}".strip() if user_info else "Гость"
                 
@@ -1041,7 +1033,7 @@ def create_vk_bot(token: str, group_id: int):
                     return
             
             # Проверяем триггер предложения о сотрудничестве
-            if needs_partnership_proposal(message_text):
+            if flags.partnership:
                 session.intent = "partnership"
                 session.lead_data = {"partnership_step": "details"}
                 flag_modified(session, "lead_data")
@@ -1057,7 +1049,7 @@ def create_vk_bot(token: str, group_id: int):
             # Определяем intent
 
             current_intent = session.intent
-            intent_result = detect_intent(message_text)
+            intent_result = await detect_intent(message_text)
             
             # Логика переключения
             if current_intent == "unknown":
@@ -1069,13 +1061,15 @@ def create_vk_bot(token: str, group_id: int):
                     session.lead_data = {}
                 db.commit()
             
-            # Получаем историю
-            history = []
-            for msg in db.query(DBMessage).filter(DBMessage.session_id == session.id).order_by(DBMessage.id.desc()).limit(10).all():
-                history.insert(0, {"role": msg.role, "content": msg.content})
+            # Получаем историю (по бюджету токенов, старое — в резюме)
+            window = load_history(db, session.id, before_id=user_msg.id)
+            history = window.messages
+            
+            # Типовые вопросы (general/events) — сначала ищем готовый ответ в кеше
+            cached = await answer_cache.lookup(message_text, session.intent, history, window.summary)
             
-            # Получаем контекст из RAG
-            rag_context = rag.get_context(message_text, session.intent)
+            # Получаем контекст из RAG (при попадании в кеш он не нужен)
+            rag_context = "" if cached.answer else await rag.aget_context(message_text, session.intent)
             
             # Для birthday — сохраняем данные в Lead (надёжно в БД)
             current_lead = None
@@ -1090,27 +1084,88 @@ def create_vk_bot(token: str, group_id: int):
                 # Получаем или создаём Lead в БД
                 current_lead = get_or_create_lead(f"vk_{user_id}", source="vk", park_id="nn", first_name=vk_fname, last_name=vk_lname)
                 
-                # Извлекаем данные из ВСЕЙ истории переписки (не только последнего сообщения)
-                # Это критически важно т.к. имя, телефон, дата могут быть в разных сообщениях
-                current_lead_data = lead_to_dict(current_lead)
-                
-                # Собираем все сообщения пользователя из истории
-                user_messages = [msg["content"] for msg in history if msg["role"] == "user"][-10:]
-                full_conversation = "\n".join(user_messages)
-                
-                extracted = agent.extract_lead_data(full_conversation, current_lead_data)
+                # Данные заявки извлекаются тем же вызовом LLM, что и ответ (agent.generate_turn),
+                # и только из ещё не разобранных сообщений (водяной знак на Lead)
+                lead_data = lead_to_dict(current_lead)
                 
-                # Обновляем Lead в БД
-                if extracted:
-                    # Если имя не указано — берём из профиля VK
-                    if not extracted.get("customer_name") and vk_fname:
-                        extracted["customer_name"] = vk_fname
+                # Формируем lead_data для передачи в agent (добавляем first_name для имени из профиля)
+                lead_data["first_name"] = vk_fname
+            
+            # Проверяем статус сделки в AmoCRM
+            deal_in_work = False
+            status_just_changed = False
+            
+            if current_lead and current_lead.amocrm_deal_id:
+                try:
+                    deal_in_work = await amocrm_client.is_deal_in_work(int(current_lead.amocrm_deal_id))
                     
-                    current_lead = update_lead_from_data(current_lead.id, extracted)
-                    logger.info(f"Lead #{current_lead.id} updated with: {extracted}")
+                    # Если статус изменился и клиент ещё не уведомлён
+                    if deal_in_work and not current_lead.status_notified:
+                        status_just_changed = True
+                        mark_status_notified(current_lead.id)
+                        logger.info(f"Lead #{current_lead.id} status changed to 'in work', notifying client")
+                except Exception as e:
+                    logger.error(f"Failed to check deal status: {e}")
+            
+            # Если статус только что изменился — сначала уведомляем
+            if status_just_changed:
+                await message.answer("🎉 Отличные новости! Феи праздников уже начали работу над вашим мероприятием! 🧚‍♀️✨")
+            
+            # Генерируем ответ (передаём флаг deal_in_work)
+            turn = TurnResult()
+            if current_lead:
+                # Birthday: ответ и данные заявки одним вызовом
+                turn = await agent.generate_turn(
+                    message=message_text,
+                    history=history,
+                    rag_context=rag_context,
+                    lead_data=lead_data,
+                    deal_in_work=deal_in_work,
+                    pending_messages=get_unextracted_messages(current_lead, session.id, user_msg.id),
+                    summary=window.summary
+                )
+                response = turn.reply
+            elif cached.answer:
+                response = cached.answer
+            else:
+                response = await agent.generate_response(
+                    message=message_text,
+                    intent=session.intent,
+                    history=history,
+                    rag_context=rag_context,
+                    lead_data=lead_data,
+                    deal_in_work=deal_in_work,
+                    summary=window.summary
+                )
+                answer_cache.store(cached, response)
+            
+            # Сохраняем ответ
+            assistant_msg = DBMessage(session_id=session.id, role="assistant", content=response)
+            db.add(assistant_msg)
+            db.commit()
+            
+            # Выпавшие из окна сообщения сворачиваем в резюме (фоном)
+            schedule_summary(session.id, window)
+            
+            # Отправляем ответ (VK лимит 4096 символов)
+            if len(response) > 4000:
+                for i in range(0, len(response), 4000):
+                    await message.answer(response[i:i+4000])
+            else:
+                await message.answer(response)
+            
+            # Сохраняем данные заявки, которые модель вернула вместе с ответом
+            if current_lead:
+                current_lead = apply_lead_updates(
+                    current_lead, turn.lead_updates,
+                    fallback_name=vk_fname,
+                    message_id=user_msg.id
+                )
+                if turn.lead_updates:
+                    logger.info(f"Lead #{current_lead.id} updated with: {turn.lead_updates}")
+                lead_data = lead_to_dict(current_lead)
                 
                 # РАННЯЯ ОТПРАВКА В CRM: Как только есть телефон — создаём сделку
-                lead_data = lead_to_dict(current_lead)
                 
                 # Проверяем валидность телефона (минимум 10 цифр)
                 phone = lead_data.get("phone", "")
@@ -1163,113 +1218,33 @@ def create_vk_bot(token: str, group_id: int):
                     except Exception as e:
                         logger.error(f"Failed to send to AmoCRM: {e}")
                 
-                elif has_valid_phone and current_lead.amocrm_deal_id:
-                    # Телефон есть, сделка уже есть — ОБНОВЛЯЕМ!
+                elif current_lead.amocrm_deal_id:
+                    # Сделка уже есть — синхронизируем поля и переписку
                     try:
                         await amocrm_client.update_deal_fields(
                             int(current_lead.amocrm_deal_id), 
                             lead_data
                         )
+                        
+                        # Обновляем переписку в AmoCRM (добавляем новую заметку)
+                        conversation_lines = []
+                        for msg in history[-20:]:
+                            role_emoji = "👤" if msg["role"] == "user" else "🤖"
+                            conversation_lines.append(f"{role_emoji} {msg['content'][:300]}")
+                        conversation = "\n\n".join(conversation_lines)
+                        await amocrm_client.add_note(
+                            int(current_lead.amocrm_deal_id), 
+                            f"📱 Обновление переписки (ВК):\n\n{conversation}"
+                        )
+                        
+                        logger.info(f"AmoCRM deal {current_lead.amocrm_deal_id} synced with new VK data")
                     except Exception as e:
-                        logger.error(f"Failed to update AmoCRM deal: {e}")
-                
-                # Формируем lead_data для передачи в agent (добавляем first_name для имени из профиля)
-                lead_data["first_name"] = vk_fname
-            
-            # Проверяем статус сделки в AmoCRM
-            deal_in_work = False
-            status_just_changed = False
-            
-            if current_lead and current_lead.amocrm_deal_id:
-                try:
-                    deal_in_work = await amocrm_client.is_deal_in_work(int(current_lead.amocrm_deal_id))
-                    
-                    # Если статус изменился и клиент ещё не уведомлён
-                    if deal_in_work and not current_lead.status_notified:
-                        status_just_changed = True
-                        mark_status_notified(current_lead.id)
-                        logger.info(f"Lead #{current_lead.id} status changed to 'in work', notifying client")
-                except Exception as e:
-                    logger.error(f"Failed to check deal status: {e}")
-            
-            # Если статус только что изменился — сначала уведомляем
-            if status_just_changed:
-                await message.answer("🎉 Отличные новости! Феи праздников уже начали работу над вашим мероприятием! 🧚‍♀️✨")
-            
-            # Генерируем ответ (передаём флаг deal_in_work)
-            response = agent.generate_response(
-                message=message_text,
-                intent=session.intent,
-                history=history,
-                rag_context=rag_context,
-                lead_data=lead_data,
-                deal_in_work=deal_in_work
-            )
-            
-            # Сохраняем ответ
-            assistant_msg = DBMessage(session_id=session.id, role="assistant", content=response)
-            db.add(assistant_msg)
-            db.commit()
-            
-            # КРИТИЧНО: Извлекаем данные из ОТВЕТА бота и сохраняем сразу
-            # Бот часто суммаризирует данные в своем ответе (например: "Формат: Тематическая комната")
-            if current_lead and session.intent == "birthday":
-                response_data = agent.extract_lead_data(response, lead_data)
-                if response_data:
-                    current_lead = update_lead_from_data(current_lead.id, response_data)
-                    logger.info(f"Lead #{current_lead.id} updated from bot response: {response_data}")
-                    # Обновляем lead_data для следующих итераций
-                    lead_data = lead_to_dict(current_lead)
-                    
-                    # Синхронизируем с AmoCRM если сделка уже создана
-                    if current_lead.amocrm_deal_id:
-                        try:
-                            await amocrm_client.update_deal_fields(
-                                int(current_lead.amocrm_deal_id), 
-                                lead_data
-                            )
-                            
-                            # Обновляем переписку в AmoCRM (добавляем новую заметку)
-                            conversation_lines = []
-                            for msg in history[-20:]:
-                                role_emoji = "👤" if msg["role"] == "user" else "🤖"
-                                conversation_lines.append(f"{role_emoji} {msg['content'][:300]}")
-                            conversation = "\n\n".join(conversation_lines)
-                            await amocrm_client.add_note(
-                                int(current_lead.amocrm_deal_id), 
-                                f"📱 Обновление переписки (ВК):\n\n{conversation}"
-                            )
-                            
-                            logger.info(f"AmoCRM deal {current_lead.amocrm_deal_id} synced with new VK data")
-                        except Exception as e:
-                            logger.error(f"Failed to sync AmoCRM deal: {e}")
-            
-            # Отправляем ответ (VK лимит 4096 символов)
-            if len(response) > 4000:
-                for i in range(0, len(response), 4000):
-                    await message.answer(response[i:i+4000])
-            else:
-                await message.answer(response)
+                        logger.error(f"Failed to sync AmoCRM deal: {e}")
             
             # Проверяем, бот сообщил что заявка принята (для отправки фото)
             if current_lead and any(x in response.lower() for x in ["передана феям", "заявка принята", "передал заявку"]):
                 logger.info(f"Bot announced confirmation for Lead #{current_lead.id} — sending photo!")
                 
-                # Извлекаем данные из ОТВЕТА бота и обновляем
-                final_data = agent.extract_lead_data(response, lead_data)
-                current_lead = update_lead_from_data(current_lead.id, final_data)
-                
-                # Обновляем сделку в AmoCRM (если есть)
-                if current_lead.amocrm_deal_id:
-                    try:
-                        await amocrm_client.update_deal_fields(
-                            int(current_lead.amocrm_deal_id), 
-                            lead_to_dict(current_lead)
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to update AmoCRM deal: {e}")
-                
-                
         except Exception as e:
             logger.error(f"VK Error: {e}")
             await message.answer(
@@ -120,13 +120,93 @@ EVENTS_PROMPT = """
 Если нет инфо о дате в базе знаний — честно скажи и дай ссылку!
 """
 
-from core.utils import get_prices_from_knowledge, get_prices_text
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
 
-def get_system_prompt(intent: str) -> str:
-    """Получить системный промпт в зависимости от намерения."""
+from core.utils import parse_prices, get_knowledge_version, estimate_tokens
+
+# Как часто (сек) проверять, не изменилась ли база знаний
+PROMPT_RECHECK_INTERVAL = 5.0
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """Собранный системный промпт для intent/парка."""
+    text: str
+    tokens: int
+    version: str
+
+
+class PromptCompiler:
+    """
+    Собирает системные промпты один раз и держит их в памяти.
+    
+    Файл цен читается только при сборке. Кеш сбрасывается, когда меняется
+    версия базы знаний (mtime/размер файлов knowledge/<park_id>), а версия
+    проверяется не чаще раза в PROMPT_RECHECK_INTERVAL секунд — в обычном
+    запросе промпт берётся из памяти без обращения к диску.
+    """
+    
+    def __init__(self, recheck_interval: float = PROMPT_RECHECK_INTERVAL):
+        self.recheck_interval = recheck_interval
+        self._prompts: dict[tuple, CompiledPrompt] = {}
+        self._versions: dict[str, tuple[str, float]] = {}  # park_id -> (версия, время проверки)
+        self._lock = threading.Lock()
+    
+    def _current_version(self, park_id: str) -> str:
+        version, checked_at = self._versions.get(park_id, (None, 0.0))
+        now = time.monotonic()
+        if version is None or now - checked_at >= self.recheck_interval:
+            version = get_knowledge_version(park_id)
+            self._versions[park_id] = (version, now)
+        return version
+    
+    def knowledge_version(self, park_id: str = "nn") -> str:
+        """Версия базы знаний с той же периодичностью проверки (для кешей, зависящих от неё)."""
+        with self._lock:
+            return self._current_version(park_id)
+    
+    def get(self, intent: str, park_id: str = "nn") -> CompiledPrompt:
+        """Получить собранный промпт (пересобирается только после изменения базы знаний)."""
+        with self._lock:
+            version = self._current_version(park_id)
+            compiled = self._prompts.get((intent, park_id))
+            if compiled is None or compiled.version != version:
+                text = _build_system_prompt(intent, park_id)
+                compiled = CompiledPrompt(text=text, tokens=estimate_tokens(text), version=version)
+                self._prompts[(intent, park_id)] = compiled
+            return compiled
     
-    prices = get_prices_from_knowledge()
-    prices_text = get_prices_text()
+    def invalidate(self):
+        """Сбросить все собранные промпты (например, после переиндексации)."""
+        with self._lock:
+            self._prompts.clear()
+            self._versions.clear()
+    
+    def token_counts(self, park_id: str = "nn") -> dict:
+        """Размер промпта каждой ветки в токенах."""
+        return {
+            intent: self.get(intent, park_id).tokens
+            for intent in ("general", "birthday", "events", "unknown")
+        }
+
+
+def _read_prices_text(park_id: str) -> str:
+    """Полное содержимое файла цен (читается один раз на сборку промпта)."""
+    file_path = Path(__file__).parent.parent / "knowledge" / park_id / "general" / "prices.txt"
+    try:
+        return file_path.read_text(encoding="utf-8")
+    except OSError:
+        return ""
+
+
+def _build_system_prompt(intent: str, park_id: str = "nn") -> str:
+    """Собрать системный промпт в зависимости от намерения."""
+    
+    prices_text = _read_prices_text(park_id)
+    prices = parse_prices(prices_text)
     
     # Динамические цены
     prices_block = f"""
@@ -150,3 +230,12 @@ def get_system_prompt(intent: str) -> str:
         return base + EVENTS_PROMPT
     else:
         return base + CLARIFICATION_PROMPT
+
+
+# Глобальный компилятор промптов
+prompt_compiler = PromptCompiler()
+
+
+def get_system_prompt(intent: str, park_id: str = "nn") -> str:
+    """Получить системный промпт в зависимости от намерения."""
+    return prompt_compiler.get(intent, park_id).text
@@ -22,6 +22,99 @@ VK_GROUP_ID = os.getenv("VK_GROUP_ID", "")
 # OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Модель для дублирующего (hedged) запроса; по умолчанию та же OPENAI_MODEL
+OPENAI_FALLBACK_MODEL = os.getenv("OPENAI_FALLBACK_MODEL", "") or OPENAI_MODEL
+
+# Ограничения для LLM: сколько запросов к OpenAI одновременно и размер пула соединений
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "20"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+
+# Надёжность запросов к LLM: общий дедлайн запроса (сек, включая повторы), число повторов,
+# после скольких ошибок подряд размыкать цепь и на сколько секунд
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Дедлайн на весь потоковый ответ (сек): открытие потока ограничено LLM_TIMEOUT
+LLM_STREAM_TIMEOUT = float(os.getenv("LLM_STREAM_TIMEOUT", "90"))
+
+# Hedged-запросы: если ответ не пришёл за перцентиль LLM_HEDGE_PERCENTILE обычной задержки,
+# отправляется второй запрос (OPENAI_FALLBACK_MODEL) и берётся тот, что ответит первым.
+# Пока статистики мало — ждём LLM_HEDGE_DELAY сек; не раньше LLM_HEDGE_MIN_DELAY
+# По умолчанию включено, только если задана отдельная OPENAI_FALLBACK_MODEL
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "1" if os.getenv("OPENAI_FALLBACK_MODEL") else "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "4"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+
+# LLM-классификация намерений пачками: сколько ждать попутчиков (мс) и максимальный размер пачки
+INTENT_BATCH_ENABLED = os.getenv("INTENT_BATCH_ENABLED", "1") == "1"
+INTENT_BATCH_WINDOW_MS = int(os.getenv("INTENT_BATCH_WINDOW_MS", "30"))
+INTENT_BATCH_SIZE = int(os.getenv("INTENT_BATCH_SIZE", "16"))
+
+# Локальный классификатор намерений (scripts/train_intent_classifier.py): LLM спрашиваем,
+# только если уверенность модели ниже порога
+INTENT_MODEL_PATH = Path(os.getenv("INTENT_MODEL_PATH", str(BASE_DIR / "data" / "intent_model.npz")))
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.75"))
+
+# Индексация базы знаний: токенов на один запрос эмбеддингов и сколько запросов параллельно
+RAG_EMBED_BATCH_TOKENS = int(os.getenv("RAG_EMBED_BATCH_TOKENS", "8000"))
+RAG_EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", "4"))
+
+# Чанки базы знаний: размер в токенах, перекрытие соседних чанков одного раздела и
+# минимальный размер, до которого короткие разделы склеиваются (подобраны по scripts/bench_retrieval.py)
+RAG_CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "600"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "100"))
+RAG_CHUNK_MIN_TOKENS = int(os.getenv("RAG_CHUNK_MIN_TOKENS", "300"))
+
+# Хранилище векторов RAG: "chroma" (ChromaDB) или "numpy" (матрица в памяти, поиск перебором);
+# RAG_NUMPY_MMAP=1 — читать матрицу через memory map
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma")
+RAG_NUMPY_MMAP = os.getenv("RAG_NUMPY_MMAP", "0") == "1"
+
+# Гибридный поиск: эмбеддинги + BM25 по словам, слияние reciprocal rank fusion
+# (сколько кандидатов брать из каждого списка и константа k в 1 / (k + ранг))
+RAG_HYBRID_ENABLED = os.getenv("RAG_HYBRID_ENABLED", "1") == "1"
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "10"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Кеш контекста RAG (общий для Telegram, VK и API): размер и время жизни (сек)
+RAG_CONTEXT_CACHE_SIZE = int(os.getenv("RAG_CONTEXT_CACHE_SIZE", "500"))
+RAG_CONTEXT_CACHE_TTL = int(os.getenv("RAG_CONTEXT_CACHE_TTL", "300"))
+
+# Сборка контекста: бюджет в токенах, сколько кандидатов брать из поиска, порог расстояния
+# (0 — без порога) и допустимое отставание от лучшего чанка; обрезка до предложений со словами запроса
+RAG_CONTEXT_BUDGET_TOKENS = int(os.getenv("RAG_CONTEXT_BUDGET_TOKENS", "800"))
+RAG_CONTEXT_CANDIDATES = int(os.getenv("RAG_CONTEXT_CANDIDATES", "5"))
+RAG_CONTEXT_MAX_DISTANCE = float(os.getenv("RAG_CONTEXT_MAX_DISTANCE", "1.5"))
+RAG_CONTEXT_MAX_GAP = float(os.getenv("RAG_CONTEXT_MAX_GAP", "0.2"))
+RAG_CONTEXT_TRIM_SENTENCES = os.getenv("RAG_CONTEXT_TRIM_SENTENCES", "0") == "1"
+
+# Полная переиндексация собирает новую версию индекса и переключает на неё указатель;
+# сколько последних версий хранить (активная + предыдущая для процессов, ещё не переключившихся)
+RAG_INDEX_KEEP_VERSIONS = int(os.getenv("RAG_INDEX_KEEP_VERSIONS", "2"))
+
+# Дисковый кеш эмбеддингов (sha256 текста + модель): сколько векторов хранить (~6 КБ каждый)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", str(BASE_DIR / "data" / "embedding_cache.db")))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))
+
+# Потоковые ответы: как часто (сек) редактировать сообщение в Telegram
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Кеш ответов на типовые вопросы (general/events): порог сходства, время жизни (сек), размер
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+# Ответ сохраняется в кеш, только если история диалога не длиннее (сообщений) — иначе он может от неё зависеть
+ANSWER_CACHE_MAX_HISTORY = int(os.getenv("ANSWER_CACHE_MAX_HISTORY", "2"))
+
+# История диалога в промпте: бюджет в токенах; что не влезло — сворачивается в краткое резюме
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "40"))
+HISTORY_SUMMARY_BATCH_TOKENS = int(os.getenv("HISTORY_SUMMARY_BATCH_TOKENS", "400"))
 
 # Парк по умолчанию
 DEFAULT_PARK_ID = os.getenv("DEFAULT_PARK_ID", "nn")
@@ -2,12 +2,12 @@
 
 from core.intent_router import detect_intent, IntentResult
 from core.agent import Agent, agent
-from core.rag import RAGSystem, rag
+from core.rag import RAGSystem, rag, get_rag
 from core.lead_collector import LeadData, LeadCollector, lead_collector
 
 __all__ = [
     "detect_intent", "IntentResult",
     "Agent", "agent", 
-    "RAGSystem", "rag",
+    "RAGSystem", "rag", "get_rag",
     "LeadData", "LeadCollector", "lead_collector"
 ]
@@ -1,25 +1,267 @@
 """AI Agent — основной модуль общения с пользователем."""
 
-from openai import OpenAI
+import asyncio
+import json
+import re
+from dataclasses import dataclass, field
 
-from config.settings import OPENAI_API_KEY, OPENAI_MODEL
+from config.settings import OPENAI_MODEL, OPENAI_FALLBACK_MODEL, LLM_MAX_CONCURRENCY, LLM_HEDGE_ENABLED, EMBEDDING_MODEL
 from config.prompts import get_system_prompt
+from core.metrics import llm_metrics
+from core.llm_gateway import LLMGateway, llm_gateway
+from core.embedding_cache import embedding_cache
+from core.lead_extractor import extract_local
+
+# Завершённая markdown-ссылка [text](url)
+_LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+# Пункт списка «* текст» — звёздочка в начале строки, не разметка
+_BULLET_RE = re.compile(r'^([ \t]*)\*(?=[ \t])', re.MULTILINE)
+
+# Правила извлечения полей заявки — общие для extract_lead_data и generate_turn
+LEAD_EXTRACTION_RULES = """EXTRAS — ДОПОЛНИТЕЛЬНЫЕ УСЛУГИ (собирай ВСЁ, что клиент упоминает):
+- "аниматор" — если хочет аниматора, можно уточнить персонажа
+- "торт" — если хочет заказать торт у нас
+- "свой торт" — если принесёт свой торт
+- "шары" — украшение шарами
+- "фотограф" — если хочет фотографа
+- "аквагрим" — если хочет аквагрим
+- "меню" — если хочет предзаказ еды
+- "мастер-класс" — если хочет мастер-класс
+- "украшение комнаты" — доп. декор
+
+ВАЖНО: 
+- Не выдумывай данные! Если в сообщении нет информации — ставь null.
+- Если написано "10.30" или "10:30" — это время, запиши в time.
+- Если написано "11 февраля" или "2 марта" — это дата, запиши в event_date.
+- Если написано "7 детей" или "детей 7" — запиши kids_count: 7.
+- Если написано "опушка" — запиши room: "Опушка".
+- ФОРМАТ:
+  - "комната", "тематическая комната", "комнатка" → format: "Тематическая комната"
+  - "ресторан", "в ресторане", "зал ресторана" → format: "Ресторан"
+- EXTRAS: добавляй в массив каждую услугу, которую клиент просит или интересуется."""
+
+# Инструкция для структурированного хода (ответ + данные заявки одним вызовом)
+TURN_INSTRUCTIONS = """
+
+--- ФОРМАТ ОТВЕТА ---
+Верни JSON с двумя полями:
+- reply — твой ответ клиенту (обычный текст, как в чате);
+- lead — данные заявки, которые клиент ЯВНО сообщил в НОВОМ сообщении или которые ты подтверждаешь в ответе.
+Данные из нового сообщения уже учитывай в ответе: не переспрашивай то, что клиент только что назвал.
+Поля lead, о которых ничего нового не известно, — null (extras — пустой список).
+
+""" + LEAD_EXTRACTION_RULES
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+_NULLABLE_INT = {"type": ["integer", "null"]}
+
+LEAD_FIELDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "customer_name": _NULLABLE_STRING,
+        "child_name": _NULLABLE_STRING,
+        "child_age": _NULLABLE_INT,
+        "event_date": _NULLABLE_STRING,
+        "time": _NULLABLE_STRING,
+        "kids_count": _NULLABLE_INT,
+        "adults_count": _NULLABLE_INT,
+        "phone": _NULLABLE_STRING,
+        "room": _NULLABLE_STRING,
+        "format": _NULLABLE_STRING,
+        "extras": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": [
+        "customer_name", "child_name", "child_age", "event_date", "time",
+        "kids_count", "adults_count", "phone", "room", "format", "extras"
+    ],
+    "additionalProperties": False,
+}
+
+# reply идёт первым — его можно показывать пользователю, пока модель дописывает lead
+TURN_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "birthday_turn",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "reply": {"type": "string"},
+                "lead": LEAD_FIELDS_SCHEMA,
+            },
+            "required": ["reply", "lead"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def merge_lead_data(current_data: dict, extracted: dict) -> dict:
+    """Смержить извлечённые данные с текущими (новые непустые значения перезаписывают)."""
+    for key, value in extracted.items():
+        if value is not None and value != [] and value != "":
+            current_data[key] = value
+    return current_data
+
+
+@dataclass
+class TurnResult:
+    """Результат структурированного хода: ответ и новые данные заявки."""
+    reply: str = ""
+    lead_updates: dict = field(default_factory=dict)
+
+
+class ReplyFieldDecoder:
+    """Достаёт значение строкового поля "reply" из JSON, который модель отдаёт потоком."""
+    
+    _START_RE = re.compile(r'"reply"\s*:\s*"')
+    
+    def __init__(self):
+        self.raw = ""
+        self.pos = None
+        self.done = False
+    
+    def feed(self, chunk: str) -> str:
+        """Добавить кусок JSON, вернуть новую раскодированную часть reply."""
+        self.raw += chunk
+        if self.done:
+            return ""
+        
+        if self.pos is None:
+            match = self._START_RE.search(self.raw)
+            if not match:
+                return ""
+            self.pos = match.end()
+        
+        out = []
+        i = self.pos
+        while i < len(self.raw):
+            ch = self.raw[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            
+            # Escape-последовательность: ждём, пока придёт целиком
+            if i + 1 >= len(self.raw):
+                break
+            length = 2
+            if self.raw[i + 1] == "u":
+                length = 6
+                # Суррогатная пара (эмодзи) — две последовательности \uXXXX
+                if i + 6 <= len(self.raw) and "d800" <= self.raw[i + 2:i + 6].lower() <= "dbff":
+                    length = 12
+            if i + length > len(self.raw):
+                break
+            out.append(json.loads(f'"{self.raw[i:i + length]}"'))
+            i += length
+        
+        self.pos = i
+        return "".join(out)
+
+
+class MarkdownStreamCleaner:
+    """
+    Инкрементальная очистка markdown для потокового ответа.
+    
+    Текст копится, пока разметка не закрыта (нечётное число `*`, `` ` ``, `__`
+    или незавершённая ссылка), и отдаётся кусками по границе пробела — так
+    `**жирный**`, разрезанный между чанками, всё равно будет очищен.
+    """
+    
+    # Если разметка так и не закрылась (например "5*3"), не держим текст бесконечно
+    MAX_PENDING = 300
+    
+    def __init__(self, clean):
+        self.clean = clean
+        self.pending = ""
+    
+    @staticmethod
+    def _is_closed(text: str) -> bool:
+        """Вся ли разметка в тексте закрыта."""
+        text = _BULLET_RE.sub(r"\1", text)
+        if text.count("**") % 2 or text.replace("**", "").count("*") % 2:
+            return False
+        if text.count("__") % 2 or text.count("`") % 2:
+            return False
+        return text.count("[") == len(_LINK_RE.findall(text))
+    
+    def feed(self, chunk: str) -> str:
+        """Добавить кусок ответа модели, вернуть очищенный текст, который уже можно показать."""
+        self.pending += chunk
+        
+        for cut in range(len(self.pending), 0, -1):
+            if not self.pending[cut - 1].isspace():
+                continue
+            if self._is_closed(self.pending[:cut]) or len(self.pending) > self.MAX_PENDING:
+                ready, self.pending = self.pending[:cut], self.pending[cut:]
+                return self.clean(ready)
+        
+        return ""
+    
+    def finish(self) -> str:
+        """Отдать остаток после окончания потока."""
+        ready, self.pending = self.pending, ""
+        return self.clean(ready) if ready else ""
 
 
 class Agent:
     """AI агент для общения с пользователями."""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, client=None, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        """
+        Args:
+            client: Готовый async-клиент (для тестов и бенчмарков). По умолчанию
+                запросы идут через общий шлюз llm_gateway.
+            max_concurrency: Максимум одновременных запросов к LLM
+        """
         self.model = OPENAI_MODEL
+        if client is None and max_concurrency == LLM_MAX_CONCURRENCY:
+            self.llm = llm_gateway
+        else:
+            self.llm = LLMGateway(client=client, max_concurrency=max_concurrency)
+    
+    async def embed(self, text: str) -> list[float]:
+        """Эмбеддинг текста (та же модель и тот же дисковый кеш, что и в RAG)."""
+        if embedding_cache is None:
+            return await self.llm.embed(text)
+        # SQLite — в потоке: ожидание блокировки или записи на диск не держит event loop
+        cached = (await asyncio.to_thread(embedding_cache.get_many, [text], EMBEDDING_MODEL))[0]
+        if cached is not None:
+            return cached.tolist()
+        embedding = await self.llm.embed(text)
+        await asyncio.to_thread(embedding_cache.put_many, [text], [embedding], EMBEDDING_MODEL)
+        return embedding
     
-    def generate_response(
+    async def _chat(self, operation: str, hedge_key: str, **request):
+        """Запрос к LLM; при LLM_HEDGE_ENABLED медленный дублируется на OPENAI_FALLBACK_MODEL."""
+        if LLM_HEDGE_ENABLED:
+            return await self.llm.hedged_chat(
+                operation, hedge_key=hedge_key, fallback_model=OPENAI_FALLBACK_MODEL, **request
+            )
+        return await self.llm.chat(operation, **request)
+    
+    def _stream(self, operation: str, hedge_key: str, **request):
+        """Поток от LLM; при LLM_HEDGE_ENABLED дублируется открытие, если первый кусок запаздывает."""
+        if LLM_HEDGE_ENABLED:
+            return self.llm.hedged_stream(
+                operation, hedge_key=hedge_key, fallback_model=OPENAI_FALLBACK_MODEL, **request
+            )
+        return self.llm.stream(operation, **request)
+    
+    async def generate_response(
         self,
         message: str,
         intent: str,
         history: list[dict] = None,
         rag_context: str = None,
-        lead_data: dict = None
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        summary: str = None
     ) -> str:
         """
         Сгенерировать ответ на сообщение пользователя.
@@ -30,52 +272,306 @@ class Agent:
             history: История сообщений
             rag_context: Контекст из базы знаний (RAG)
             lead_data: Уже собранные данные лида
+            deal_in_work: Сделка уже в работе у менеджера
+            summary: Краткое резюме старой части диалога
         
         Returns:
             Ответ бота
         """
-        # Формируем системный промпт
-        system_prompt = get_system_prompt(intent)
+        messages = self._build_messages(message, intent, history, rag_context, lead_data, deal_in_work, summary=summary)
+        
+        # Генерируем ответ (медленный запрос дублируется на fallback-модель)
+        response = await self._chat(
+            "response", intent, model=self.model, messages=messages, max_tokens=500, temperature=0.7
+        )
+        
+        text = response.choices[0].message.content
+        
+        # Убираем markdown форматирование для Telegram
+        text = self._clean_markdown(text)
+        
+        return text
+    
+    async def stream_response(
+        self,
+        message: str,
+        intent: str,
+        history: list[dict] = None,
+        rag_context: str = None,
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        summary: str = None
+    ):
+        """
+        Сгенерировать ответ потоком (аргументы как у generate_response).
+        
+        Yields:
+            Очищенные от markdown куски ответа — их конкатенация и есть ответ бота
+        """
+        messages = self._build_messages(message, intent, history, rag_context, lead_data, deal_in_work, summary=summary)
+        cleaner = MarkdownStreamCleaner(self._clean_markdown)
+        
+        async for delta in self._stream(
+            "stream",
+            f"{intent}_stream",
+            model=self.model,
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7
+        ):
+            text = cleaner.feed(delta)
+            if text:
+                yield text
+        
+        text = cleaner.finish()
+        if text:
+            yield text
+    
+    async def generate_turn(
+        self,
+        message: str,
+        history: list[dict] = None,
+        rag_context: str = None,
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        pending_messages: list[str] = None,
+        summary: str = None
+    ) -> TurnResult:
+        """
+        Ход birthday-диалога одним вызовом LLM: ответ клиенту + новые данные заявки.
+        
+        Заменяет связку extract_lead_data → generate_response → extract_lead_data.
+        Если сообщение целиком разобрано локально (дата, телефон, "да"...),
+        данные берутся из lead_extractor, а LLM пишет только ответ.
+        """
+        local = extract_local(message)
+        if not local.unresolved and not pending_messages:
+            llm_metrics.record("extract_local", None)
+            lead_data = merge_lead_data(dict(lead_data or {}), local.fields)
+            reply = await self.generate_response(
+                message, "birthday", history, rag_context, lead_data, deal_in_work, summary
+            )
+            return TurnResult(reply=reply, lead_updates=local.fields)
+        
+        # Однозначные поля (телефон, дата…) — в состояние заявки уже в промпте, а не только после ответа
+        lead_data = merge_lead_data(dict(lead_data or {}), local.strict_fields)
+        messages = self._build_turn_messages(message, history, rag_context, lead_data, deal_in_work, pending_messages, summary)
+        
+        response = await self._chat(
+            "turn",
+            "turn",
+            model=self.model,
+            messages=messages,
+            max_tokens=700,
+            temperature=0.7,
+            response_format=TURN_RESPONSE_FORMAT
+        )
+        
+        result = self._parse_turn(response.choices[0].message.content)
+        # Однозначные поля из регулярок дополняют то, что LLM не вернул
+        result.lead_updates = {**local.strict_fields, **result.lead_updates}
+        return result
+    
+    async def stream_turn(
+        self,
+        message: str,
+        history: list[dict] = None,
+        rag_context: str = None,
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        pending_messages: list[str] = None,
+        summary: str = None,
+        result: TurnResult = None
+    ):
+        """
+        Потоковый вариант generate_turn.
+        
+        Yields:
+            Очищенные куски ответа клиенту. После окончания итерации
+            result.reply и result.lead_updates заполнены.
+        """
+        if result is None:
+            result = TurnResult()
+        
+        local = extract_local(message)
+        if not local.unresolved and not pending_messages:
+            # Данные разобраны локально — LLM нужен только для ответа
+            llm_metrics.record("extract_local", None)
+            lead_data = merge_lead_data(dict(lead_data or {}), local.fields)
+            async for text in self.stream_response(
+                message, "birthday", history, rag_context, lead_data, deal_in_work, summary
+            ):
+                result.reply += text
+                yield text
+            result.lead_updates = local.fields
+            return
+        
+        # Однозначные поля (телефон, дата…) — в состояние заявки уже в промпте, а не только после ответа
+        lead_data = merge_lead_data(dict(lead_data or {}), local.strict_fields)
+        messages = self._build_turn_messages(message, history, rag_context, lead_data, deal_in_work, pending_messages, summary)
+        decoder = ReplyFieldDecoder()
+        cleaner = MarkdownStreamCleaner(self._clean_markdown)
+        streamed = ""
+        
+        async for delta in self._stream(
+            "stream_turn",
+            "turn_stream",
+            model=self.model,
+            messages=messages,
+            max_tokens=700,
+            temperature=0.7,
+            response_format=TURN_RESPONSE_FORMAT
+        ):
+            text = cleaner.feed(decoder.feed(delta))
+            if text:
+                streamed += text
+                yield text
+        
+        text = cleaner.finish()
+        if text:
+            streamed += text
+            yield text
+        
+        parsed = self._parse_turn(decoder.raw)
+        result.lead_updates = {**local.strict_fields, **parsed.lead_updates}
+        # Показанный пользователю текст и есть ответ
+        result.reply = streamed if decoder.pos is not None else parsed.reply
+        if not streamed and result.reply:
+            yield result.reply
+    
+    def _build_turn_messages(
+        self,
+        message: str,
+        history: list[dict] = None,
+        rag_context: str = None,
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        pending_messages: list[str] = None,
+        summary: str = None
+    ) -> list[dict]:
+        """
+        Сообщения для структурированного хода birthday-ветки.
+        
+        Уже сохранённые поля приходят в lead_data, поэтому извлекать нужно
+        только из нового сообщения (и pending_messages — ещё не разобранных
+        предыдущих), а не из всей переписки.
+        """
+        return self._build_messages(
+            message, "birthday", history, rag_context, lead_data, deal_in_work,
+            instructions=TURN_INSTRUCTIONS,
+            pending_messages=pending_messages,
+            summary=summary
+        )
+    
+    def _parse_turn(self, content: str) -> TurnResult:
+        """Разобрать JSON структурированного хода."""
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError) as e:
+            # Модель не вернула JSON — показываем текст как есть, данные не трогаем
+            print(f"Turn parse error: {e}")
+            return TurnResult(reply=self._clean_markdown(content or ""))
+        
+        return TurnResult(
+            reply=self._clean_markdown(data.get("reply") or ""),
+            lead_updates=merge_lead_data({}, data.get("lead") or {})
+        )
+    
+    def _build_messages(
+        self,
+        message: str,
+        intent: str,
+        history: list[dict] = None,
+        rag_context: str = None,
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        instructions: str = "",
+        pending_messages: list[str] = None,
+        summary: str = None
+    ) -> list[dict]:
+        """
+        Собрать сообщения для LLM.
+        
+        Порядок рассчитан на кеширование префикса у провайдера:
+        статичный системный промпт (побайтово одинаковый для intent) →
+        история → контекст хода (резюме, RAG, заявка, статус сделки) → сообщение.
+        Всё, что меняется от хода к ходу, идёт после истории.
+        
+        История уже обрезана по бюджету токенов (core.history.load_history).
+        """
+        # Статичная часть: собранный промпт ветки + инструкции формата ответа
+        messages = [{"role": "system", "content": get_system_prompt(intent) + instructions}]
+        
+        # Добавляем историю
+        if history:
+            for msg in history:
+                messages.append({"role": msg["role"], "content": msg["content"]})
+        
+        # Динамическая часть — отдельным системным сообщением перед вопросом
+        context = self._build_context(intent, rag_context, lead_data, deal_in_work, pending_messages, summary)
+        if context:
+            messages.append({"role": "system", "content": context})
+        
+        # Добавляем текущее сообщение
+        messages.append({"role": "user", "content": message})
+        
+        return messages
+    
+    def _build_context(
+        self,
+        intent: str,
+        rag_context: str = None,
+        lead_data: dict = None,
+        deal_in_work: bool = False,
+        pending_messages: list[str] = None,
+        summary: str = None
+    ) -> str:
+        """Контекст текущего хода: резюме диалога, база знаний, состояние заявки, статус сделки."""
+        context = ""
+        
+        # Резюме старой части диалога (сами сообщения в историю уже не влезают)
+        if summary:
+            context += f"\n\n--- РАНЕЕ В ДИАЛОГЕ (кратко) ---\n{summary}\n---"
         
         # Добавляем контекст из базы знаний
         if rag_context:
-            system_prompt += f"\n\n--- ИНФОРМАЦИЯ ИЗ БАЗЫ ЗНАНИЙ ---\n{rag_context}\n---"
+            context += f"\n\n--- ИНФОРМАЦИЯ ИЗ БАЗЫ ЗНАНИЙ ---\n{rag_context}\n---"
         
         # Добавляем контекст собранного лида (для birthday ветки)
         if intent == "birthday" and lead_data:
             # НОВАЯ ЛОГИКА: Показываем структурированные данные как ИСТОЧНИК ИСТИНЫ
-            system_prompt += "\n\n" + "="*50
-            system_prompt += "\n📋 ТЕКУЩЕЕ СОСТОЯНИЕ ЗАЯВКИ (ИСТОЧНИК ИСТИНЫ)"
-            system_prompt += "\n" + "="*50
-            system_prompt += "\n\nИСПОЛЬЗУЙ ЭТИ ДАННЫЕ при подтверждении! НЕ ФАНТАЗИРУЙ!\n"
+            context += "\n\n" + "="*50
+            context += "\n📋 ТЕКУЩЕЕ СОСТОЯНИЕ ЗАЯВКИ (ИСТОЧНИК ИСТИНЫ)"
+            context += "\n" + "="*50
+            context += "\n\nИСПОЛЬЗУЙ ЭТИ ДАННЫЕ при подтверждении! НЕ ФАНТАЗИРУЙ!\n"
             
             # Основные данные
-            system_prompt += f"\n👤 Имя для связи: {lead_data.get('customer_name') or '❌ НЕ УКАЗАНО'}"
-            system_prompt += f"\n📞 Телефон: {lead_data.get('phone') or '❌ НЕ УКАЗАН'}"
-            system_prompt += f"\n📅 Дата праздника: {lead_data.get('event_date') or '❌ НЕ УКАЗАНА'}"
-            system_prompt += f"\n⏰ Время: {lead_data.get('time') or '❌ НЕ УКАЗАНО'}"
+            context += f"\n👤 Имя для связи: {lead_data.get('customer_name') or '❌ НЕ УКАЗАНО'}"
+            context += f"\n📞 Телефон: {lead_data.get('phone') or '❌ НЕ УКАЗАН'}"
+            context += f"\n📅 Дата праздника: {lead_data.get('event_date') or '❌ НЕ УКАЗАНА'}"
+            context += f"\n⏰ Время: {lead_data.get('time') or '❌ НЕ УКАЗАНО'}"
             
             # Гости
             kids = lead_data.get('kids_count')
             adults = lead_data.get('adults_count')
-            system_prompt += f"\n👶 Детей: {kids if kids else '❌ НЕ УКАЗАНО'}"
-            system_prompt += f"\n👨 Взрослых: {adults if adults else '❌ НЕ УКАЗАНО'}"
+            context += f"\n👶 Детей: {kids if kids else '❌ НЕ УКАЗАНО'}"
+            context += f"\n👨 Взрослых: {adults if adults else '❌ НЕ УКАЗАНО'}"
             
             # Именинник (опционально)
             child_name = lead_data.get('child_name')
             child_age = lead_data.get('child_age')
             if child_name:
-                system_prompt += f"\n🎂 Именинник: {child_name}"
+                context += f"\n🎂 Именинник: {child_name}"
                 if child_age:
-                    system_prompt += f", {child_age} лет"
+                    context += f", {child_age} лет"
             
             # Комната и формат
             room = lead_data.get('room')
             format_type = lead_data.get('format')
             if room:
-                system_prompt += f"\n🏠 Комната: {room}"
+                context += f"\n🏠 Комната: {room}"
             if format_type:
-                system_prompt += f"\n🎪 Формат: {format_type}"
+                context += f"\n🎪 Формат: {format_type}"
             
             # Доп услуги
             extras = lead_data.get('extras', [])
@@ -85,11 +581,11 @@ class Agent:
                     if isinstance(extras, str):
                         extras = json.loads(extras)
                     if extras:
-                        system_prompt += f"\n✨ Дополнительно: {', '.join(extras)}"
+                        context += f"\n✨ Дополнительно: {', '.join(extras)}"
                 except:
                     pass
             
-            system_prompt += "\n" + "="*50
+            context += "\n" + "="*50
             
             # Определяем что ещё нужно собрать
             missing = []
@@ -107,42 +603,27 @@ class Agent:
             if missing:
                 # Указываем СЛЕДУЮЩИЙ КОНКРЕТНЫЙ вопрос
                 next_question = missing[0]
-                system_prompt += f"\n\n🔴 СЛЕДУЮЩИЙ ВОПРОС, КОТОРЫЙ ТЫ ОБЯЗАН ЗАДАТЬ:\n→ {next_question}\n"
-                system_prompt += f"\nЕЩЁ НУЖНО УЗНАТЬ: {', '.join(missing[1:]) if len(missing) > 1 else 'ничего'}"
-                system_prompt += "\n\nНЕ ОТВЛЕКАЙСЯ на акции и каталоги пока не соберёшь ВСЕ данные!"
+                context += f"\n\n🔴 СЛЕДУЮЩИЙ ВОПРОС, КОТОРЫЙ ТЫ ОБЯЗАН ЗАДАТЬ:\n→ {next_question}\n"
+                context += f"\nЕЩЁ НУЖНО УЗНАТЬ: {', '.join(missing[1:]) if len(missing) > 1 else 'ничего'}"
+                context += "\n\nНЕ ОТВЛЕКАЙСЯ на акции и каталоги пока не соберёшь ВСЕ данные!"
             else:
-                system_prompt += "\n\n✅ ВСЕ ОБЯЗАТЕЛЬНЫЕ ДАННЫЕ СОБРАНЫ!"
-                system_prompt += "\n\n📝 ТВОЯ ЗАДАЧА:"
-                system_prompt += "\n1. Сформируй красивое подтверждение ИСПОЛЬЗУЯ данные выше"
-                system_prompt += "\n2. Укажи точную стоимость (рассчитай по ценам из базы знаний)"
-                system_prompt += "\n3. Спроси: 'Всё верно? Могу ли я передать заявку на бронирование?'"
-                system_prompt += "\n\n⚠️ КРИТИЧНО: Используй ТОЛЬКО данные из таблицы выше, не придумывай!"
-        
-        # Формируем сообщения
-        messages = [{"role": "system", "content": system_prompt}]
+                context += "\n\n✅ ВСЕ ОБЯЗАТЕЛЬНЫЕ ДАННЫЕ СОБРАНЫ!"
+                context += "\n\n📝 ТВОЯ ЗАДАЧА:"
+                context += "\n1. Сформируй красивое подтверждение ИСПОЛЬЗУЯ данные выше"
+                context += "\n2. Укажи точную стоимость (рассчитай по ценам из базы знаний)"
+                context += "\n3. Спроси: 'Всё верно? Могу ли я передать заявку на бронирование?'"
+                context += "\n\n⚠️ КРИТИЧНО: Используй ТОЛЬКО данные из таблицы выше, не придумывай!"
         
-        # Добавляем историю (последние 10 сообщений)
-        if history:
-            for msg in history[-10:]:
-                messages.append({"role": msg["role"], "content": msg["content"]})
+        # Сделка уже в работе — изменения только через менеджера
+        if deal_in_work:
+            context += "\n\n⚠️ ЗАЯВКА УЖЕ В РАБОТЕ У МЕНЕДЖЕРА!"
+            context += "\nЕсли клиент просит что-то изменить — не меняй сам, скажи: 'Передам менеджеру, вам перезвонят!'"
         
-        # Добавляем текущее сообщение
-        messages.append({"role": "user", "content": message})
+        if pending_messages:
+            pending = "\n".join(f"- {text}" for text in pending_messages)
+            context += f"\n\nЕЩЁ НЕ РАЗОБРАННЫЕ СООБЩЕНИЯ КЛИЕНТА (их данные тоже верни в lead):\n{pending}"
         
-        # Генерируем ответ
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        text = response.choices[0].message.content
-        
-        # Убираем markdown форматирование для Telegram
-        text = self._clean_markdown(text)
-        
-        return text
+        return context.strip()
     
     def _clean_markdown(self, text: str) -> str:
         """Убираем markdown форматирование, которое не работает в Telegram."""
@@ -152,6 +633,9 @@ class Agent:
         text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
         text = re.sub(r'__(.+?)__', r'\1', text)
         
+        # Пункты «* текст» — в «- текст», чтобы их звёздочки не приняли за курсив
+        text = _BULLET_RE.sub(r'\1-', text)
+        
         # Убираем курсив *text* и _text_ (осторожно, не ломаем смайлики)
         text = re.sub(r'(?<!\*)\*([^*]+)\*(?!\*)', r'\1', text)
         
@@ -163,7 +647,44 @@ class Agent:
         
         return text
     
-    def extract_lead_data(self, message: str, current_data: dict = None) -> dict:
+    async def summarize_history(self, summary: str, messages: list[dict]) -> str:
+        """
+        Дополнить резюме диалога сообщениями, которые выпали из истории промпта.
+        
+        Returns:
+            Новое резюме (или пустая строка при ошибке)
+        """
+        lines = []
+        for msg in messages:
+            role = "Клиент" if msg["role"] == "user" else "Бот"
+            lines.append(f"{role}: {msg['content']}")
+        
+        prompt = f"""Ты ведёшь краткое резюме переписки бота парка "Джунгли Сити" с клиентом.
+
+Текущее резюме:
+{summary or "(пока пусто)"}
+
+Новые сообщения:
+{chr(10).join(lines)}
+
+Обнови резюме: что спрашивал клиент, что ему ответили, о чём договорились,
+какие данные он сообщил. Не больше 8 коротких пунктов, без приветствий и эмодзи.
+Ответь только текстом резюме."""
+
+        try:
+            response = await self.llm.chat(
+                "summary",
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=300,
+                temperature=0
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"History summary error: {e}")
+            return ""
+    
+    async def extract_lead_data(self, message: str, current_data: dict = None) -> dict:
         """
         Извлечь данные лида из сообщения пользователя.
         
@@ -173,6 +694,12 @@ class Agent:
         if current_data is None:
             current_data = {}
         
+        # Сначала — локальный разбор; LLM только если в сообщении осталось неразобранное
+        local = extract_local(message)
+        if not local.unresolved:
+            llm_metrics.record("extract_local", None)
+            return merge_lead_data(current_data, local.fields)
+        
         prompt = f"""Извлеки информацию о бронировании праздника из сообщения.
 
 Сообщение: "{message}"
@@ -195,38 +722,18 @@ class Agent:
     "extras": ["список услуг, которые клиент хочет заказать"]
 }}
 
-EXTRAS — ДОПОЛНИТЕЛЬНЫЕ УСЛУГИ (собирай ВСЁ, что клиент упоминает):
-- "аниматор" — если хочет аниматора, можно уточнить персонажа
-- "торт" — если хочет заказать торт у нас
-- "свой торт" — если принесёт свой торт
-- "шары" — украшение шарами
-- "фотограф" — если хочет фотографа
-- "аквагрим" — если хочет аквагрим
-- "меню" — если хочет предзаказ еды
-- "мастер-класс" — если хочет мастер-класс
-- "украшение комнаты" — доп. декор
-
-ВАЖНО: 
-- Не выдумывай данные! Если в сообщении нет информации — ставь null.
-- Если написано "10.30" или "10:30" — это время, запиши в time.
-- Если написано "11 февраля" или "2 марта" — это дата, запиши в event_date.
-- Если написано "7 детей" или "детей 7" — запиши kids_count: 7.
-- Если написано "опушка" — запиши room: "Опушка".
-- ФОРМАТ:
-  - "комната", "тематическая комната", "комнатка" → format: "Тематическая комната"
-  - "ресторан", "в ресторане", "зал ресторана" → format: "Ресторан"
-- EXTRAS: добавляй в массив каждую услугу, которую клиент просит или интересуется.
+{LEAD_EXTRACTION_RULES}
 Ответь ТОЛЬКО JSON, без пояснений."""
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.llm.chat(
+                "extract",
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=200,
                 temperature=0
             )
             
-            import json
             result = response.choices[0].message.content.strip()
             # Убираем markdown если есть
             if result.startswith("```"):
@@ -237,11 +744,8 @@ EXTRAS — ДОПОЛНИТЕЛЬНЫЕ УСЛУГИ (собирай ВСЁ, ч
             extracted = json.loads(result)
             
             # Мержим с текущими данными (новые перезаписывают)
-            for key, value in extracted.items():
-                if value is not None and value != [] and value != "":
-                    current_data[key] = value
-            
-            return current_data
+            merge_lead_data(current_data, local.strict_fields)
+            return merge_lead_data(current_data, extracted)
             
         except Exception as e:
             print(f"Lead extraction error: {e}")
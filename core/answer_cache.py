@@ -0,0 +1,120 @@
+"""
+Кеш готовых ответов на типовые вопросы (цены, часы работы, носки, адрес).
+
+Ключ — эмбеддинг вопроса + intent + парк + версия базы знаний: после правки
+файлов knowledge/ или промптов старые ответы перестают находиться сами.
+Версия берётся у prompt_compiler (проверка диска не чаще раза в несколько
+секунд), а не обходом knowledge/ на каждое сообщение.
+Birthday-ходы зависят от истории и заявки — для них кеш не используется.
+Ответ сохраняется, только если он не зависит от собеседника: диалог только
+начался (история не длиннее ANSWER_CACHE_MAX_HISTORY) и в вопросе и ответе
+нет личных данных (телефона, почты, имени).
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from config.settings import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_MAX_HISTORY,
+)
+from core.agent import agent
+from config.prompts import prompt_compiler
+from core.cache import SemanticCache
+from core.lead_extractor import COMMON_NAMES, extract_local
+
+logger = logging.getLogger(__name__)
+
+# Для каких intent ответ не зависит от истории диалога
+CACHEABLE_INTENTS = {"general", "events"}
+
+# Уточнения к предыдущему сообщению ("а для взрослых?", "и сколько это?") — не кешируем
+_FOLLOW_UP_RE = re.compile(r"^(а|и|но|тогда|это|там|так|ещё|еще|тоже)\b", re.IGNORECASE)
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_CAPITALIZED_RE = re.compile(r"\b[А-ЯЁ][а-яё]+\b")
+
+
+@dataclass
+class AnswerLookup:
+    """Результат поиска в кеше; передаётся обратно в store() после генерации."""
+    answer: Optional[str] = None
+    embedding: Optional[list] = None
+    namespace: Optional[tuple] = None
+    storable: bool = False  # можно ли сохранить ответ для других пользователей
+
+
+def is_cacheable(message: str, intent: str) -> bool:
+    """Можно ли отвечать на сообщение из кеша."""
+    if not ANSWER_CACHE_ENABLED or intent not in CACHEABLE_INTENTS:
+        return False
+    text = message.strip()
+    return len(text) >= 5 and not _FOLLOW_UP_RE.match(text)
+
+
+def has_personal_data(message: str) -> bool:
+    """Есть ли в вопросе телефон, почта или имя собеседника."""
+    fields = extract_local(message).fields
+    return "phone" in fields or "customer_name" in fields or bool(_EMAIL_RE.search(message)) or mentions_name(message)
+
+
+def mentions_name(text: str) -> bool:
+    """Есть ли в тексте имя с заглавной («Анна, у нас…»)."""
+    return any(word.lower() in COMMON_NAMES for word in _CAPITALIZED_RE.findall(text))
+
+
+class AnswerCache:
+    """Семантический кеш ответов агента."""
+
+    def __init__(self, embed=None, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL, maxsize: int = ANSWER_CACHE_SIZE):
+        self._embed = embed or agent.embed
+        self.cache = SemanticCache(maxsize=maxsize, ttl=ttl, threshold=threshold)
+
+    async def lookup(self, message: str, intent: str, history: list[dict] = None,
+                     summary: str = None, park_id: str = "nn") -> AnswerLookup:
+        """
+        Найти готовый ответ. Ошибка эмбеддинга — просто промах.
+
+        Args:
+            history: Окно истории, с которым будет сгенерирован ответ
+            summary: Резюме старой части диалога (есть — диалог уже длинный)
+        """
+        if not is_cacheable(message, intent):
+            return AnswerLookup()
+
+        namespace = (intent, park_id, prompt_compiler.knowledge_version(park_id))
+        try:
+            # Тот же текст, что эмбеддит RAG при поиске, — при промахе кеша второй запрос к API не нужен
+            embedding = await self._embed(message)
+        except Exception as e:
+            logger.error(f"Answer cache embedding error: {e}")
+            return AnswerLookup()
+
+        answer = self.cache.get(embedding, namespace)
+        if answer:
+            logger.info(f"Answer cache hit ({intent}): {message[:50]}")
+        # Ответ с учётом истории или личных данных другим пользователям не отдаём
+        storable = not summary and len(history or []) <= ANSWER_CACHE_MAX_HISTORY and not has_personal_data(message)
+        return AnswerLookup(answer=answer, embedding=embedding, namespace=namespace, storable=storable)
+
+    def store(self, lookup: AnswerLookup, answer: str):
+        """Сохранить сгенерированный ответ (если вопрос и ответ подходят для кеша)."""
+        if lookup.embedding is None or lookup.answer or not answer or not lookup.storable:
+            return
+        # Ответ, обращённый к собеседнику по имени, — только ему
+        if mentions_name(answer):
+            return
+        self.cache.set(lookup.embedding, lookup.namespace, answer)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+# Глобальный кеш ответов
+answer_cache = AnswerCache()
@@ -0,0 +1,144 @@
+"""Кеши в памяти процесса: TTL + LRU и семантический (по эмбеддингам)."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+
+class TTLCache:
+    """
+    Словарь с ограничением размера (LRU) и временем жизни записей.
+
+    Потокобезопасен: VK-бот работает в своём потоке со своим event loop.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Получить значение (просроченные записи удаляются)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Положить значение, при переполнении вытесняется самая старая запись."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов и вытеснений по размеру."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class SemanticCache:
+    """
+    Кеш по смыслу: ищет ранее сохранённый запрос с косинусным сходством >= threshold.
+
+    Записи разбиты по пространствам имён (например, intent + версия базы знаний),
+    поиск идёт только внутри своего пространства. Вытеснение — LRU + TTL.
+    """
+
+    def __init__(self, maxsize: int = 500, ttl: float = 3600, threshold: float = 0.92):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # id -> (namespace, вектор, значение, expires_at)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, namespace) -> Optional[Any]:
+        """Найти значение для похожего запроса в пространстве namespace."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            # Сначала выбрасываем просроченные записи
+            expired = [key for key, entry in self._entries.items() if entry[3] <= now]
+            for key in expired:
+                del self._entries[key]
+
+            keys = [key for key, entry in self._entries.items() if entry[0] == namespace]
+            if keys:
+                matrix = np.stack([self._entries[key][1] for key in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][2]
+
+            self.misses += 1
+            return None
+
+    def set(self, embedding, namespace, value):
+        """Сохранить значение для запроса."""
+        with self._lock:
+            self._entries[self._next_id] = (
+                namespace, self._normalize(embedding), value, time.monotonic() + self.ttl
+            )
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
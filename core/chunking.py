@@ -0,0 +1,166 @@
+"""
+Разбиение файлов базы знаний на чанки с учётом структуры.
+
+Файлы knowledge/<park>/*.txt устроены одинаково: первая строка — название,
+разделы отделены строкой «---», внутри — заголовки («ЦЕНЫ НА ВХОД:»)
+и списки («- …», «1. …»). Абзац (вместе со своим заголовком и списком)
+не разрывается; чанки набираются из абзацев до лимита в токенах, соседние
+чанки одного раздела перекрываются последними абзацами. Короткие разделы
+склеиваются со следующими, пока чанк не наберёт min_tokens: в базе знаний
+много разделов по 50–100 токенов, и чанк из одного такого раздела хуже
+находится по эмбеддингу. Каждый чанк начинается с названия документа и
+заголовка раздела, заголовки склеенных разделов остаются в тексте —
+чанк сам по себе понятен и для поиска, и для LLM.
+"""
+
+import re
+import statistics
+from dataclasses import dataclass
+
+from config.settings import RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP, RAG_CHUNK_MIN_TOKENS
+from core.utils import estimate_tokens
+
+_SECTION_RE = re.compile(r"^\s*-{3,}\s*$", re.MULTILINE)
+_BLANK_RE = re.compile(r"\n\s*\n")
+_LIST_ITEM_RE = re.compile(r"^\s*(?:[-•*]|\d+[.)])\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class Block:
+    """Неразрывный кусок текста: абзац (или его часть) внутри раздела."""
+    text: str
+    heading: str
+    section: int
+    tokens: int
+
+
+def is_heading(line: str) -> bool:
+    """Заголовок: строка капсом, заканчивающаяся двоеточием («ДОПОЛНИТЕЛЬНЫЕ АКТИВНОСТИ:»)."""
+    line = line.strip()
+    if not line or len(line) > 120 or _LIST_ITEM_RE.match(line):
+        return False
+    letters = [ch for ch in line.split("(")[0] if ch.isalpha()]
+    return line.endswith(":") and len(letters) >= 3 and all(ch.isupper() for ch in letters)
+
+
+def _split_oversized(text: str, max_tokens: int) -> list[str]:
+    """Абзац больше лимита: по строкам (пунктам списка), затем по предложениям, затем по словам."""
+    for separator, parts in (("\n", text.split("\n")), (" ", _SENTENCE_RE.split(text)), (" ", text.split())):
+        if len(parts) < 2:
+            continue
+        pieces, current = [], ""
+        for part in parts:
+            candidate = f"{current}{separator}{part}" if current else part
+            if current and estimate_tokens(candidate) > max_tokens:
+                pieces.append(current)
+                current = part
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+        if all(estimate_tokens(piece) <= max_tokens for piece in pieces):
+            return pieces
+        # Слишком длинные куски режем дальше
+        result = []
+        for piece in pieces:
+            result += [piece] if estimate_tokens(piece) <= max_tokens else _split_oversized(piece, max_tokens)
+        return result
+    return [text]
+
+
+def parse_blocks(text: str, max_tokens: int) -> tuple[str, list[Block]]:
+    """Название документа и его абзацы с заголовками разделов."""
+    text = text.replace("\r\n", "\n").strip()
+    lines = text.split("\n", 1)
+    title = ""
+    if len(lines) == 2 and len(lines[0]) <= 120 and not _LIST_ITEM_RE.match(lines[0]):
+        title, text = lines[0].strip(), lines[1]
+
+    blocks = []
+    for section_index, section in enumerate(_SECTION_RE.split(text)):
+        heading = ""
+        for paragraph in _BLANK_RE.split(section):
+            paragraph = paragraph.strip("\n").rstrip()
+            if not paragraph.strip():
+                continue
+            first_line = paragraph.lstrip().split("\n", 1)[0]
+            if is_heading(first_line):
+                heading = first_line.strip()
+                # Заголовок отдельным абзацем — будет в шапке следующих чанков
+                if paragraph.strip() == heading:
+                    continue
+            for piece in _split_oversized(paragraph, max_tokens):
+                blocks.append(Block(piece, heading, section_index, estimate_tokens(piece)))
+    return title, blocks
+
+
+def chunk_text(text: str, max_tokens: int = RAG_CHUNK_TOKENS, overlap_tokens: int = RAG_CHUNK_OVERLAP,
+               min_tokens: int = RAG_CHUNK_MIN_TOKENS) -> list[str]:
+    """
+    Разбить документ на чанки.
+
+    Args:
+        text: Текст файла базы знаний
+        max_tokens: Примерный размер чанка в токенах (без шапки)
+        overlap_tokens: Сколько токенов из конца предыдущего чанка того же раздела повторить
+        min_tokens: Чанк меньше этого не заканчивается на границе раздела (0 — раздел всегда с нового чанка)
+    """
+    title, blocks = parse_blocks(text, max_tokens)
+    if not blocks:
+        return [text.strip()] if text.strip() else []
+
+    groups: list[list[Block]] = []
+    current: list[Block] = []
+    current_tokens = 0
+    for block in blocks:
+        same_section = current and current[-1].section == block.section
+        section_break = not same_section and current_tokens >= min_tokens
+        if current and (current_tokens + block.tokens > max_tokens or section_break):
+            groups.append(current)
+            # Перекрытие: последние абзацы того же раздела, пока влезают в overlap_tokens
+            overlap = []
+            if same_section and overlap_tokens > 0:
+                budget = overlap_tokens
+                for previous in reversed(current):
+                    if previous.tokens > budget or previous.section != block.section:
+                        break
+                    overlap.insert(0, previous)
+                    budget -= previous.tokens
+            if sum(b.tokens for b in overlap) + block.tokens > max_tokens:
+                overlap = []
+            current = overlap
+            current_tokens = sum(b.tokens for b in overlap)
+        current.append(block)
+        current_tokens += block.tokens
+    if current:
+        groups.append(current)
+
+    chunks = []
+    for group in groups:
+        # Шапка: название документа и заголовок, если чанк начинается не с него
+        heading = group[0].heading if not group[0].text.lstrip().startswith(group[0].heading) else ""
+        header = [part for part in (title, heading) if part]
+        # Заголовок, сменившийся внутри чанка, — перед своим абзацем
+        parts = [group[0].text]
+        for previous, block in zip(group, group[1:]):
+            new_heading = block.heading != previous.heading and not block.text.lstrip().startswith(block.heading)
+            parts.append(f"{block.heading}\n{block.text}" if new_heading and block.heading else block.text)
+        body = "\n\n".join(parts)
+        chunks.append("\n".join(header) + "\n\n" + body if header else body)
+    return chunks
+
+
+def chunk_stats(chunks: list[str]) -> dict:
+    """Статистика размеров чанков в токенах."""
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    if not tokens:
+        return {"chunks": 0, "total_tokens": 0}
+    return {
+        "chunks": len(tokens),
+        "total_tokens": sum(tokens),
+        "min": min(tokens),
+        "median": int(statistics.median(tokens)),
+        "mean": round(statistics.mean(tokens), 1),
+        "max": max(tokens),
+    }
@@ -0,0 +1,161 @@
+"""
+Сборка контекста RAG для промпта в пределах бюджета токенов.
+
+Вместо «всегда три чанка целиком»:
+- кандидаты берутся по порядку поиска, пока не кончится бюджет токенов;
+- чанк отбрасывается, если он далеко по расстоянию (абсолютный порог)
+  или заметно хуже лучшего (adaptive top-k: обычно хватает одного-двух);
+- абзацы, уже попавшие в контекст (перекрытие соседних чанков), не повторяются;
+- по желанию в чанке остаются только строки и предложения со словами запроса.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from config.settings import (
+    RAG_CONTEXT_BUDGET_TOKENS,
+    RAG_CONTEXT_CANDIDATES,
+    RAG_CONTEXT_MAX_DISTANCE,
+    RAG_CONTEXT_MAX_GAP,
+    RAG_CONTEXT_TRIM_SENTENCES,
+)
+from core.chunking import is_heading
+from core.lexical import tokenize
+from core.utils import estimate_tokens
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class ContextBudget:
+    """Параметры сборки контекста (по умолчанию — из настроек)."""
+    budget_tokens: int = RAG_CONTEXT_BUDGET_TOKENS
+    candidates: int = RAG_CONTEXT_CANDIDATES
+    # Порог расстояния (0 — без порога) и допустимое отставание от лучшего чанка
+    max_distance: float = RAG_CONTEXT_MAX_DISTANCE
+    max_gap: float = RAG_CONTEXT_MAX_GAP
+    trim_sentences: bool = RAG_CONTEXT_TRIM_SENTENCES
+
+
+def _paragraph_key(paragraph: str) -> str:
+    return " ".join(paragraph.lower().split())
+
+
+def _matches(text: str, query_terms: set[str]) -> bool:
+    return bool(query_terms & set(tokenize(text)))
+
+
+def _trim_paragraph(paragraph: str, query_terms: set[str]) -> str:
+    """Абзац целиком, если о нём первая строка; иначе — строки (предложения) со словами запроса."""
+    lines = [line for line in paragraph.split("\n") if line.strip()]
+    if _matches(lines[0], query_terms):
+        return paragraph
+    kept, pending_heading = [], None
+    for line in lines:
+        if is_heading(line):
+            pending_heading = line
+            continue
+        sentences = _SENTENCE_RE.split(line)
+        matched = [s for s in sentences if _matches(s, query_terms)]
+        if not matched:
+            continue
+        if pending_heading:
+            kept.append(pending_heading)
+            pending_heading = None
+        kept.append(line if len(matched) == len(sentences) else " ".join(matched))
+    return "\n".join(kept)
+
+
+def trim_to_query(content: str, query_terms: set[str]) -> str:
+    """
+    Оставить в чанке только то, что касается запроса.
+
+    Абзац, первая строка которого содержит слово запроса («ПАКЕТ «КРУТО»»),
+    остаётся целиком; в остальных — строки (в длинных строках — предложения)
+    со словами запроса под своим заголовком. Шапка чанка сохраняется. Если
+    совпадений нет совсем, чанк возвращается целиком (нашёлся по смыслу).
+    """
+    paragraphs = [p for p in content.split("\n\n") if p.strip()]
+    header = paragraphs.pop(0) if len(paragraphs) > 1 and _is_chunk_header(paragraphs[0]) else None
+    trimmed = [t for t in (_trim_paragraph(p, query_terms) for p in paragraphs) if t]
+    if not trimmed:
+        return content
+    return "\n\n".join(([header] if header else []) + trimmed)
+
+
+def _is_chunk_header(paragraph: str) -> bool:
+    """Шапка из core.chunking: название документа и, возможно, заголовок раздела."""
+    return paragraph.count("\n") <= 1 and len(paragraph) <= 200
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Обрезать текст по строкам до max_tokens."""
+    result = []
+    for line in text.split("\n"):
+        if estimate_tokens("\n".join(result + [line])) > max_tokens:
+            break
+        result.append(line)
+    return "\n".join(result)
+
+
+def select_context(docs: list[dict], query: str, budget: Optional[ContextBudget] = None) -> list[dict]:
+    """
+    Отобрать и ужать документы поиска под бюджет.
+
+    Документы без расстояния (в гибридном поиске — найденные только BM25)
+    порогами по расстоянию не отсекаются.
+
+    Args:
+        docs: Результаты RAGSystem.search по убыванию релевантности
+        query: Запрос пользователя (для обрезки по предложениям)
+
+    Returns:
+        Документы в том же формате, content — только то, что пойдёт в промпт
+    """
+    budget = budget or ContextBudget()
+    distances = [doc["distance"] for doc in docs if doc.get("distance") is not None]
+    best = min(distances) if distances else None
+    query_terms = set(tokenize(query))
+
+    selected, seen, used_tokens = [], set(), 0
+    for doc in docs:
+        distance = doc.get("distance")
+        # Первый документ берём всегда: иначе ответ совсем без контекста
+        if selected and distance is not None:
+            if budget.max_distance and distance > budget.max_distance:
+                continue
+            if best is not None and distance > best + budget.max_gap:
+                continue
+
+        paragraphs = [p for p in doc["content"].split("\n\n") if p.strip()]
+        # Шапка чанка (название документа и раздела) повторяется у соседних чанков — это не дубль
+        has_header = len(paragraphs) > 1 and _is_chunk_header(paragraphs[0])
+        fresh = [p for i, p in enumerate(paragraphs) if (i == 0 and has_header) or _paragraph_key(p) not in seen]
+        if len(fresh) <= int(has_header):
+            continue
+        content = "\n\n".join(fresh)
+        if budget.trim_sentences and query_terms:
+            content = trim_to_query(content, query_terms)
+
+        title = doc.get("title") or ""
+        tokens = estimate_tokens(f"### {title}\n{content}")
+        if used_tokens + tokens > budget.budget_tokens:
+            if selected:
+                continue
+            content = _truncate(content, budget.budget_tokens - estimate_tokens(f"### {title}\n"))
+            tokens = budget.budget_tokens
+
+        seen.update(_paragraph_key(p) for p in paragraphs)
+        selected.append({**doc, "content": content})
+        used_tokens += tokens
+    return selected
+
+
+def format_context(docs: list[dict]) -> str:
+    """Контекст для промпта: «### заголовок» + текст каждого документа."""
+    parts = []
+    for doc in docs:
+        title = doc.get("title", "")
+        parts.append(f"### {title}\n{doc['content']}" if title else doc["content"])
+    return "\n\n".join(parts)
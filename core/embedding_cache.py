@@ -0,0 +1,194 @@
+"""
+Дисковый кеш эмбеддингов (SQLite).
+
+Ключ — sha256(текст) + модель: одинаковые тексты (повторные вопросы
+пользователей, неизменённые чанки при переиндексации) в OpenAI больше
+не уходят. Размер ограничен: при переполнении вытесняются записи,
+к которым дольше всего не обращались.
+
+Чтение на попадании — один SELECT без записи: время обращения копится
+в памяти и пишется пачкой (при вставке перед вытеснением или когда
+набралось TOUCH_FLUSH_SIZE записей), так что запрос пользователя
+не ждёт UPDATE и commit на диск.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config.settings import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Хранилище векторов float32 в SQLite.
+
+    Потокобезопасно: add_documents считает пачки в пуле потоков,
+    VK-бот работает в своём потоке.
+    """
+
+    TOUCH_FLUSH_SIZE = 1000
+
+    def __init__(self, path: Path, maxsize: int = EMBEDDING_CACHE_SIZE):
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: dict[tuple[str, str], float] = {}  # (key, model) -> last_used, ещё не записанные
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT NOT NULL, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (key, model))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, texts: list[str], model: str) -> list[Optional[np.ndarray]]:
+        """Векторы для текстов (None — нет в кеше)."""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            found = {}
+            unique = list(dict.fromkeys(keys))
+            # Лимит параметров SQLite — запрашиваем порциями
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+            if found:
+                now = time.time()
+                self._touched.update(((key, model), now) for key in found)
+                if len(self._touched) >= self.TOUCH_FLUSH_SIZE:
+                    self._flush_touched()
+                    self._conn.commit()
+
+            result = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in result)
+            self.hits += hits
+            self.misses += len(result) - hits
+            return result
+
+    def _flush_touched(self):
+        """Записать накопленные времена обращений (под self._lock, commit — у вызывающего)."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ? AND model = ?",
+                [(now, key, model) for (key, model), now in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def flush(self):
+        """Записать накопленные времена обращений сейчас."""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def put_many(self, texts: list[str], vectors, model: str):
+        """Сохранить векторы; при переполнении вытеснить давно не использованные."""
+        now = time.time()
+        rows = [
+            (text_key(text), model, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            # Вытеснение должно видеть свежие обращения
+            self._flush_touched()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._size > self.maxsize:
+                # Вытесняем с запасом 10%, чтобы не чистить на каждой вставке
+                excess = self._size - int(self.maxsize * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._size -= excess
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._touched.clear()
+            self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов (по текстам)."""
+        total = self.hits + self.misses
+        return {
+            "size": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class CachedEmbeddings:
+    """
+    Функция эмбеддингов с кешем: сначала кеш, промахи — одним запросом
+    к исходной функции (той же, что передана коллекции ChromaDB).
+
+    В коллекцию Chroma обёртка не передаётся: Chroma сохраняет конфиг
+    функции эмбеддингов, а RAGSystem подаёт ей готовые векторы.
+    """
+
+    def __init__(self, embedding_fn, cache: EmbeddingCache, model: str = EMBEDDING_MODEL):
+        self.embedding_fn = embedding_fn
+        self.cache = cache
+        self.model = model
+
+    def __call__(self, texts: list[str]) -> list[np.ndarray]:
+        texts = list(texts)
+        vectors = self.cache.get_many(texts, self.model)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Повторы внутри одной пачки считаем один раз
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, self.embedding_fn(unique)))
+            self.cache.put_many(unique, [computed[text] for text in unique], self.model)
+            for i in missing:
+                vectors[i] = np.asarray(computed[texts[i]], dtype=np.float32)
+        return vectors
+
+
+def _create_cache() -> Optional[EmbeddingCache]:
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    try:
+        return EmbeddingCache(EMBEDDING_CACHE_PATH)
+    except sqlite3.Error as e:
+        logger.error(f"Embedding cache disabled: {e}")
+        return None
+
+
+# Глобальный кеш эмбеддингов (None — кеш выключен)
+embedding_cache = _create_cache()
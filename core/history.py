@@ -0,0 +1,170 @@
+"""
+История диалога для промпта: окно по бюджету токенов + скользящее резюме.
+
+Свежие сообщения идут в промпт как есть, пока укладываются в
+HISTORY_TOKEN_BUDGET. Более старые сворачиваются в Session.summary
+(фоном, после ответа пользователю), так что размер промпта ограничен,
+а контекст длинного диалога не теряется. Выпавшие сообщения, которые
+ещё не свёрнуты (копятся до HISTORY_SUMMARY_BATCH_TOKENS), остаются
+в промпте — иначе их не было бы ни в истории, ни в резюме.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config.settings import (
+    HISTORY_TOKEN_BUDGET,
+    HISTORY_MAX_MESSAGES,
+    HISTORY_SUMMARY_BATCH_TOKENS,
+)
+from core.agent import agent
+from core.utils import estimate_tokens
+from db import SessionLocal, Session, Message
+
+logger = logging.getLogger(__name__)
+
+# Несвёрнутые выпавшие сообщения остаются в промпте, пока их не больше (токенов);
+# сверх этого — только если резюме долго не сворачивается (ошибки LLM)
+OVERFLOW_PROMPT_TOKENS = 2 * HISTORY_SUMMARY_BATCH_TOKENS
+# Сколько токенов выпавших сообщений сворачивать за один вызов LLM
+SUMMARY_FOLD_MAX_TOKENS = 4 * HISTORY_SUMMARY_BATCH_TOKENS
+
+# Сессии, для которых сейчас идёт сворачивание резюме
+_folding: set[int] = set()
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_tasks: set = set()
+
+
+@dataclass
+class HistoryWindow:
+    """История для промпта и то, что из неё выпало."""
+    messages: list[dict] = field(default_factory=list)
+    summary: Optional[str] = None
+    # Выпавшие сообщения (ещё не в резюме), от старых к новым. Если резюме отстало,
+    # здесь только самые новые из них — старые fold_summary читает из БД сам
+    overflow: list[dict] = field(default_factory=list)
+    overflow_ids: list[int] = field(default_factory=list)
+    overflow_tokens: int = 0
+
+
+def load_history(db, session_id: int, before_id: int = None,
+                 budget: int = HISTORY_TOKEN_BUDGET) -> HistoryWindow:
+    """
+    Собрать окно истории сессии (без текущего сообщения before_id).
+
+    Сообщения берутся от новых к старым, пока укладываются в budget токенов
+    и HISTORY_MAX_MESSAGES; самое свежее сообщение попадает в окно всегда.
+    Более старые после водяного знака резюме — overflow: пока не свёрнуты,
+    они остаются в начале окна. Чтение останавливается, как только overflow
+    превысил OVERFLOW_PROMPT_TOKENS, — остальное (если резюме отстало)
+    дочитает fold_summary, каждый ход его не читает и не токенизирует.
+    """
+    session = db.query(Session).filter(Session.id == session_id).first()
+    summary = session.summary if session else None
+    summary_message_id = (session.summary_message_id if session else None) or 0
+
+    query = db.query(Message).filter(
+        Message.session_id == session_id,
+        Message.id > summary_message_id
+    )
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    # Строки читаются порциями от новых к старым — до заполнения окна и OVERFLOW_PROMPT_TOKENS
+    rows = query.order_by(Message.id.desc()).yield_per(HISTORY_MAX_MESSAGES)
+
+    window = HistoryWindow(summary=summary)
+    recent, overflow, kept = [], [], 0
+    used = 0
+    for msg in rows:
+        tokens = estimate_tokens(msg.content)
+        if not overflow and (not recent or (used + tokens <= budget and len(recent) < HISTORY_MAX_MESSAGES)):
+            recent.append(msg)
+            used += tokens
+            continue
+        overflow.append(msg)
+        window.overflow_tokens += tokens
+        if window.overflow_tokens > OVERFLOW_PROMPT_TOKENS:
+            break
+        kept += 1
+
+    overflow.reverse()
+    window.overflow = [{"role": m.role, "content": m.content} for m in overflow]
+    window.overflow_ids = [m.id for m in overflow]
+    # Несвёрнутое остаётся в промпте (самое новое из него, если резюме отстало)
+    window.messages = window.overflow[len(overflow) - kept:] + [
+        {"role": m.role, "content": m.content} for m in reversed(recent)
+    ]
+    return window
+
+
+def _read_fold_batch(session_id: int, up_to_id: int) -> tuple[Optional[str], list[dict], Optional[int]]:
+    """Текущее резюме и самые старые несвёрнутые сообщения (до up_to_id, не больше SUMMARY_FOLD_MAX_TOKENS)."""
+    db = SessionLocal()
+    try:
+        session = db.query(Session).filter(Session.id == session_id).first()
+        if not session:
+            return None, [], None
+        rows = db.query(Message).filter(
+            Message.session_id == session_id,
+            Message.id > (session.summary_message_id or 0),
+            Message.id <= up_to_id
+        ).order_by(Message.id).yield_per(50)
+
+        batch, last_id, tokens = [], None, 0
+        for msg in rows:
+            tokens += estimate_tokens(msg.content)
+            if batch and tokens > SUMMARY_FOLD_MAX_TOKENS:
+                break
+            batch.append({"role": msg.role, "content": msg.content})
+            last_id = msg.id
+        return session.summary, batch, last_id
+    finally:
+        db.close()
+
+
+async def fold_summary(session_id: int, window: HistoryWindow):
+    """Свернуть выпавшие из окна сообщения в резюме сессии (старые — первыми, до SUMMARY_FOLD_MAX_TOKENS за раз)."""
+    if session_id in _folding or not window.overflow_ids:
+        return
+    _folding.add(session_id)
+    try:
+        # Старые несвёрнутые load_history мог не дочитать — берём их из БД
+        current, batch, last_id = _read_fold_batch(session_id, window.overflow_ids[-1])
+        if not batch:
+            return
+
+        summary = await agent.summarize_history(current, batch)
+        if not summary:
+            return
+
+        db = SessionLocal()
+        try:
+            session = db.query(Session).filter(Session.id == session_id).first()
+            # Резюме могли обновить параллельно — не откатываем водяной знак назад
+            if session and (session.summary_message_id or 0) < last_id:
+                session.summary = summary
+                session.summary_message_id = last_id
+                db.commit()
+                logger.info(f"Session #{session_id} summary folded up to message #{last_id}")
+        finally:
+            db.close()
+    except Exception as e:
+        logger.error(f"Failed to fold history summary for session #{session_id}: {e}")
+    finally:
+        _folding.discard(session_id)
+
+
+def schedule_summary(session_id: int, window: HistoryWindow):
+    """
+    Запустить сворачивание резюме в фоне, если выпало достаточно сообщений.
+
+    Сворачиваем пачками (HISTORY_SUMMARY_BATCH_TOKENS), а не на каждом ходу,
+    чтобы не тратить лишний вызов LLM.
+    """
+    if not window.overflow or window.overflow_tokens < HISTORY_SUMMARY_BATCH_TOKENS:
+        return
+    task = asyncio.create_task(fold_summary(session_id, window))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
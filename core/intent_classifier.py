@@ -0,0 +1,142 @@
+"""
+Локальный классификатор намерений: символьные n-граммы (TF-IDF) + логистическая регрессия.
+
+Обучается офлайн (scripts/train_intent_classifier.py) на диалогах из
+data/bot.db и работает в процессе на NumPy, без API. intent_router
+спрашивает его после правил; LLM нужен только когда уверенность модели
+ниже INTENT_CLASSIFIER_THRESHOLD.
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from config.settings import INTENT_MODEL_PATH
+
+logger = logging.getLogger(__name__)
+
+# Намерения, которые выдаёт роутер. Остальные значения sessions.intent (lost_item,
+# partnership, …) ставят сценарии — на них модель не учится и их не возвращает
+ROUTER_INTENTS = ("birthday", "general", "events", "unknown")
+
+NGRAM_RANGE = (2, 4)
+MAX_FEATURES = 20000
+
+_NON_WORD_RE = re.compile(r"[^a-zа-яё0-9]+")
+
+
+def char_ngrams(text: str) -> Counter:
+    """Символьные n-граммы внутри слов (слово обрамляется пробелами)."""
+    text = _NON_WORD_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+    grams = Counter()
+    for word in text.split():
+        padded = f" {word} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class IntentClassifier:
+    """TF-IDF по символьным n-граммам + softmax-регрессия."""
+
+    def __init__(self, vocab: list[str], idf: np.ndarray, weights: np.ndarray, bias: np.ndarray, classes: list[str]):
+        self.vocab = {gram: i for i, gram in enumerate(vocab)}
+        self.idf = idf
+        self.weights = weights  # (признаки, классы)
+        self.bias = bias
+        self.classes = classes
+
+    def _vectorize(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.vocab)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram, count in char_ngrams(text).items():
+                col = self.vocab.get(gram)
+                if col is not None:
+                    matrix[row, col] = 1 + math.log(count)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _softmax(self, features: np.ndarray) -> np.ndarray:
+        logits = features @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, texts: list[str]) -> np.ndarray:
+        """Вероятности классов (столбцы — в порядке self.classes)."""
+        return self._softmax(self._vectorize(texts))
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Намерение и уверенность (вероятность класса)."""
+        proba = self.predict_proba([text])[0]
+        best = int(proba.argmax())
+        return self.classes[best], float(proba[best])
+
+    @classmethod
+    def train(cls, texts: list[str], labels: list[str], epochs: int = 300,
+              learning_rate: float = 1.0, l2: float = 1e-4) -> "IntentClassifier":
+        """
+        Обучить модель (полный батч, градиентный спуск по кросс-энтропии).
+
+        Классы взвешиваются обратно частоте: в базе большинство диалогов про ДР,
+        и без весов модель уверенно относила бы к birthday любое «Здравствуйте».
+        """
+        classes = sorted(set(labels))
+        doc_freq = Counter()
+        for text in texts:
+            doc_freq.update(char_ngrams(text).keys())
+        vocab = [gram for gram, _ in doc_freq.most_common(MAX_FEATURES)]
+        idf = np.array(
+            [math.log((1 + len(texts)) / (1 + doc_freq[gram])) + 1 for gram in vocab], dtype=np.float32
+        )
+
+        model = cls(vocab, idf, np.zeros((len(vocab), len(classes)), dtype=np.float32),
+                    np.zeros(len(classes), dtype=np.float32), classes)
+        features = model._vectorize(texts)
+        targets = np.zeros((len(texts), len(classes)), dtype=np.float32)
+        label_ids = np.array([classes.index(label) for label in labels])
+        targets[np.arange(len(texts)), label_ids] = 1
+        counts = np.bincount(label_ids, minlength=len(classes))
+        sample_weights = (len(texts) / (len(classes) * counts))[label_ids][:, None].astype(np.float32)
+
+        for _ in range(epochs):
+            proba = model._softmax(features)
+            grad = sample_weights * (proba - targets) / len(texts)
+            model.weights -= learning_rate * (features.T @ grad + l2 * model.weights)
+            model.bias -= learning_rate * grad.sum(axis=0)
+        return model
+
+    def save(self, path: Path = INTENT_MODEL_PATH):
+        vocab = [None] * len(self.vocab)
+        for gram, i in self.vocab.items():
+            vocab[i] = gram
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f, vocab=np.array(vocab), idf=self.idf, weights=self.weights,
+                bias=self.bias, classes=np.array(self.classes)
+            )
+
+    @classmethod
+    def load(cls, path: Path = INTENT_MODEL_PATH) -> "IntentClassifier | None":
+        """Загрузить модель; если её ещё не обучили — None."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            data = np.load(path, allow_pickle=False)
+            return cls(data["vocab"].tolist(), data["idf"], data["weights"], data["bias"], data["classes"].tolist())
+        except Exception as e:
+            logger.error(f"Failed to load intent model {path}: {e}")
+            return None
+
+
+# Глобальная модель (None, пока не обучена: python scripts/train_intent_classifier.py)
+intent_classifier = IntentClassifier.load()
@@ -1,10 +1,24 @@
 """Intent Router — определение намерения пользователя."""
 
-import re
-from dataclasses import dataclass
-from openai import OpenAI
+import asyncio
+import json
+import threading
+import weakref
+from dataclasses import dataclass, field
 
-from config.settings import OPENAI_API_KEY
+from config.settings import (
+    INTENT_BATCH_ENABLED,
+    INTENT_BATCH_WINDOW_MS,
+    INTENT_BATCH_SIZE,
+    INTENT_CLASSIFIER_THRESHOLD,
+)
+from core.intent_classifier import intent_classifier, ROUTER_INTENTS
+from core.llm_gateway import llm_gateway
+from core.metrics import llm_metrics
+from core.matcher import MultiPatternMatcher
+
+# Классификация — всего лишь fallback: долго ждать её нет смысла
+INTENT_LLM_TIMEOUT = 5.0
 
 
 @dataclass
@@ -13,6 +27,7 @@ class IntentResult:
     intent: str  # birthday, general, events, unknown
     confidence: float
     reason: str
+    triggers: list[str] = field(default_factory=list)  # сработавшие триггеры (для правил)
 
 
 # Триггеры для ДР/праздников
@@ -44,31 +59,25 @@ EVENTS_TRIGGERS = [
 ]
 
 
+# Все триггеры собраны в один матчер: одно сканирование сообщения вместо ~80 re.search
+TRIGGER_MATCHER = MultiPatternMatcher({
+    "birthday": BIRTHDAY_TRIGGERS,
+    "general": GENERAL_TRIGGERS,
+    "events": EVENTS_TRIGGERS,
+})
+
+
+def match_triggers(message: str) -> dict[str, list[str]]:
+    """Сработавшие триггеры по намерениям (для отладки и объяснения выбора)."""
+    return TRIGGER_MATCHER.match(message.lower())
+
+
 def detect_intent_rules(message: str) -> IntentResult | None:
     """Определить намерение по правилам (быстро, без API)."""
-    text = message.lower()
-    
-    birthday_score = 0
-    general_score = 0
-    
-    # Проверяем триггеры ДР
-    for trigger in BIRTHDAY_TRIGGERS:
-        if re.search(trigger, text):
-            birthday_score += 1
-    
-    # Проверяем триггеры общих вопросов
-    for trigger in GENERAL_TRIGGERS:
-        if re.search(trigger, text):
-            general_score += 1
-    
-    # Проверяем триггеры событий
-    events_score = 0
-    for trigger in EVENTS_TRIGGERS:
-        if re.search(trigger, text):
-            events_score += 1
+    matched = match_triggers(message)
     
     # Определяем победителя
-    scores = {'birthday': birthday_score, 'general': general_score, 'events': events_score}
+    scores = {intent: len(matched.get(intent, [])) for intent in ('birthday', 'general', 'events')}
     max_intent = max(scores, key=scores.get)
     max_score = scores[max_intent]
     
@@ -77,40 +86,76 @@ def detect_intent_rules(message: str) -> IntentResult | None:
             return IntentResult(
                 intent="birthday",
                 confidence=min(0.7 + max_score * 0.1, 0.95),
-                reason=f"Найдено {max_score} триггеров праздника"
+                reason=f"Найдено {max_score} триггеров праздника",
+                triggers=matched[max_intent]
             )
         elif max_intent == 'events':
             return IntentResult(
                 intent="events",
                 confidence=min(0.7 + max_score * 0.1, 0.95),
-                reason=f"Найдено {max_score} триггеров афиши"
+                reason=f"Найдено {max_score} триггеров афиши",
+                triggers=matched[max_intent]
             )
         else:
             return IntentResult(
                 intent="general",
                 confidence=min(0.6 + max_score * 0.1, 0.9),
-                reason=f"Найдено {max_score} триггеров общих вопросов"
+                reason=f"Найдено {max_score} триггеров общих вопросов",
+                triggers=matched[max_intent]
             )
     
     return None  # Не удалось определить правилами
 
 
-def detect_intent_llm(message: str, history: list[dict] = None) -> IntentResult:
+# Варианты намерений для LLM — общие для одиночной и пакетной классификации
+INTENT_OPTIONS = """Варианты:
+- birthday — если человек хочет организовать праздник, день рождения, выпускной, спрашивает про аниматоров, торты, комнаты, бронирование
+- general — если хочет узнать о посещении парка: цены, режим, правила, аттракционы, скидки, как добраться
+- unknown — если непонятно (приветствие, нейтральный вопрос)"""
+
+LLM_INTENTS = ["birthday", "general", "unknown"]
+
+INTENT_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "intent_batch",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "intent": {"type": "string", "enum": LLM_INTENTS},
+                        },
+                        "required": ["id", "intent"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["items"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+async def detect_intent_llm(message: str, history: list[dict] = None) -> IntentResult:
     """Определить намерение через LLM (fallback)."""
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    
     prompt = f"""Определи намерение пользователя чата парка развлечений "Джунгли Сити".
 
 Сообщение пользователя: "{message}"
 
-Варианты:
-- birthday — если человек хочет организовать праздник, день рождения, выпускной, спрашивает про аниматоров, торты, комнаты, бронирование
-- general — если хочет узнать о посещении парка: цены, режим, правила, аттракционы, скидки, как добраться
-- unknown — если непонятно (приветствие, нейтральный вопрос)
+{INTENT_OPTIONS}
 
 Ответь ТОЛЬКО одним словом: birthday, general или unknown"""
 
-    response = client.chat.completions.create(
+    response = await llm_gateway.chat(
+        "intent",
+        timeout=INTENT_LLM_TIMEOUT,
         model="gpt-4o-mini",  # Быстрая дешёвая модель для классификации
         messages=[{"role": "user", "content": prompt}],
         max_tokens=10,
@@ -119,22 +164,146 @@ def detect_intent_llm(message: str, history: list[dict] = None) -> IntentResult:
     
     result = response.choices[0].message.content.strip().lower()
     
-    if result in ["birthday", "general", "unknown"]:
+    if result in LLM_INTENTS:
         return IntentResult(intent=result, confidence=0.7, reason="LLM классификация")
     
     return IntentResult(intent="unknown", confidence=0.5, reason="LLM вернул неожиданный ответ")
 
 
-def detect_intent(message: str, history: list[dict] = None) -> IntentResult:
-    """Определить намерение пользователя (правила → LLM fallback)."""
+@dataclass
+class _BatchState:
+    """Очередь классификации одного event loop."""
+    pending: list = field(default_factory=list)  # [(сообщение, future)]
+    timer: asyncio.TimerHandle = None
+
+
+class IntentBatcher:
+    """
+    Пакетная LLM-классификация намерений.
+
+    Когда пишут многие сразу, неоднозначные сообщения копятся
+    INTENT_BATCH_WINDOW_MS (или до INTENT_BATCH_SIZE штук) и классифицируются
+    одним структурированным запросом; каждый вызывающий получает свой результат.
+    """
+
+    def __init__(self, window_ms: int = INTENT_BATCH_WINDOW_MS, max_size: int = INTENT_BATCH_SIZE,
+                 gateway=llm_gateway):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.gateway = gateway
+        # Очередь своя у каждого event loop: VK бот крутится в отдельном потоке
+        self._states = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self._stats = {"batches": 0, "messages": 0, "errors": 0}
+
+    def _get_state(self, loop) -> _BatchState:
+        with self._lock:
+            state = self._states.get(loop)
+            if state is None:
+                state = self._states[loop] = _BatchState()
+            return state
+
+    async def classify(self, message: str) -> IntentResult:
+        """Классифицировать сообщение (в пачке с соседними запросами)."""
+        loop = asyncio.get_running_loop()
+        state = self._get_state(loop)
+        future = loop.create_future()
+        state.pending.append((message, future))
+
+        if len(state.pending) >= self.max_size:
+            self._flush(state)
+        elif state.timer is None:
+            state.timer = loop.call_later(self.window, self._flush, state)
+
+        return await future
+
+    def _flush(self, state: _BatchState):
+        """Отправить накопленную пачку."""
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        batch, state.pending = state.pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._classify_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _classify_batch(self, batch: list):
+        numbered = "\n".join(
+            f"{i}. {json.dumps(message, ensure_ascii=False)}" for i, (message, _) in enumerate(batch)
+        )
+        prompt = f"""Определи намерение каждого сообщения из чата парка развлечений "Джунгли Сити".
+
+Сообщения (номер. текст):
+{numbered}
+
+{INTENT_OPTIONS}
+
+Верни items: для каждого номера сообщения — его intent."""
+
+        self._stats["batches"] += 1
+        self._stats["messages"] += len(batch)
+        try:
+            response = await self.gateway.chat(
+                "intent_batch",
+                timeout=INTENT_LLM_TIMEOUT,
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                response_format=INTENT_BATCH_RESPONSE_FORMAT,
+                max_tokens=20 + 15 * len(batch),
+                temperature=0
+            )
+            items = json.loads(response.choices[0].message.content)["items"]
+            intents = {item["id"]: item["intent"] for item in items}
+        except Exception as e:
+            self._stats["errors"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (_, future) in enumerate(batch):
+            if future.done():  # вызывающего уже отменили
+                continue
+            if intents.get(i) in LLM_INTENTS:
+                future.set_result(IntentResult(intent=intents[i], confidence=0.7, reason="LLM классификация"))
+            else:
+                future.set_result(IntentResult(intent="unknown", confidence=0.5, reason="LLM вернул неожиданный ответ"))
+
+    def stats(self) -> dict:
+        batches = self._stats["batches"]
+        return {
+            **self._stats,
+            "avg_batch_size": round(self._stats["messages"] / batches, 2) if batches else 0.0,
+        }
+
+
+# Глобальный батчер классификации
+intent_batcher = IntentBatcher()
+
+
+async def detect_intent(message: str, history: list[dict] = None) -> IntentResult:
+    """Определить намерение пользователя (правила → локальная модель → LLM fallback)."""
     # Сначала пробуем правила (быстро и бесплатно)
     result = detect_intent_rules(message)
     if result:
         return result
     
-    # Если правила не сработали — спрашиваем LLM
+    # Затем локальная модель (если обучена и уверена). Модель, обученная на старых
+    # данных, может знать и намерения сценариев (lost_item, …) — их роутер не выдаёт
+    if intent_classifier is not None:
+        intent, confidence = intent_classifier.predict(message)
+        if intent in ROUTER_INTENTS and confidence >= INTENT_CLASSIFIER_THRESHOLD:
+            llm_metrics.record("intent_local", None)
+            return IntentResult(intent=intent, confidence=confidence, reason="Локальная модель")
+    
+    # Иначе спрашиваем LLM (пачкой с другими пользователями)
     try:
-        return detect_intent_llm(message, history)
+        if INTENT_BATCH_ENABLED:
+            return await intent_batcher.classify(message)
+        return await detect_intent_llm(message, history)
     except Exception as e:
         print(f"LLM intent detection error: {e}")
         return IntentResult(intent="unknown", confidence=0.3, reason=f"Ошибка LLM: {e}")
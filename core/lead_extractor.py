@@ -0,0 +1,193 @@
+"""
+Локальное (без LLM) извлечение данных заявки из сообщения.
+
+Телефоны, даты ("11 февраля", "24.01"), слоты времени (10:30/14:30/18:30),
+число детей/взрослых, возраст, комнаты и формат разбираются регулярками.
+Если после этого в сообщении не остаётся ничего содержательного
+(только "да", "верно", предлоги и т.п.), LLM для извлечения не нужен.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+MONTHS = [
+    "января", "февраля", "марта", "апреля", "мая", "июня",
+    "июля", "августа", "сентября", "октября", "ноября", "декабря"
+]
+
+# Комнаты из knowledge/nn/birthday/rooms.txt (+ "Опушка" из правил извлечения)
+ROOM_NAMES = [
+    "Сказочный лес", "Подводный мир", "Пещера сокровищ", "Поляна чудес",
+    "Магический пруд", "Волшебное подземелье", "Таинственное озеро", "Опушка"
+]
+
+# Частые имена: одно такое слово рядом с телефоном — имя клиента, даже написанное со строчной
+COMMON_NAMES = {
+    "александр", "александра", "алексей", "алена", "алёна", "алина", "алиса", "алла", "анастасия", "анна",
+    "андрей", "антон", "арина", "артем", "артём", "валентина", "валерия", "вера", "вероника", "виктор",
+    "виктория", "владимир", "галина", "дарья", "денис", "диана", "дмитрий", "евгений", "евгения",
+    "екатерина", "елена", "елизавета", "жанна", "ирина", "карина", "кирилл", "кристина", "ксения",
+    "лариса", "любовь", "людмила", "максим", "марина", "мария", "маргарита", "михаил", "надежда",
+    "наталья", "наталия", "наташа", "никита", "николай", "оксана", "олег", "ольга", "павел", "полина",
+    "роман", "светлана", "сергей", "софия", "татьяна", "ульяна", "юлия", "яна", "катя", "маша",
+    "настя", "оля", "юля", "лена", "света", "таня", "аня", "ира", "даша", "саша", "женя",
+}
+
+# Слова, которые не несут данных заявки: подтверждения, предлоги, «единицы» чисел
+FILLER_WORDS = {
+    "да", "нет", "ага", "ок", "окей", "верно", "все", "всё", "правильно", "спасибо",
+    "хорошо", "отлично", "супер", "конечно", "подтверждаю", "так", "точно",
+    "на", "в", "во", "и", "с", "к", "по", "это", "вот", "а", "ну", "нас", "нам", "будет", "будут",
+    "детей", "ребенка", "ребёнка", "ребенок", "ребёнок", "детских", "дети", "взрослых", "взрослый",
+    "взрослые", "человек", "чел", "лет", "год", "года", "время", "дата", "число",
+    "телефон", "номер", "тел", "мой", "мне", "меня", "зовут", "имя",
+    "комната", "комнату", "комнате", "тематическая", "тематическую", "ресторан", "ресторане",
+    "любая", "любую", "часов", "утра", "вечера", "дня",
+}
+
+_MONTH_RE = "|".join(MONTHS) + r"|янв|фев|мар|апр|июн|июл|авг|сен|сент|окт|ноя|дек"
+
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?7|8)?[\s\-(]*\d{3}[\s\-)]*\d{3}[\s\-]*\d{2}[\s\-]*\d{2}(?!\d)")
+_DATE_WORD_RE = re.compile(rf"(?<!\d)(\d{{1,2}})\s*({_MONTH_RE})[а-я]*", re.IGNORECASE)
+_DATE_DOT_RE = re.compile(r"(?<![\d.])(\d{1,2})\.(\d{2})(?:\.\d{2,4})?(?![\d.])")
+_SLOT_RE = re.compile(r"(?<!\d)(10|14|18)\s*[:.\s]\s*30(?!\d)")
+_TIME_RE = re.compile(r"(?<!\d)([01]?\d|2[0-3]):([0-5]\d)(?!\d)")
+# "8 детей" или "Детей: 8" (во втором случае число должно закрывать фразу)
+_KIDS_RE = re.compile(r"(?<!\d)(\d{1,3})\s*(?:дет|реб[её]н|малыш)[а-я]*|дет[а-я]*\s*[:\-]?\s*(\d{1,3})(?=\s*(?:$|[\n,.;]))", re.IGNORECASE | re.MULTILINE)
+_ADULTS_RE = re.compile(r"(?<!\d)(\d{1,3})\s*взросл[а-я]*|взросл[а-я]*\s*[:\-]?\s*(\d{1,3})(?=\s*(?:$|[\n,.;]))", re.IGNORECASE | re.MULTILINE)
+_AGE_RE = re.compile(r"(?<!\d)(\d{1,2})\s*(?:лет|год[а]?)(?![а-я])", re.IGNORECASE)
+# Возраст относится к ребёнку, только если о ребёнке есть в сообщении ("мне 25 лет" — нет)
+_CHILD_REF_RE = re.compile(r"реб[её]н|дет|сын|доч|именинни|малыш|исполн", re.IGNORECASE)
+_NAME_RE = re.compile(r"(?:меня зовут|моё имя|мое имя)\s+([а-яё]+)", re.IGNORECASE)
+_FORMAT_ROOM_RE = re.compile(r"тематическ[а-я]*\s+комнат[а-я]*|комнат[а-я]*|домик[а-я]*", re.IGNORECASE)
+_FORMAT_RESTAURANT_RE = re.compile(r"ресторан[а-я]*|банкет[а-я]*", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-zа-яё]+", re.IGNORECASE)
+
+
+# Поля, которые регулярки разбирают однозначно — ими можно дополнить ответ LLM
+STRICT_FIELDS = ("phone", "event_date", "time", "kids_count", "adults_count")
+
+
+@dataclass
+class LocalExtraction:
+    """Результат локального разбора."""
+    fields: dict = field(default_factory=dict)
+    unresolved: bool = False  # в сообщении есть что-то, что регулярками не разобрано
+    leftover: list[str] = field(default_factory=list)  # неразобранные слова (для отладки)
+
+    @property
+    def strict_fields(self) -> dict:
+        """Только однозначно разобранные поля (телефон, дата, время, количества)."""
+        return {key: value for key, value in self.fields.items() if key in STRICT_FIELDS}
+
+
+class _Text:
+    """Текст сообщения, из которого «вырезаются» разобранные фрагменты."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def take(self, pattern: re.Pattern):
+        """Найти все совпадения и заменить их пробелами."""
+        matches = list(pattern.finditer(self.text))
+        for match in reversed(matches):
+            self.text = self.text[:match.start()] + " " + self.text[match.end():]
+        return matches
+
+
+def _month_name(prefix: str) -> str:
+    prefix = prefix.lower()
+    for month in MONTHS:
+        if month.startswith(prefix[:3]):
+            return month
+    return prefix
+
+
+def _looks_like_name(word: str, message: str) -> bool:
+    if len(word) < 2:
+        return False
+    if word in COMMON_NAMES:
+        return True
+    match = re.search(rf"(?<![а-яёa-z]){re.escape(word)}(?![а-яёa-z])", message, re.IGNORECASE)
+    return bool(match and match.group(0)[0].isupper() and message[:match.start()].strip())
+
+
+def extract_local(message: str) -> LocalExtraction:
+    """Разобрать сообщение без LLM."""
+    text = _Text(message)
+    fields = {}
+
+    # Телефон — первым, чтобы его цифры не приняли за дату/количество
+    phones = text.take(_PHONE_RE)
+    if phones:
+        fields["phone"] = phones[-1].group(0).strip()
+
+    dates = text.take(_DATE_WORD_RE)
+    if dates:
+        day, month = dates[-1].group(1), dates[-1].group(2)
+        fields["event_date"] = f"{int(day)} {_month_name(month)}"
+
+    slots = text.take(_SLOT_RE)
+    if slots:
+        fields["time"] = f"{slots[-1].group(1)}:30"
+    else:
+        times = text.take(_TIME_RE)
+        if times:
+            fields["time"] = f"{int(times[-1].group(1)):02d}:{times[-1].group(2)}"
+
+    if "event_date" not in fields:
+        for match in text.take(_DATE_DOT_RE):
+            day, month = int(match.group(1)), int(match.group(2))
+            if 1 <= day <= 31 and 1 <= month <= 12:
+                fields["event_date"] = f"{day} {MONTHS[month - 1]}"
+
+    kids = text.take(_KIDS_RE)
+    if kids:
+        fields["kids_count"] = int(kids[-1].group(1) or kids[-1].group(2))
+
+    adults = text.take(_ADULTS_RE)
+    if adults:
+        fields["adults_count"] = int(adults[-1].group(1) or adults[-1].group(2))
+
+    ages = text.take(_AGE_RE)
+    unclear_age = False
+    if ages:
+        if _CHILD_REF_RE.search(message):
+            fields["child_age"] = int(ages[-1].group(1))
+        else:
+            unclear_age = True
+
+    lowered = text.text.lower()
+    for room in ROOM_NAMES:
+        if room.lower() in lowered:
+            fields["room"] = room
+            fields["format"] = "Тематическая комната"
+            text.take(re.compile(re.escape(room), re.IGNORECASE))
+            lowered = text.text.lower()
+
+    if text.take(_FORMAT_RESTAURANT_RE):
+        fields["format"] = "Ресторан"
+    if text.take(_FORMAT_ROOM_RE) and "format" not in fields:
+        fields["format"] = "Тематическая комната"
+
+    names = text.take(_NAME_RE)
+    if names:
+        fields["customer_name"] = names[-1].group(1).capitalize()
+
+    words = [w.lower() for w in _WORD_RE.findall(text.text)]
+    leftover = [w for w in words if w not in FILLER_WORDS]
+
+    # "Наталья 89998887766" — одно слово рядом с телефоном и есть имя, если это известное имя
+    # или оно написано с заглавной не в начале сообщения ("звоните 8999…", "Завтра 8999…" — не имя)
+    if phones and "customer_name" not in fields and len(leftover) == 1 and _looks_like_name(leftover[0], message):
+        fields["customer_name"] = leftover[0].capitalize()
+        leftover = []
+
+    # Одиночное число без единиц ("8") — непонятно, к чему относится
+    bare_numbers = re.findall(r"\d+", text.text)
+
+    return LocalExtraction(
+        fields=fields,
+        unresolved=bool(leftover or bare_numbers or unclear_age),
+        leftover=leftover + bare_numbers
+    )
@@ -6,7 +6,7 @@
 import logging
 from datetime import datetime
 from typing import Optional
-from db import SessionLocal, Lead, Client, ClientPhone, ClientChild
+from db import SessionLocal, Lead, Client, ClientPhone, ClientChild, Message
 
 logger = logging.getLogger(__name__)
 
@@ -425,6 +425,85 @@ def update_lead_from_data(lead_id: int, data: dict) -> Lead:
         db.close()
 
 
+# Сколько ещё не разобранных сообщений клиента досылать в один ход
+MAX_PENDING_MESSAGES = 5
+
+
+def get_unextracted_messages(lead: Lead, session_id: int, before_id: int) -> list[str]:
+    """
+    Сообщения клиента после водяного знака лида (без текущего сообщения).
+    
+    Обычно список пуст: каждое сообщение разбирается в свой ход. Сообщения
+    появляются здесь, если ход оборвался раньше (кнопки, уточнения и т.п.).
+    Для нового лида водяного знака нет — старую переписку не досылаем.
+    """
+    if not lead.extracted_message_id:
+        return []
+    
+    db = SessionLocal()
+    try:
+        messages = db.query(Message).filter(
+            Message.session_id == session_id,
+            Message.role == "user",
+            Message.id > lead.extracted_message_id,
+            Message.id < before_id
+        ).order_by(Message.id.desc()).limit(MAX_PENDING_MESSAGES).all()
+        return [m.content for m in reversed(messages)]
+    finally:
+        db.close()
+
+
+def apply_lead_updates(lead: Lead, updates: dict, fallback_name: str = None, message_id: int = None) -> Lead:
+    """
+    Применить к лиду новые поля, которые модель вернула за ход диалога.
+    
+    Доп. услуги добавляются к уже сохранённым, а не заменяют их.
+    Если имя заказчика так и не известно — берём имя из профиля.
+    message_id — сообщение, на котором закончился разбор (водяной знак).
+    """
+    updates = dict(updates or {})
+    sources = {key: message_id for key in updates}
+    
+    if updates.get("extras"):
+        extras = lead.extras or []
+        if isinstance(extras, str):
+            import json
+            try:
+                extras = json.loads(extras)
+            except ValueError:
+                extras = [extras]
+        updates["extras"] = extras + [x for x in updates["extras"] if x not in extras]
+    
+    if not updates.get("customer_name") and not lead.customer_name and fallback_name:
+        updates["customer_name"] = fallback_name
+        sources["customer_name"] = "profile"
+    
+    if updates:
+        lead = update_lead_from_data(lead.id, updates) or lead
+    if message_id:
+        lead = mark_lead_extracted(lead.id, message_id, sources) or lead
+    return lead
+
+
+def mark_lead_extracted(lead_id: int, message_id: int, sources: dict = None) -> Optional[Lead]:
+    """Сдвинуть водяной знак извлечения и запомнить, откуда взяты поля."""
+    db = SessionLocal()
+    try:
+        lead = db.query(Lead).filter(Lead.id == lead_id).first()
+        if not lead:
+            return None
+        
+        if sources:
+            # JSON-колонку переприсваиваем целиком, иначе SQLAlchemy не увидит изменения
+            lead.field_sources = {**(lead.field_sources or {}), **sources}
+        lead.extracted_message_id = max(message_id, lead.extracted_message_id or 0)
+        db.commit()
+        db.refresh(lead)
+        return lead
+    finally:
+        db.close()
+
+
 def mark_lead_sent_to_manager(lead_id: int) -> bool:
     """Пометить лид как отправленный менеджеру."""
     db = SessionLocal()
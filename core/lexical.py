@@ -0,0 +1,159 @@
+"""
+Лексический поиск по базе знаний: стеммер для русского, BM25, RRF.
+
+Эмбеддинги плохо ловят точные термины («носки», «опушка»): индекс по
+словам работает рядом с векторным поиском, результаты сливаются через
+reciprocal rank fusion. Всё в памяти процесса, без внешних зависимостей;
+если эмбеддинги недоступны, поиск идёт только по словам.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Optional
+
+_WORD_RE = re.compile(r"[а-яa-z0-9]+")
+_VOWELS = "аеиоуыэюя"
+
+# Окончания по Snowball (упрощённо: без региона R2 и словообразовательных суффиксов)
+_PERFECTIVE_GERUND = re.compile(r"(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$")
+_REFLEXIVE = re.compile(r"(?:ся|сь)$")
+_ADJECTIVE = r"(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)"
+_PARTICIPLE = r"(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)"
+_ADJECTIVAL = re.compile(f"(?:{_PARTICIPLE})?{_ADJECTIVE}$")
+_VERB = re.compile(
+    r"(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)"
+    r"|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$"
+)
+_NOUN = re.compile(
+    r"(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$"
+)
+_SUPERLATIVE = re.compile(r"(?:ейше|ейш)$")
+
+# Служебные слова — в индекс не попадают
+STOP_WORDS = frozenset("""
+а без бы в во вот вы где да для до его ее ей ему если есть же за и из или им их к как ко
+когда ли либо мне мы на над не нет ни но ну о об от по под при про с со так там то тоже
+у уж что чтобы эта эти это этот я
+""".split())
+
+
+def stem(word: str) -> str:
+    """Основа русского слова (облегчённый стеммер Snowball)."""
+    word = word.replace("ё", "е")
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            prefix, rv = word[:i + 1], word[i + 1:]
+            break
+    else:
+        return word
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное
+    stripped = _PERFECTIVE_GERUND.sub("", rv, count=1)
+    if stripped == rv:
+        rv = _REFLEXIVE.sub("", rv, count=1)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            stripped = pattern.sub("", rv, count=1)
+            if stripped != rv:
+                break
+    rv = stripped
+
+    # Шаги 2 и 4: «и» на конце, превосходная степень, «нн», мягкий знак
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    rv = _SUPERLATIVE.sub("", rv, count=1)
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    elif rv.endswith("ь"):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text: str) -> list[str]:
+    """Основы значимых слов текста."""
+    return [
+        stem(word)
+        for word in _WORD_RE.findall(text.lower().replace("ё", "е"))
+        if word not in STOP_WORDS
+    ]
+
+
+class BM25Index:
+    """Инвертированный индекс с ранжированием BM25."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs: dict[str, dict] = {}              # id -> {"content", "category", "title"}
+        self._lengths: dict[str, int] = {}
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)  # терм -> {id: частота}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id: str, content: str, category: str = "", title: str = ""):
+        """Добавить (или заменить) документ. Заголовок индексируется вместе с текстом."""
+        self.remove(doc_id)
+        terms = Counter(tokenize(f"{title}\n{content}"))
+        for term, count in terms.items():
+            self._postings[term][doc_id] = count
+        length = sum(terms.values())
+        self._docs[doc_id] = {"content": content, "category": category, "title": title}
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: str):
+        if doc_id not in self._docs:
+            return
+        for term in set(tokenize(f"{self._docs[doc_id]['title']}\n{self._docs[doc_id]['content']}")):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        del self._docs[doc_id]
+
+    def search(self, query: str, n_results: int = 3, categories: Optional[list[str]] = None) -> list[dict]:
+        """
+        Документы по убыванию BM25.
+
+        Returns:
+            [{"id", "content", "category", "title", "score"}]
+        """
+        if not self._docs:
+            return []
+        n_docs = len(self._docs)
+        avg_length = self._total_length / n_docs or 1
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(
+            (doc_id for doc_id in scores if not categories or self._docs[doc_id]["category"] in categories),
+            key=lambda doc_id: -scores[doc_id]
+        )
+        return [{"id": doc_id, **self._docs[doc_id], "score": scores[doc_id]} for doc_id in ranked[:n_results]]
+
+
+def reciprocal_rank_fusion(result_lists: list[list[dict]], k: int = 60, n_results: int = 3) -> list[dict]:
+    """
+    Слить несколько ранжированных списков (по "id"): score = Σ 1 / (k + ранг).
+
+    Из повторов берётся первая встреченная запись, "score" заменяется на слитый.
+    """
+    fused: dict[str, float] = defaultdict(float)
+    docs: dict[str, dict] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            fused[doc["id"]] += 1 / (k + rank)
+            docs.setdefault(doc["id"], doc)
+    ranked = sorted(fused, key=lambda doc_id: -fused[doc_id])[:n_results]
+    return [{**docs[doc_id], "score": fused[doc_id]} for doc_id in ranked]
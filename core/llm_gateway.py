@@ -0,0 +1,432 @@
+"""
+Общий шлюз к OpenAI для агента и роутера намерений.
+
+Один пул HTTP-соединений на event loop, ограничение параллельности,
+дедлайн на запрос (вместе с повторами), повторы с экспоненциальной
+задержкой и джиттером, размыкатель цепи (circuit breaker), hedged-запросы
+против «хвостов» задержки и метрики в llm_metrics.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from config.settings import (
+    OPENAI_API_KEY,
+    EMBEDDING_MODEL,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_CONNECTIONS,
+    LLM_TIMEOUT,
+    LLM_STREAM_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_BREAKER_THRESHOLD,
+    LLM_BREAKER_COOLDOWN,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_DELAY,
+    LLM_HEDGE_MIN_DELAY,
+)
+from core.metrics import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых есть смысл повторить запрос: сеть, таймаут, 429, 5xx
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    openai.APIConnectionError,  # включая APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# База и потолок экспоненциальной задержки между повторами (сек)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# Сколько последних задержек хранить на ключ hedging и сколько нужно для перцентиля
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    """OpenAI недавно недоступен — запрос не отправлялся."""
+
+
+class QueueTimeoutError(TimeoutError):
+    """Не дождались свободного места среди LLM_MAX_CONCURRENCY запросов — запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи.
+
+    После threshold ошибок подряд цепь размыкается на cooldown секунд: запросы
+    сразу получают CircuitOpenError, а не ждут таймаута. Затем пропускается
+    один пробный запрос — успех замыкает цепь, ошибка размыкает снова.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None  # когда ушёл пробный запрос (если его отменят — через cooldown пустим новый)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос прямо сейчас."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.cooldown:
+                return False
+            if self._probe_at is not None and now - self._probe_at < self.cooldown:
+                return False
+            self._probe_at = now
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_at = None
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning(f"LLM circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """Единая точка вызова OpenAI."""
+
+    def __init__(self, client=None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 breaker: CircuitBreaker = None):
+        """
+        Args:
+            client: Готовый async-клиент (для тестов и бенчмарков). По умолчанию
+                AsyncOpenAI с общим пулом соединений.
+            max_concurrency: Максимум одновременных запросов к LLM
+            timeout: Дедлайн запроса по умолчанию (сек, включая повторы)
+            max_retries: Сколько раз повторять запрос после временной ошибки
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._client = client
+        # Клиент и семафор живут в своём event loop: VK бот крутится в отдельном потоке
+        self._loops = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Последние задержки hedged-запросов по ключу (intent)
+        self._latencies = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+
+    def _get_client(self) -> tuple:
+        """Получить (клиент, семафор) для текущего event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.get(loop)
+            if state is None:
+                client = self._client
+                if client is None:
+                    http_client = httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=LLM_MAX_CONNECTIONS
+                        )
+                    )
+                    # Повторы делает шлюз (с общим дедлайном), у SDK свои отключены
+                    client = AsyncOpenAI(
+                        api_key=OPENAI_API_KEY,
+                        http_client=http_client,
+                        timeout=self.timeout,
+                        max_retries=0
+                    )
+                state = (client, asyncio.Semaphore(self.max_concurrency))
+                self._loops[loop] = state
+        return state
+
+    def _backoff(self, attempt: int) -> float:
+        """Задержка перед повтором: экспонента с полным джиттером."""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    async def _acquire(semaphore: asyncio.Semaphore, operation: str, deadline: float):
+        """
+        Занять место среди одновременных запросов до дедлайна.
+
+        Переполненная очередь — наша нагрузка, а не сбой OpenAI: размыкатель
+        цепи не трогаем и не повторяем.
+        """
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+        except TimeoutError:
+            llm_metrics.record_error(operation, "queue_timeout")
+            raise QueueTimeoutError(f"LLM queue is full ({operation})") from None
+
+    async def _call(self, operation: str, request, timeout: float = None, semaphore=None):
+        """
+        Выполнить request() с дедлайном, повторами и размыкателем цепи.
+
+        request — функция без аргументов, возвращающая корутину запроса.
+        semaphore — если передан, каждая попытка выполняется под ним.
+        Ожидание в очереди входит в дедлайн, но его таймаут (QueueTimeoutError)
+        не считается ошибкой OpenAI.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            # Разомкнутая цепь — отказ сразу, без ожидания в очереди
+            if self.breaker.state == "open":
+                llm_metrics.record_error(operation, "circuit_open")
+                raise CircuitOpenError("OpenAI временно недоступен")
+            if semaphore is not None:
+                await self._acquire(semaphore, operation, deadline)
+            try:
+                if not self.breaker.allow():
+                    llm_metrics.record_error(operation, "circuit_open")
+                    raise CircuitOpenError("OpenAI временно недоступен")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    llm_metrics.record_error(operation, "queue_timeout")
+                    raise QueueTimeoutError(f"LLM queue is full ({operation})")
+                result = await asyncio.wait_for(request(), remaining)
+            except (CircuitOpenError, QueueTimeoutError):
+                raise
+            except RETRYABLE_ERRORS as e:
+                self.breaker.failure()
+                delay = self._backoff(attempt)
+                attempt += 1
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    llm_metrics.record_error(operation, type(e).__name__)
+                    raise
+                llm_metrics.record_retry(operation)
+                logger.warning(f"LLM {operation} failed ({type(e).__name__}), retry {attempt} in {delay:.2f}s")
+            except Exception as e:
+                # 400/401 и т.п. — повтор не поможет, но и OpenAI при этом жив
+                self.breaker.success()
+                llm_metrics.record_error(operation, type(e).__name__)
+                raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                # Место в очереди не держим, пока ждём перед повтором
+                if semaphore is not None:
+                    semaphore.release()
+            await asyncio.sleep(delay)
+
+    async def chat(self, operation: str, timeout: float = None, **kwargs):
+        """Запрос к chat completions с учётом токенов и задержки."""
+        client, semaphore = self._get_client()
+        start = time.perf_counter()
+        response = await self._call(
+            operation,
+            lambda: client.chat.completions.create(**kwargs),
+            timeout,
+            semaphore
+        )
+        llm_metrics.record(operation, getattr(response, "usage", None), time.perf_counter() - start)
+        return response
+
+    def hedge_delay(self, key: str) -> float:
+        """Через сколько секунд дублировать запрос: перцентиль недавних задержек."""
+        with self._lock:
+            samples = sorted(self._latencies[key])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        index = min(len(samples) - 1, int(LLM_HEDGE_PERCENTILE * len(samples)))
+        return max(LLM_HEDGE_MIN_DELAY, samples[index])
+
+    async def hedged_chat(self, operation: str, hedge_key: str, fallback_model: str = None, **kwargs):
+        """
+        Chat completions с дублированием медленного запроса.
+
+        Если основной запрос не ответил за hedge_delay(hedge_key), отправляется
+        второй (на fallback_model, если задана) и берётся ответ, пришедший
+        первым; проигравший запрос отменяется.
+        """
+        start = time.perf_counter()
+        primary = asyncio.create_task(self.chat(operation, **kwargs))
+        tasks = {primary}
+        hedge = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(hedge_key))
+            if not done:
+                hedge_kwargs = {**kwargs, "model": fallback_model or kwargs.get("model")}
+                hedge = asyncio.create_task(self.chat(f"{operation}_hedge", **hedge_kwargs))
+                tasks.add(hedge)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Ошибка одного из запросов не страшна, пока жив второй
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    break
+            else:
+                raise primary.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        with self._lock:
+            self._latencies[hedge_key].append(time.perf_counter() - start)
+        llm_metrics.record_hedge(hedge_key, hedged=hedge is not None, hedge_won=winner is hedge)
+        return winner.result()
+
+    async def stream(self, operation: str, timeout: float = None, read_timeout: float = LLM_STREAM_TIMEOUT, **kwargs):
+        """
+        Потоковый запрос: отдаёт куски текста, usage берётся из последнего чанка.
+
+        Повторяется только открытие потока (дедлайн timeout) — после первого
+        куска текста повтор задублировал бы ответ у пользователя. На весь
+        поток, включая открытие, — дедлайн read_timeout: зависший поток не
+        держит место в очереди бесконечно.
+        """
+        client, semaphore = self._get_client()
+        usage = None
+        start = time.perf_counter()
+        open_deadline = time.monotonic() + (timeout or self.timeout)
+        read_deadline = time.monotonic() + read_timeout
+        await self._acquire(semaphore, operation, open_deadline)
+        try:
+            stream = await self._call(
+                operation,
+                lambda: client.chat.completions.create(
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **kwargs
+                ),
+                open_deadline - time.monotonic()
+            )
+            chunks = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), read_deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            except RETRYABLE_ERRORS as e:
+                self.breaker.failure()
+                llm_metrics.record_error(operation, type(e).__name__)
+                raise
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+        finally:
+            semaphore.release()
+        llm_metrics.record(operation, usage, time.perf_counter() - start)
+
+    async def hedged_stream(self, operation: str, hedge_key: str, fallback_model: str = None, **kwargs):
+        """
+        Потоковый запрос с дублированием по времени до первого куска.
+
+        Если поток не отдал первый кусок за hedge_delay(hedge_key), открывается
+        второй (на fallback_model, если задана); дальше читается тот, что
+        заговорил первым, второй закрывается. До первого куска пользователь
+        ничего не видел — дубля в ответе не будет.
+        """
+        start = time.perf_counter()
+        streams = {}
+
+        def open_stream(name: str, **overrides):
+            generator = self.stream(name, **{**kwargs, **overrides})
+            streams[asyncio.ensure_future(generator.__anext__())] = generator
+
+        open_stream(operation)
+        primary = next(iter(streams))
+        hedge = None
+        winner = None
+        try:
+            done, _ = await asyncio.wait(set(streams), timeout=self.hedge_delay(hedge_key))
+            if not done:
+                open_stream(f"{operation}_hedge", model=fallback_model or kwargs.get("model"))
+                hedge = next(task for task in streams if task is not primary)
+
+            pending = set(streams)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Ошибка одного потока не страшна, пока жив второй; пустой поток — тоже ответ
+                winner = next(
+                    (task for task in done if task.exception() is None or isinstance(task.exception(), StopAsyncIteration)),
+                    None
+                )
+            if winner is None:
+                raise primary.exception()
+        finally:
+            for task, generator in streams.items():
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await generator.aclose()
+
+        with self._lock:
+            self._latencies[hedge_key].append(time.perf_counter() - start)
+        llm_metrics.record_hedge(hedge_key, hedged=hedge is not None, hedge_won=winner is hedge)
+
+        if isinstance(winner.exception(), StopAsyncIteration):
+            return
+        try:
+            yield winner.result()
+            async for delta in streams[winner]:
+                yield delta
+        finally:
+            await streams[winner].aclose()
+
+    async def embed(self, text: str, timeout: float = None) -> list[float]:
+        """Эмбеддинг текста (та же модель, что и в RAG)."""
+        client, semaphore = self._get_client()
+        start = time.perf_counter()
+        response = await self._call(
+            "embed",
+            lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=text),
+            timeout,
+            semaphore
+        )
+        llm_metrics.record("embed", getattr(response, "usage", None), time.perf_counter() - start)
+        return response.data[0].embedding
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+            "hedge_delays": {key: round(self.hedge_delay(key), 3) for key in list(self._latencies)},
+        }
+
+
+# Глобальный шлюз LLM
+llm_gateway = LLMGateway()
@@ -0,0 +1,122 @@
+"""
+Мультишаблонный матчер: много коротких регулярок за один проход по тексту.
+
+Списки триггеров (intent_router, флаги диалога) раньше проверялись по одному:
+на каждое сообщение — десятки re.search. Здесь все шаблоны один раз
+собираются в префиксное дерево (общие начала вроде "мероприя"/"меропри"
+проверяются один раз) и компилируются в одну регулярку, которая
+проходит текст за один раз и сообщает, какие именно шаблоны совпали.
+
+Семантика та же, что у `any(re.search(p, text) for p in patterns)` по
+каждому шаблону: шаблон считается совпавшим, если он находится хоть где-то
+в тексте, в т.ч. когда шаблоны перекрываются или начинаются в одной позиции.
+"""
+
+import re
+
+# Атом шаблона: экранированный символ, класс [...] или обычный символ + квантификатор
+_ATOM_RE = re.compile(r'(?:\\.|\[(?:\\.|[^\]])*\]|[^\\\[(|)])(?:[*+?]|\{\d*,?\d*\})?\??')
+
+
+def _atoms(pattern: str) -> list[str]:
+    """Разбить шаблон на атомы для префиксного дерева.
+
+    Шаблоны с группами и альтернативами в дереве не разбираются —
+    они идут одним непрозрачным атомом.
+    """
+    atoms = _ATOM_RE.findall(pattern)
+    if "".join(atoms) != pattern:
+        return [f"(?:{pattern})"]
+    return atoms
+
+
+def _build_trie(items: list[tuple[int, list[str]]]) -> dict:
+    root = {}
+    for index, atoms in items:
+        node = root
+        for atom in atoms:
+            node = node.setdefault(atom, {})
+        node.setdefault(None, []).append(index)
+    return root
+
+
+def _trie_order(node: dict) -> list[int]:
+    """Порядок, в котором регулярка из дерева перебирает шаблоны."""
+    order = list(node.get(None, []))
+    for atom, child in node.items():
+        if atom is not None:
+            order += _trie_order(child)
+    return order
+
+
+def _render(node: dict) -> str:
+    """Дерево → регулярка; конец шаблона помечен пустой группой (?P<pN>)."""
+    branches = [f"(?P<p{index}>)" for index in node.get(None, [])]
+    for atom, child in node.items():
+        if atom is not None:
+            branches.append(atom + _render(child))
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class MultiPatternMatcher:
+    """
+    Набор именованных списков шаблонов, проверяемых за один проход.
+
+    Пример:
+        matcher = MultiPatternMatcher({"birthday": [r'\\bдр\\b', r'праздник'], "general": [r'цен[аыу]']})
+        matcher.match("сколько цена праздника")  # {"birthday": ["праздник"], "general": ["цен[аыу]"]}
+
+    Шаблоны не должны содержать именованных групп.
+    """
+
+    def __init__(self, patterns: dict[str, list[str]], flags: int = 0):
+        self._entries = []  # индекс шаблона → (метка, шаблон)
+        items = []
+        for label, label_patterns in patterns.items():
+            for pattern in label_patterns:
+                items.append((len(self._entries), _atoms(pattern)))
+                self._entries.append((label, pattern))
+        self._labels = list(patterns)
+
+        atoms = dict(items)
+        order = _trie_order(_build_trie(items))
+        # Просмотр с забеганием вперёд: после совпадения сдвигаемся на 1 символ,
+        # поэтому шаблоны, начинающиеся внутри найденного, тоже находятся
+        self._scan = re.compile("(?=" + _render(_build_trie([(i, atoms[i]) for i in order])) + ")", flags)
+        # Для каждого шаблона — регулярка из шаблонов, идущих после него в порядке
+        # перебора: ею ищем остальные совпадения, начинающиеся в той же позиции
+        self._rest = {}
+        for position, index in enumerate(order):
+            rest = order[position + 1:]
+            self._rest[index] = re.compile(_render(_build_trie([(i, atoms[i]) for i in rest])), flags) if rest else None
+
+    @classmethod
+    def from_keywords(cls, keywords: dict[str, list[str]], flags: int = 0) -> "MultiPatternMatcher":
+        """Матчер для подстрок (аналог `any(kw in text for kw in keywords)`)."""
+        return cls({label: [re.escape(kw) for kw in words] for label, words in keywords.items()}, flags)
+
+    def match(self, text: str) -> dict[str, list[str]]:
+        """Совпавшие шаблоны по меткам (в порядке исходных списков); метки без совпадений опускаются."""
+        found = set()
+        for match in self._scan.finditer(text):
+            index = int(match.lastgroup[1:])
+            start = match.start()
+            while True:
+                found.add(index)
+                rest = self._rest[index]
+                match = rest.match(text, start) if rest else None
+                if not match:
+                    break
+                index = int(match.lastgroup[1:])
+
+        result = {}
+        for index in sorted(found):
+            label, pattern = self._entries[index]
+            result.setdefault(label, []).append(pattern)
+        return result
+
+    def labels(self, text: str) -> set[str]:
+        """Только метки, у которых есть хоть одно совпадение."""
+        return set(self.match(text))
@@ -0,0 +1,124 @@
+"""Метрики вызовов LLM: токены (в т.ч. закешированные провайдером), задержки и ошибки."""
+
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Границы корзин гистограммы задержек (сек); последняя корзина — всё, что дольше
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+_BUCKET_LABELS = [f"<={bound:g}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]:g}s"]
+
+
+class LLMMetrics:
+    """
+    Счётчики по каждой операции агента (response, stream, turn, extract...).
+
+    cached_tokens — часть prompt_tokens, которую OpenAI взял из кеша префикса
+    (usage.prompt_tokens_details.cached_tokens). По доле закешированных
+    токенов видно, работает ли раскладка промпта «статичный префикс первым».
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "latency_total": 0.0,
+            "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            "retries": 0,
+            "errors": defaultdict(int),
+        })
+        # Hedged-запросы по намерениям: сколько всего, сколько продублировано, сколько раз дубль победил
+        self._hedges = defaultdict(lambda: {"requests": 0, "hedged": 0, "hedge_wins": 0})
+
+    def record(self, operation: str, usage, latency: float = None):
+        """Записать usage из ответа OpenAI (если провайдер его вернул)."""
+        with self._lock:
+            stats = self._stats[operation]
+            stats["calls"] += 1
+            if latency is not None:
+                stats["latency_total"] += latency
+                stats["latency_buckets"][bisect_left(LATENCY_BUCKETS, latency)] += 1
+            if usage is None:
+                return
+            details = getattr(usage, "prompt_tokens_details", None)
+            stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            stats["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+            stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def record_retry(self, operation: str):
+        """Повторная попытка запроса (после таймаута, 429 или 5xx)."""
+        with self._lock:
+            self._stats[operation]["retries"] += 1
+
+    def record_error(self, operation: str, kind: str):
+        """Запрос окончательно не удался (kind — имя исключения или circuit_open)."""
+        with self._lock:
+            self._stats[operation]["errors"][kind] += 1
+
+    def record_hedge(self, key: str, hedged: bool, hedge_won: bool):
+        """Итог hedged-запроса (key — обычно intent)."""
+        with self._lock:
+            stats = self._hedges[key]
+            stats["requests"] += 1
+            stats["hedged"] += hedged
+            stats["hedge_wins"] += hedge_won
+
+    def hedge_summary(self) -> dict:
+        """Доля продублированных запросов и доля побед дубля по намерениям."""
+        with self._lock:
+            return {
+                key: {
+                    **stats,
+                    "hedge_rate": round(stats["hedged"] / stats["requests"], 3) if stats["requests"] else 0.0,
+                    "win_rate": round(stats["hedge_wins"] / stats["hedged"], 3) if stats["hedged"] else 0.0,
+                }
+                for key, stats in self._hedges.items()
+            }
+
+    @staticmethod
+    def _percentile(buckets: list[int], q: float) -> float | None:
+        """Оценка перцентиля по гистограмме (верхняя граница корзины)."""
+        total = sum(buckets)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    def summary(self) -> dict:
+        """Сводка по операциям: токены, задержки (среднее, p50/p95, гистограмма) и ошибки."""
+        with self._lock:
+            result = {}
+            for operation, stats in self._stats.items():
+                prompt = stats["prompt_tokens"]
+                result[operation] = {
+                    "calls": stats["calls"],
+                    "prompt_tokens": prompt,
+                    "cached_tokens": stats["cached_tokens"],
+                    "uncached_tokens": prompt - stats["cached_tokens"],
+                    "completion_tokens": stats["completion_tokens"],
+                    "cached_ratio": round(stats["cached_tokens"] / prompt, 3) if prompt else 0.0,
+                    "avg_latency": round(stats["latency_total"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                    "p50_latency": self._percentile(stats["latency_buckets"], 0.5),
+                    "p95_latency": self._percentile(stats["latency_buckets"], 0.95),
+                    "latency_histogram": dict(zip(_BUCKET_LABELS, stats["latency_buckets"])),
+                    "retries": stats["retries"],
+                    "errors": dict(stats["errors"]),
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._hedges.clear()
+
+
+# Глобальные метрики LLM
+llm_metrics = LLMMetrics()
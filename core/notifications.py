@@ -2,8 +2,10 @@
 import os
 import aiohttp
 import logging
+from dataclasses import dataclass
 from datetime import datetime
 
+from core.matcher import MultiPatternMatcher
 from core.utils import format_phone
 
 logger = logging.getLogger(__name__)
@@ -111,57 +113,57 @@ def format_escalation_message(platform: str, user_id: str, username: str, user_n
     return msg
 
 
+# Просьбы позвать живого человека
+ESCALATION_KEYWORDS = [
+    "живой человек", "живого человека", "живому человеку",
+    "живой менеджер", "живого менеджера",
+    "оператор", "оператора",
+    "позвоните мне", "позвони мне", "перезвоните",
+    "свяжитесь со мной", "свяжись со мной",
+    "хочу поговорить с человеком",
+    "можно менеджера", "дайте менеджера",
+    "соедините с менеджером", "соединить с менеджером",
+    "не бот", "не робот", "реальный человек",
+    "срочно", "жалоба", "претензия", "недоволен",
+]
+
+
 def needs_human_escalation(message: str) -> bool:
     """Проверить, просит ли пользователь живого человека."""
-    message_lower = message.lower()
-    
-    escalation_keywords = [
-        "живой человек", "живого человека", "живому человеку",
-        "живой менеджер", "живого менеджера",
-        "оператор", "оператора",
-        "позвоните мне", "позвони мне", "перезвоните",
-        "свяжитесь со мной", "свяжись со мной",
-        "хочу поговорить с человеком",
-        "можно менеджера", "дайте менеджера",
-        "соедините с менеджером", "соединить с менеджером",
-        "не бот", "не робот", "реальный человек",
-        "срочно", "жалоба", "претензия", "недоволен",
-    ]
-    
-    return any(kw in message_lower for kw in escalation_keywords)
+    return detect_flow_flags(message).human_escalation
+
+
+# Просьбы изменить/отменить бронирование
+BOOKING_CHANGE_KEYWORDS = [
+    # Перенос/изменение даты
+    "перенести", "перенос", "сменить дату", "изменить дату",
+    "другую дату", "другой день", "передвинуть",
+    # Изменение времени
+    "изменить время", "другое время", "сменить время",
+    # Отмена
+    "отменить", "отмена", "отказаться", "не приедем", "не придём", "не придем",
+    "аннулировать", "возврат",
+    # Изменение гостей
+    "изменить количество", "больше гостей", "меньше гостей",
+    "добавить детей", "убрать детей",
+    # Изменение услуг
+    "добавить аниматора", "убрать аниматора", "добавить торт",
+    "изменить меню", "поменять комнату",
+    # Общие
+    "хочу изменить", "можно изменить", "нужно изменить",
+    "хотел бы изменить", "хотела бы изменить",
+    # Контекст бронирования
+    "изменить бронь", "изменить бронирование",
+    "поменять бронь", "поменять бронирование",
+    "отменить бронь", "отменить бронирование",
+    # Запросы с "время"/"дату" + "бронирования"
+    "время бронирования", "дату бронирования",
+]
 
 
 def needs_booking_change_request(message: str) -> bool:
     """Проверить, просит ли пользователь изменить/отменить бронирование."""
-    message_lower = message.lower()
-    
-    change_keywords = [
-        # Перенос/изменение даты
-        "перенести", "перенос", "сменить дату", "изменить дату",
-        "другую дату", "другой день", "передвинуть",
-        # Изменение времени
-        "изменить время", "другое время", "сменить время",
-        # Отмена
-        "отменить", "отмена", "отказаться", "не приедем", "не придём", "не придем",
-        "аннулировать", "возврат",
-        # Изменение гостей
-        "изменить количество", "больше гостей", "меньше гостей",
-        "добавить детей", "убрать детей",
-        # Изменение услуг
-        "добавить аниматора", "убрать аниматора", "добавить торт",
-        "изменить меню", "поменять комнату",
-        # Общие
-        "хочу изменить", "можно изменить", "нужно изменить",
-        "хотел бы изменить", "хотела бы изменить",
-        # Контекст бронирования
-        "изменить бронь", "изменить бронирование",
-        "поменять бронь", "поменять бронирование",
-        "отменить бронь", "отменить бронирование",
-        # Запросы с "время"/"дату" + "бронирования"
-        "время бронирования", "дату бронирования",
-    ]
-    
-    return any(kw in message_lower for kw in change_keywords)
+    return detect_flow_flags(message).booking_change
 
 
 def get_booking_change_type(message: str) -> str:
@@ -222,51 +224,51 @@ def format_booking_change_message(
     return msg
 
 
+# ИСКЛЮЧЕНИЯ: если есть контекст покупки/приобретения — это НЕ потеряшки
+LOST_BUY_CONTEXT = [
+    "купить", "приобрести", "продаёте", "продаете", "продаётся", "продается",
+    "можно ли купить", "у вас можно", "у вас есть",
+    "где купить", "сколько стоит", "стоимость", "цена",
+    "едем в парк", "идём в парк", "идем в парк", "собираемся в парк",
+    "взять с собой", "нужно ли брать", "надо брать",
+]
+
+# Явные триггеры потери (всегда срабатывают)
+LOST_STRONG_KEYWORDS = [
+    "потерял", "потеряла", "потеряли",
+    "пропало", "пропала", "пропали",
+    "утерян", "утеряна", "утеряно",
+    "бюро находок", "потерянные вещи",
+    "потеряшка", "потеряшки",
+    "не могу найти", "не нашёл", "не нашла",
+]
+
+# Слабые триггеры (забыл/оставил) — требуют контекст потери
+LOST_WEAK_KEYWORDS = [
+    "забыл", "забыла", "забыли",
+    "оставил", "оставила", "оставили",
+]
+LOST_CONTEXT = [
+    "в парке", "у вас", "в комнате", "на аттракционе", "в ресторане",
+    "вчера", "сегодня", "неделю назад", "в выходные",
+    "найти", "верните", "где мой", "где моя", "где мои",
+    "вещь", "сумку", "телефон", "кошелёк", "кошелек", "куртку", "очки",
+]
+
+# Выход из опроса потеряшек («я не про это», «стоп»)
+LOST_EXIT_KEYWORDS = [
+    "ничего не потерял", "ничего не потеряла", "ничего не теряла", "ничего не терял",
+    "не потерял", "не потеряла", "не теряла", "не терял",
+    "я не про это", "я о другом", "хотел спросить", "хотела спросить",
+    "я спрашиваю", "речь не об этом", "не об этом",
+    "отмена", "стоп", "хватит", "выход", "exit", "cancel",
+    "можно купить", "где купить", "продаёте", "продаете",
+]
+
+
 def needs_lost_item_flow(message: str) -> bool:
     """Проверить, сообщает ли пользователь о потерянной вещи."""
-    message_lower = message.lower()
-    
-    # ИСКЛЮЧЕНИЯ: если есть контекст покупки/приобретения — это НЕ потеряшки
-    buy_context = [
-        "купить", "приобрести", "продаёте", "продаете", "продаётся", "продается",
-        "можно ли купить", "у вас можно", "у вас есть",
-        "где купить", "сколько стоит", "стоимость", "цена",
-        "едем в парк", "идём в парк", "идем в парк", "собираемся в парк",
-        "взять с собой", "нужно ли брать", "надо брать",
-    ]
-    if any(kw in message_lower for kw in buy_context):
-        return False
-    
-    # Явные триггеры потери (всегда срабатывают)
-    strong_lost_keywords = [
-        "потерял", "потеряла", "потеряли",
-        "пропало", "пропала", "пропали",
-        "утерян", "утеряна", "утеряно",
-        "бюро находок", "потерянные вещи",
-        "потеряшка", "потеряшки",
-        "не могу найти", "не нашёл", "не нашла",
-    ]
-    if any(kw in message_lower for kw in strong_lost_keywords):
-        return True
-    
-    # Слабые триггеры (забыл/оставил) — требуют контекст потери
-    weak_lost_keywords = [
-        "забыл", "забыла", "забыли",
-        "оставил", "оставила", "оставили",
-    ]
-    lost_context = [
-        "в парке", "у вас", "в комнате", "на аттракционе", "в ресторане",
-        "вчера", "сегодня", "неделю назад", "в выходные",
-        "найти", "верните", "где мой", "где моя", "где мои",
-        "вещь", "сумку", "телефон", "кошелёк", "кошелек", "куртку", "очки",
-    ]
-    
-    if any(kw in message_lower for kw in weak_lost_keywords):
-        # Проверяем контекст
-        if any(ctx in message_lower for ctx in lost_context):
-            return True
-    
-    return False
+    return detect_flow_flags(message).lost_item
 
 
 def format_lost_item_message(
@@ -310,41 +312,41 @@ def format_lost_item_message(
 
 # ============ ФУНКЦИОНАЛ ФОТОГРАФИЙ ============
 
+# Вопросы о готовых фотографиях с мероприятия
+PHOTO_REQUEST_KEYWORDS = [
+    # Получение фото
+    "фото отда", "фотографии отда", "когда фото", "где фото",
+    "фото не приш", "фотографии не приш", "не прислали фото",
+    "обещали фото", "ждём фото", "ждем фото",
+    # Фотограф снимал
+    "снимал фотограф", "фотограф снимал", "нас снимал",
+    "был фотограф", "фотографировал", "фотографировали",
+    # Вопросы о готовых фото
+    "фото готов", "фотографии готов", "получить фото",
+    "забрать фото", "прислать фото",
+]
+
+
 def needs_photo_request(message: str) -> bool:
     """Проверить, спрашивает ли клиент о получении фотографий с мероприятия."""
-    message_lower = message.lower()
-    
-    request_keywords = [
-        # Получение фото
-        "фото отда", "фотографии отда", "когда фото", "где фото",
-        "фото не приш", "фотографии не приш", "не прислали фото",
-        "обещали фото", "ждём фото", "ждем фото",
-        # Фотограф снимал
-        "снимал фотограф", "фотограф снимал", "нас снимал",
-        "был фотограф", "фотографировал", "фотографировали",
-        # Вопросы о готовых фото
-        "фото готов", "фотографии готов", "получить фото",
-        "забрать фото", "прислать фото",
-    ]
-    
-    return any(kw in message_lower for kw in request_keywords)
+    return detect_flow_flags(message).photo_request
+
+
+# Заказ фотографа/фотосессии
+PHOTO_ORDER_KEYWORDS = [
+    # Заказ фотографа
+    "заказать фотограф", "закажу фотограф", "хочу фотограф",
+    "нужен фотограф", "можно фотограф", "есть фотограф",
+    # Фотосессия
+    "фотосессия", "фотосессию", "фотосъёмка", "фотосъемка",
+    # Цена
+    "сколько стоит фотограф", "цена фотограф", "стоимость фотограф",
+]
 
 
 def needs_photo_order(message: str) -> bool:
     """Проверить, хочет ли клиент заказать фотографа/фотосессию."""
-    message_lower = message.lower()
-    
-    order_keywords = [
-        # Заказ фотографа
-        "заказать фотограф", "закажу фотограф", "хочу фотограф",
-        "нужен фотограф", "можно фотограф", "есть фотограф",
-        # Фотосессия
-        "фотосессия", "фотосессию", "фотосъёмка", "фотосъемка",
-        # Цена
-        "сколько стоит фотограф", "цена фотограф", "стоимость фотограф",
-    ]
-    
-    return any(kw in message_lower for kw in order_keywords)
+    return detect_flow_flags(message).photo_order
 
 
 def format_photo_request_message(
@@ -418,26 +420,26 @@ def format_photo_order_message(
 
 # ============ ФУНКЦИОНАЛ ПРЕДЛОЖЕНИЙ О СОТРУДНИЧЕСТВЕ ============
 
+# Предложения о сотрудничестве
+PARTNERSHIP_KEYWORDS = [
+    # Сотрудничество
+    "сотрудничеств", "партнёр", "партнер",
+    "предложение для вас", "предложить вам",
+    "с кем связаться", "кому предложить",
+    # Реклама
+    "рекламн", "продвижени", "маркетинг",
+    # B2B
+    "коммерческое предложение", "ком предложение",
+    "проведение мероприятия", "корпоратив",
+    "услуги для парка", "услуги парку",
+    # Поставщики
+    "поставщик", "поставка", "закупка",
+]
+
+
 def needs_partnership_proposal(message: str) -> bool:
     """Проверить, предлагает ли клиент сотрудничество/партнёрство."""
-    message_lower = message.lower()
-    
-    proposal_keywords = [
-        # Сотрудничество
-        "сотрудничеств", "партнёр", "партнер",
-        "предложение для вас", "предложить вам",
-        "с кем связаться", "кому предложить",
-        # Реклама
-        "рекламн", "продвижени", "маркетинг",
-        # B2B
-        "коммерческое предложение", "ком предложение",
-        "проведение мероприятия", "корпоратив",
-        "услуги для парка", "услуги парку",
-        # Поставщики
-        "поставщик", "поставка", "закупка",
-    ]
-    
-    return any(kw in message_lower for kw in proposal_keywords)
+    return detect_flow_flags(message).partnership
 
 
 def format_partnership_message(
@@ -473,3 +475,49 @@ def format_partnership_message(
         f"🕒 <i>{datetime.now().strftime('%d.%m.%Y %H:%M')}</i>"
     )
     return msg
+
+
+# ============ ОБЩИЙ ДЕТЕКТОР СЦЕНАРИЕВ ============
+
+@dataclass(frozen=True)
+class FlowFlags:
+    """Какие сценарии диалога запускает сообщение (считается один раз на сообщение)."""
+    lost_item: bool = False         # сообщили о потерянной вещи
+    lost_exit: bool = False         # просят выйти из опроса потеряшек
+    human_escalation: bool = False  # просят живого менеджера
+    booking_change: bool = False    # хотят изменить/отменить бронь
+    photo_order: bool = False       # хотят заказать фотографа
+    photo_request: bool = False     # спрашивают про готовые фото
+    partnership: bool = False       # предлагают сотрудничество
+
+
+# Все списки ключевых слов — в одном матчере: одно сканирование вместо десятка any(...)
+FLOW_MATCHER = MultiPatternMatcher.from_keywords({
+    "lost_buy": LOST_BUY_CONTEXT,
+    "lost_strong": LOST_STRONG_KEYWORDS,
+    "lost_weak": LOST_WEAK_KEYWORDS,
+    "lost_context": LOST_CONTEXT,
+    "lost_exit": LOST_EXIT_KEYWORDS,
+    "human_escalation": ESCALATION_KEYWORDS,
+    "booking_change": BOOKING_CHANGE_KEYWORDS,
+    "photo_order": PHOTO_ORDER_KEYWORDS,
+    "photo_request": PHOTO_REQUEST_KEYWORDS,
+    "partnership": PARTNERSHIP_KEYWORDS,
+})
+
+
+def detect_flow_flags(message: str) -> FlowFlags:
+    """Проверить сообщение на все триггеры сценариев за один проход."""
+    found = FLOW_MATCHER.labels(message.lower())
+    lost_item = "lost_buy" not in found and (
+        "lost_strong" in found or ("lost_weak" in found and "lost_context" in found)
+    )
+    return FlowFlags(
+        lost_item=lost_item,
+        lost_exit="lost_exit" in found,
+        human_escalation="human_escalation" in found,
+        booking_change="booking_change" in found,
+        photo_order="photo_order" in found,
+        photo_request="photo_request" in found,
+        partnership="partnership" in found,
+    )
@@ -1,46 +1,231 @@
 """RAG система — поиск по базе знаний."""
 
+import asyncio
+import hashlib
+import json
 import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import chromadb
 from chromadb.utils import embedding_functions
 
-from config.settings import KNOWLEDGE_DIR, BASE_DIR
+from config.settings import (
+    KNOWLEDGE_DIR,
+    BASE_DIR,
+    EMBEDDING_MODEL,
+    RAG_EMBED_BATCH_TOKENS,
+    RAG_EMBED_CONCURRENCY,
+    RAG_BACKEND,
+    RAG_NUMPY_MMAP,
+    RAG_HYBRID_ENABLED,
+    RAG_HYBRID_CANDIDATES,
+    RAG_RRF_K,
+    RAG_CONTEXT_CACHE_SIZE,
+    RAG_CONTEXT_CACHE_TTL,
+    RAG_INDEX_KEEP_VERSIONS,
+)
+from core.cache import TTLCache
+from core.chunking import chunk_text
+from core.context_budget import ContextBudget, select_context, format_context
+from core.embedding_cache import CachedEmbeddings, EmbeddingCache, embedding_cache
+from core.lexical import BM25Index, reciprocal_rank_fusion
+from core.utils import estimate_tokens
+from core.vector_store import VectorStore, ChromaVectorStore, NumpyVectorStore
+
+# Категории базы знаний (подпапки knowledge/<park_id>/)
+KNOWLEDGE_CATEGORIES = ["general", "birthday", "shared", "events", "services"]
+
+# Какие категории искать для намерения (остальные intent — по всей базе)
+INTENT_CATEGORIES = {
+    "birthday": ["birthday", "shared", "services"],
+    "general": ["general", "shared", "services"],
+}
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s-]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Запрос для ключа кеша: регистр, ё, пунктуация и лишние пробелы не важны."""
+    query = _PUNCTUATION_RE.sub(" ", query.lower().replace("ё", "е"))
+    return _SPACES_RE.sub(" ", query).strip()
 
 
 class RAGSystem:
-    """Система поиска по базе знаний с ChromaDB."""
+    """Система поиска по базе знаний (ChromaDB или матрица NumPy)."""
     
-    def __init__(self, park_id: str = "nn"):
+    def __init__(self, park_id: str = "nn", persist_dir: Path = None, embedding_fn=None,
+                 cache: EmbeddingCache = None, backend: str = RAG_BACKEND, hybrid: bool = RAG_HYBRID_ENABLED):
+        """
+        Args:
+            park_id: Парк (папка knowledge/<park_id>)
+            persist_dir: Папка индекса (по умолчанию data/chroma)
+            embedding_fn: Функция эмбеддингов (для тестов и бенчмарков).
+                По умолчанию OpenAI EMBEDDING_MODEL.
+            cache: Дисковый кеш эмбеддингов. Для OpenAI по умолчанию
+                глобальный embedding_cache, для своей функции — без кеша.
+            backend: Хранилище векторов: "chroma" или "numpy"
+            hybrid: Искать и по эмбеддингам, и по словам (BM25), сливая через RRF
+        """
         self.park_id = park_id
         
-        # Инициализируем ChromaDB
-        persist_dir = BASE_DIR / "data" / "chroma"
+        persist_dir = persist_dir or BASE_DIR / "data" / "chroma"
         persist_dir.mkdir(parents=True, exist_ok=True)
         
-        self.client = chromadb.PersistentClient(path=str(persist_dir))
-        
         # Используем OpenAI embeddings
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=openai_api_key,
-            model_name="text-embedding-3-small"
-        )
+        if embedding_fn is None:
+            embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                model_name=EMBEDDING_MODEL
+            )
+            cache = embedding_cache if cache is None else cache
+            self.embedding_model = EMBEDDING_MODEL
+        else:
+            self.embedding_model = embedding_fn.name() if hasattr(embedding_fn, "name") else type(embedding_fn).__name__
+        self.embedding_fn = embedding_fn
+        # Эмбеддинги считаем сами (коллекции отдаём готовые векторы): повторные
+        # запросы и неизменённые чанки берутся из дискового кеша
+        self.embed = CachedEmbeddings(embedding_fn, cache, self.embedding_model) if cache is not None else embedding_fn
         
-        # Получаем или создаём коллекцию
-        self.collection = self.client.get_or_create_collection(
-            name=f"knowledge_{park_id}",
-            embedding_function=self.embedding_fn,
-            metadata={"park_id": park_id}
-        )
+        self.backend = backend
+        self.persist_dir = persist_dir
+        self.index_name = self._index_base_name(backend)
+        # Указатель на активную версию индекса (rebuild() собирает новую и переключает его);
+        # без указателя — коллекция без версии, как до blue/green
+        self.pointer_path = persist_dir / f"active_{self.index_name}.json"
+        self._pointer_version = self._pointer_stat()
+        self._switch_lock = threading.Lock()
+        self.store = self._open_store(self._read_pointer().get("active", self.index_name))
+        
+        # Лексический индекс (BM25) строится из хранилища при первом поиске
+        self.hybrid = hybrid
+        self._lexical = None
+        self._lexical_version = None
+        self._lexical_lock = threading.Lock()
+        
+        # Кеш готового контекста: общий для всех потребителей через get_rag(), потокобезопасный
+        self.context_cache = TTLCache(maxsize=RAG_CONTEXT_CACHE_SIZE, ttl=RAG_CONTEXT_CACHE_TTL)
+        self.context_budget = ContextBudget()
+    
+    def _index_base_name(self, backend: str) -> str:
+        if backend == "numpy":
+            return f"numpy_knowledge_{self.park_id}"
+        if backend == "chroma":
+            return f"knowledge_{self.park_id}"
+        raise ValueError(f"Unknown RAG backend: {backend}")
+    
+    def _open_store(self, name: str) -> VectorStore:
+        if self.backend == "numpy":
+            return NumpyVectorStore(self.persist_dir / name, name, mmap=RAG_NUMPY_MMAP)
+        return ChromaVectorStore(self.persist_dir, name, self.embedding_fn, metadata={"park_id": self.park_id})
+    
+    def _manifest_path(self, store: VectorStore) -> Path:
+        """Манифест индекса: id чанка → хеш содержимого и модель эмбеддингов (у каждой версии свой)."""
+        return self.persist_dir / f"manifest_{store.name}.json"
+    
+    @property
+    def manifest_path(self) -> Path:
+        return self._manifest_path(self.store)
+    
+    def _pointer_stat(self):
+        # Указатель заменяется через rename — новый inode даже при совпадении времени изменения
+        try:
+            stat = self.pointer_path.stat()
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _read_pointer(self) -> dict:
+        """{"active": имя активной версии, "versions": все версии от старых к новым}."""
+        try:
+            return json.loads(self.pointer_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def _write_pointer(self, pointer: dict):
+        tmp_path = self.pointer_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(pointer, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.pointer_path)
+    
+    def _activate(self, store: VectorStore):
+        self.store = store
+        self._lexical = None
+        self.context_cache.clear()
+    
+    def _refresh_store(self):
+        """Перейти на активную версию индекса и перечитать её, если их изменил другой процесс (пара stat на запрос)."""
+        self.store.refresh()
+        version = self._pointer_stat()
+        if version == self._pointer_version:
+            return
+        with self._switch_lock:
+            if version == self._pointer_version:
+                return
+            name = self._read_pointer().get("active", self.index_name)
+            if name != self.store.name:
+                print(f"RAG: switching {self.park_id} index to {name}")
+                self._activate(self._open_store(name))
+            self._pointer_version = version
     
     def add_document(self, doc_id: str, content: str, category: str, title: str = ""):
         """Добавить документ в базу знаний."""
-        self.collection.upsert(
-            documents=[content],
-            ids=[doc_id],
-            metadatas=[{"category": category, "title": title, "park_id": self.park_id}]
-        )
+        self.add_documents([{"id": doc_id, "content": content, "category": category, "title": title}])
+    
+    def add_documents(self, chunks: list[dict], batch_tokens: int = RAG_EMBED_BATCH_TOKENS,
+                      concurrency: int = RAG_EMBED_CONCURRENCY, store: VectorStore = None) -> int:
+        """
+        Добавить много документов разом.
+        
+        Эмбеддинги считаются пачками (до batch_tokens токенов на запрос к OpenAI),
+        несколько пачек параллельно; каждая пачка сохраняется одним upsert.
+        
+        Args:
+            chunks: Список {"id", "content", "category", "title"}
+            store: Куда писать (по умолчанию — активная версия индекса)
+        
+        Returns:
+            Количество добавленных документов
+        """
+        store = self.store if store is None else store
+        batches = self._make_batches(chunks, batch_tokens, store.max_batch_size)
+        
+        def embed_and_upsert(batch: list[dict]):
+            embeddings = self.embed([chunk["content"] for chunk in batch])
+            store.upsert(
+                ids=[chunk["id"] for chunk in batch],
+                documents=[chunk["content"] for chunk in batch],
+                embeddings=embeddings,
+                metadatas=[
+                    {"category": chunk["category"], "title": chunk.get("title") or "", "park_id": self.park_id}
+                    for chunk in batch
+                ]
+            )
+            return len(batch)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+                return sum(pool.map(embed_and_upsert, batches))
+        finally:
+            self._lexical = None
+            self.context_cache.clear()
+    
+    @staticmethod
+    def _make_batches(chunks: list[dict], batch_tokens: int, max_size: int) -> list[list[dict]]:
+        """Разложить чанки по пачкам, не превышая лимит токенов (и размер пачки хранилища)."""
+        batches, current, current_tokens = [], [], 0
+        for chunk in chunks:
+            tokens = estimate_tokens(chunk["content"])
+            if current and (current_tokens + tokens > batch_tokens or len(current) >= max_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(chunk)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
     
     def search(self, query: str, intent: str = None, n_results: int = 3) -> list[dict]:
         """
@@ -51,92 +236,77 @@ class RAGSystem:
             intent: Намерение (birthday, general) для фильтрации
             n_results: Количество результатов
         
+        В гибридном режиме векторный и лексический (BM25) поиск сливаются
+        через reciprocal rank fusion; если эмбеддинги недоступны — только BM25.
+        
         Returns:
             Список документов с контентом и метаданными
         """
-        # Формируем фильтр по категории
-        where_filter = None
-        if intent == "birthday":
-            where_filter = {"$or": [{"category": "birthday"}, {"category": "shared"}, {"category": "services"}]}
-        elif intent == "general":
-            where_filter = {"$or": [{"category": "general"}, {"category": "shared"}, {"category": "services"}]}
-        
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results,
-            where=where_filter
-        )
+        self._refresh_store()
+        categories = INTENT_CATEGORIES.get(intent)
+        if not self.hybrid:
+            return self.store.query(self.embed([query])[0], n_results, categories)
         
-        documents = []
-        if results["documents"] and results["documents"][0]:
-            for i, doc in enumerate(results["documents"][0]):
-                metadata = results["metadatas"][0][i] if results["metadatas"] else {}
-                documents.append({
-                    "content": doc,
-                    "category": metadata.get("category", ""),
-                    "title": metadata.get("title", ""),
-                    "distance": results["distances"][0][i] if results.get("distances") else None
-                })
-        
-        return documents
+        candidates = max(n_results, RAG_HYBRID_CANDIDATES)
+        lexical = self._lexical_index().search(query, candidates, categories)
+        try:
+            vector = self.store.query(self.embed([query])[0], candidates, categories)
+        except Exception as e:
+            print(f"RAG: embeddings unavailable, lexical search only: {e}")
+            return lexical[:n_results]
+        return reciprocal_rank_fusion([vector, lexical], k=RAG_RRF_K, n_results=n_results)
+    
+    def _index_version(self):
+        """Версия индекса: переиндексация (в том числе из админки или reindex_server.py) меняет манифест и данные хранилища."""
+        store = self.store
+        try:
+            return store.name, store.version, self._manifest_path(store).stat().st_mtime_ns
+        except FileNotFoundError:
+            return store.name, store.version, None
+    
+    def _lexical_index(self) -> BM25Index:
+        """BM25-индекс по документам хранилища (пересобирается после переиндексации)."""
+        version = self._index_version()
+        with self._lexical_lock:
+            if self._lexical is None or self._lexical_version != version:
+                index = BM25Index()
+                for doc in self.store.documents():
+                    index.add(doc["id"], doc["content"], doc["category"], doc["title"])
+                self._lexical, self._lexical_version = index, version
+            return self._lexical
+    
+    def context_docs(self, query: str, intent: str = None) -> list[dict]:
+        """Документы для контекста: отобраны и ужаты под бюджет токенов (без кеша)."""
+        docs = self.search(query, intent, n_results=self.context_budget.candidates)
+        return select_context(docs, query, self.context_budget)
     
     def get_context(self, query: str, intent: str = None) -> str:
         """Получить контекст для LLM из релевантных документов (с кешированием)."""
-        from time import time
-        
-        # Инициализация кеша при первом вызове
-        if not hasattr(self, '_cache'):
-            self._cache = {}
-            self._cache_ttl = 300  # 5 минут
-        
-        # Проверяем кеш
-        cache_key = (query, intent)
-        now = time()
-        
-        if cache_key in self._cache:
-            result, timestamp = self._cache[cache_key]
-            if now - timestamp < self._cache_ttl:
-                return result
-        
-        # Очищаем старые записи (максимум 100)
-        if len(self._cache) > 100:
-            old_keys = [k for k, (_, ts) in self._cache.items() if now - ts > self._cache_ttl]
-            for k in old_keys:
-                del self._cache[k]
-        
-        # Получаем контекст
-        docs = self.search(query, intent, n_results=3)
-        
-        if not docs:
-            return ""
-        
-        context_parts = []
-        for doc in docs:
-            title = doc.get("title", "")
-            content = doc["content"]
-            if title:
-                context_parts.append(f"### {title}\n{content}")
-            else:
-                context_parts.append(content)
-        
-        result = "\n\n".join(context_parts)
-        
-        # Кешируем
-        self._cache[cache_key] = (result, now)
+        self._refresh_store()
+        cache_key = (normalize_query(query), intent, self._index_version())
+        result = self.context_cache.get(cache_key)
+        if result is not None:
+            return result
         
+        result = format_context(self.context_docs(query, intent))
+        self.context_cache.set(cache_key, result)
         return result
     
-    def index_knowledge_files(self):
-        """Индексировать файлы базы знаний из папки knowledge/."""
+    async def aget_context(self, query: str, intent: str = None) -> str:
+        """get_context для обработчиков: эмбеддинг запроса и поиск — в потоке, event loop не блокируется."""
+        return await asyncio.to_thread(self.get_context, query, intent)
+    
+    def knowledge_chunks(self) -> list[dict]:
+        """Чанки файлов базы знаний из папки knowledge/."""
         knowledge_path = KNOWLEDGE_DIR / self.park_id
         
         if not knowledge_path.exists():
             print(f"Knowledge directory not found: {knowledge_path}")
-            return 0
+            return []
         
-        count = 0
+        result = []
         
-        for category in ["general", "birthday", "shared", "events", "services"]:
+        for category in KNOWLEDGE_CATEGORIES:
             category_path = knowledge_path / category
             if not category_path.exists():
                 continue
@@ -144,52 +314,205 @@ class RAGSystem:
             for file_path in category_path.glob("*.txt"):
                 content = file_path.read_text(encoding="utf-8")
                 
-                # Разбиваем на чанки если документ большой
-                chunks = self._split_into_chunks(content, max_chars=2000)
+                # Чанки по разделам и абзацам, размер — в токенах (RAG_CHUNK_TOKENS)
+                chunks = chunk_text(content)
                 
                 for i, chunk in enumerate(chunks):
-                    doc_id = f"{self.park_id}_{category}_{file_path.stem}_{i}"
-                    self.add_document(
-                        doc_id=doc_id,
-                        content=chunk,
-                        category=category,
-                        title=f"{file_path.stem} (часть {i+1})" if len(chunks) > 1 else file_path.stem
-                    )
-                    count += 1
-                    print(f"Indexed: {doc_id}")
+                    result.append({
+                        "id": f"{self.park_id}_{category}_{file_path.stem}_{i}",
+                        "content": chunk,
+                        "category": category,
+                        "title": f"{file_path.stem} (часть {i+1})" if len(chunks) > 1 else file_path.stem
+                    })
         
+        return result
+    
+    @staticmethod
+    def document_chunks(documents) -> list[dict]:
+        """Чанки документов из таблицы documents (админка)."""
+        result = []
+        for doc in documents:
+            if not doc.content:
+                continue
+            chunks = chunk_text(doc.content)
+            for i, chunk in enumerate(chunks):
+                result.append({
+                    "id": f"db_{doc.id}" if len(chunks) == 1 else f"db_{doc.id}_{i}",
+                    "content": chunk,
+                    "category": doc.category,
+                    "title": f"{doc.title or ''} (часть {i+1})".strip() if len(chunks) > 1 else doc.title or ""
+                })
+        return result
+    
+    def index_knowledge_files(self):
+        """Индексировать файлы базы знаний из папки knowledge/."""
+        chunks = self.knowledge_chunks()
+        count = self.add_documents(chunks)
+        print(f"Indexed {count} chunks from {KNOWLEDGE_DIR / self.park_id}")
         return count
     
-    def _split_into_chunks(self, text: str, max_chars: int = 4000) -> list[str]:
-        """Разбить текст на чанки по параграфам."""
-        if len(text) <= max_chars:
-            return [text]
+    @staticmethod
+    def _chunk_hash(chunk: dict) -> str:
+        payload = json.dumps([chunk["content"], chunk["category"], chunk.get("title") or ""], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _load_manifest(path: Path) -> dict:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    @staticmethod
+    def _save_manifest(path: Path, manifest: dict):
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp_path.replace(path)
+    
+    def _plan(self, chunks: list[dict], manifest: dict, existing: set[str]) -> tuple[dict, list[dict], dict]:
+        """Что добавить, изменить и удалить относительно манифеста и содержимого индекса."""
+        added, changed, to_embed = [], [], []
+        new_manifest = {}
+        for chunk in chunks:
+            entry = {"hash": self._chunk_hash(chunk), "model": self.embedding_model}
+            new_manifest[chunk["id"]] = entry
+            if chunk["id"] not in existing:
+                added.append(chunk["id"])
+                to_embed.append(chunk)
+            elif manifest.get(chunk["id"]) != entry:
+                changed.append(chunk["id"])
+                to_embed.append(chunk)
+        diff = {
+            "added": added,
+            "changed": changed,
+            "removed": sorted(existing - set(new_manifest)),
+            "unchanged": len(chunks) - len(to_embed),
+        }
+        return diff, to_embed, new_manifest
+    
+    def sync(self, chunks: list[dict]) -> dict:
+        """
+        Инкрементальная переиндексация.
         
-        chunks = []
-        paragraphs = text.split("\n\n")
-        current_chunk = ""
+        Сравнивает чанки с манифестом (хеш содержимого + модель эмбеддингов):
+        эмбеддинги считаются только для новых и изменённых чанков, исчезнувшие
+        удаляются. Коллекция всё время остаётся рабочей — без clear().
         
-        for para in paragraphs:
-            if len(current_chunk) + len(para) + 2 <= max_chars:
-                current_chunk += para + "\n\n"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = para + "\n\n"
+        Returns:
+            {"added": [...], "changed": [...], "removed": [...], "unchanged": int}
+        """
+        self._refresh_store()
+        store = self.store
+        manifest_path = self._manifest_path(store)
+        manifest = self._load_manifest(manifest_path)
+        # Что реально лежит в коллекции (манифест мог отстать, например после clear())
+        diff, to_embed, new_manifest = self._plan(chunks, manifest, set(store.ids()))
+        
+        if to_embed:
+            self.add_documents(to_embed, store=store)
+        if diff["removed"]:
+            store.delete(diff["removed"])
+            self._lexical = None
+            self.context_cache.clear()
+        if new_manifest != manifest:
+            self._save_manifest(manifest_path, new_manifest)
+        return diff
+    
+    def rebuild(self, chunks: list[dict]) -> dict:
+        """
+        Полная переиндексация без простоя (blue/green).
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        Чанки индексируются в новую версию коллекции (<index_name>__<версия>;
+        эмбеддинги неизменённых чанков берутся из кеша), затем указатель
+        атомарно переключается на неё. Пока идёт сборка, поиск работает по
+        старой версии; другие процессы переходят на новую при следующем
+        запросе. Версии старше RAG_INDEX_KEEP_VERSIONS последних удаляются.
         
-        return chunks if chunks else [text[:max_chars]]
+        Returns:
+            Отчёт как у sync() — относительно прежней активной версии
+        """
+        self._refresh_store()
+        previous = self.store
+        diff, _, new_manifest = self._plan(
+            chunks, self._load_manifest(self._manifest_path(previous)), set(previous.ids())
+        )
+        
+        store = self._open_store(f"{self.index_name}__{time.strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(2)}")
+        try:
+            self.add_documents(chunks, store=store)
+            self._save_manifest(self._manifest_path(store), new_manifest)
+        except Exception:
+            self._drop_version(store.name)
+            raise
+        
+        with self._switch_lock:
+            versions = [name for name in self._read_pointer().get("versions", [previous.name]) if name != store.name]
+            versions.append(store.name)
+            self._write_pointer({"active": store.name, "versions": versions})
+            self._pointer_version = self._pointer_stat()
+            self._activate(store)
+        print(f"RAG: {self.park_id} index switched to {store.name}")
+        self._collect_garbage(store.name, versions)
+        return diff
+    
+    def _drop_version(self, name: str):
+        """Удалить версию индекса вместе с её манифестом."""
+        self._open_store(name).drop()
+        self.persist_dir.joinpath(f"manifest_{name}.json").unlink(missing_ok=True)
+    
+    def _collect_garbage(self, active: str, versions: list[str]):
+        """
+        Удалить старые версии, оставив RAG_INDEX_KEEP_VERSIONS последних.
+        
+        Предыдущая версия по умолчанию остаётся: процессы, ещё не заметившие
+        переключение, дочитывают её без ошибок.
+        """
+        keep = max(1, RAG_INDEX_KEEP_VERSIONS)
+        stale, kept = versions[:-keep], versions[-keep:]
+        for name in stale:
+            try:
+                self._drop_version(name)
+            except Exception as e:
+                print(f"RAG: failed to drop index {name}: {e}")
+                kept.insert(0, name)
+        if stale:
+            with self._switch_lock:
+                self._write_pointer({"active": active, "versions": kept})
+                self._pointer_version = self._pointer_stat()
+    
+    @staticmethod
+    def format_sync_summary(diff: dict) -> str:
+        """Краткий отчёт о переиндексации."""
+        if not (diff["added"] or diff["changed"] or diff["removed"]):
+            return f"Без изменений ({diff['unchanged']} чанков)"
+        lines = [
+            f"Добавлено: {len(diff['added'])}, изменено: {len(diff['changed'])}, "
+            f"удалено: {len(diff['removed'])}, без изменений: {diff['unchanged']}"
+        ]
+        for key, sign in [("added", "+"), ("changed", "~"), ("removed", "-")]:
+            lines += [f"  {sign} {doc_id}" for doc_id in diff[key]]
+        return "\n".join(lines)
     
     def clear(self):
-        """Очистить коллекцию."""
-        self.client.delete_collection(f"knowledge_{self.park_id}")
-        self.collection = self.client.get_or_create_collection(
-            name=f"knowledge_{self.park_id}",
-            embedding_function=self.embedding_fn
-        )
+        """Очистить активную версию индекса (и её манифест). Для переиндексации без простоя — rebuild()."""
+        self.store.clear()
+        self.manifest_path.unlink(missing_ok=True)
+        self._lexical = None
+        self.context_cache.clear()
+
+
+# Реестр RAG по паркам: один экземпляр (и один кеш контекста) на процесс
+_registry: dict[str, RAGSystem] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rag(park_id: str = "nn") -> RAGSystem:
+    """Общий RAGSystem парка (Telegram, VK и API используют один и тот же)."""
+    with _registry_lock:
+        if park_id not in _registry:
+            _registry[park_id] = RAGSystem(park_id)
+        return _registry[park_id]
 
 
 # Глобальный экземпляр RAG
-rag = RAGSystem()
+rag = get_rag("nn")
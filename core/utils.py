@@ -1,49 +1,54 @@
+import hashlib
 import re
 from pathlib import Path
 
+DEFAULT_PRICES = {
+    "monday": 990,
+    "weekday": 1190,
+    "weekend": 1590
+}
+
+
+def parse_prices(content: str) -> dict:
+    """Достать цены билетов из текста prices.txt (чего нет — берём по умолчанию)."""
+    prices = DEFAULT_PRICES.copy()
+    
+    # Понедельник
+    monday_match = re.search(r"Понедельник[^:]*:.*?(\d+)\s*руб", content, re.IGNORECASE)
+    if monday_match:
+        prices["monday"] = int(monday_match.group(1))
+        
+    # Будни
+    weekday_match = re.search(r"Будни[^:]*:.*?(\d+)\s*руб", content, re.IGNORECASE)
+    if weekday_match:
+        prices["weekday"] = int(weekday_match.group(1))
+        
+    # Выходные
+    weekend_match = re.search(r"Выходные[^:]*:.*?(\d+)\s*руб", content, re.IGNORECASE)
+    if weekend_match:
+        prices["weekend"] = int(weekend_match.group(1))
+    
+    return prices
+
+
 def get_prices_from_knowledge(park_id: str = "nn") -> dict:
     """
     Парсит файл prices.txt и возвращает словарь с ценами.
     Если не находит, возвращает дефолтные значения.
     """
-    default_prices = {
-        "monday": 990,
-        "weekday": 1190,
-        "weekend": 1590
-    }
-    
     try:
         # Путь к файлу цен
         root = Path(__file__).parent.parent
         file_path = root / "knowledge" / park_id / "general" / "prices.txt"
         
         if not file_path.exists():
-            return default_prices
+            return DEFAULT_PRICES.copy()
             
-        content = file_path.read_text(encoding="utf-8")
-        
-        prices = default_prices.copy()
-        
-        # Понедельник
-        monday_match = re.search(r"Понедельник[^:]*:.*?(\d+)\s*руб", content, re.IGNORECASE)
-        if monday_match:
-            prices["monday"] = int(monday_match.group(1))
-            
-        # Будни
-        weekday_match = re.search(r"Будни[^:]*:.*?(\d+)\s*руб", content, re.IGNORECASE)
-        if weekday_match:
-            prices["weekday"] = int(weekday_match.group(1))
-            
-        # Выходные
-        weekend_match = re.search(r"Выходные[^:]*:.*?(\d+)\s*руб", content, re.IGNORECASE)
-        if weekend_match:
-            prices["weekend"] = int(weekend_match.group(1))
-            
-        return prices
+        return parse_prices(file_path.read_text(encoding="utf-8"))
         
     except Exception as e:
         print(f"Error parsing prices: {e}")
-        return default_prices
+        return DEFAULT_PRICES.copy()
 
 def get_prices_text(park_id: str = "nn") -> str:
     """Возвращает полное содержимое файла цен."""
@@ -57,6 +62,49 @@ def get_prices_text(park_id: str = "nn") -> str:
     return ""
 
 
+def get_knowledge_version(park_id: str = "nn") -> str:
+    """
+    Версия базы знаний парка: хеш имён, размеров и mtime файлов knowledge/<park_id>.
+    
+    Файлы не читаются (только stat), поэтому вызывать можно на каждый запрос.
+    Правки промптов тоже меняют ответы — config/prompts.py входит в версию.
+    """
+    root = Path(__file__).parent.parent
+    files = sorted((root / "knowledge" / park_id).rglob("*.txt"))
+    files.append(root / "config" / "prompts.py")
+    
+    digest = hashlib.md5()
+    for file_path in files:
+        try:
+            stat = file_path.stat()
+        except OSError:
+            continue
+        digest.update(f"{file_path.relative_to(root)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")  # токенизатор gpt-4o / gpt-4o-mini
+except Exception:  # tiktoken не установлен или нет доступа к файлам словаря
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Число токенов в тексте.
+    
+    С tiktoken — точно, без него — оценка: ~4 символа латиницы
+    или ~2.5 символа кириллицы на токен.
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return round((len(text) - non_ascii) / 4 + non_ascii / 2.5) or 1
+
+
 def format_phone(phone: str) -> str:
     """Форматировать телефон для отображения."""
     if not phone:
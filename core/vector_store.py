@@ -0,0 +1,341 @@
+"""
+Хранилища векторов для RAGSystem.
+
+ChromaVectorStore — коллекция ChromaDB (PersistentClient поверх SQLite).
+NumpyVectorStore — все нормированные векторы в одной матрице float32
+(по желанию memory-mapped), поиск перебором: скалярное произведение
+и top-k, фильтр по категориям — маска. Для базы знаний в несколько
+десятков чанков это быстрее любого индекса.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+class VectorStore:
+    """Интерфейс хранилища: документы с эмбеддингами и метаданными (category, title, park_id)."""
+
+    # Имя индекса (коллекции); по нему же называется манифест переиндексации
+    name: str = ""
+    # Версия содержимого, если хранилище её знает (меняется при каждой записи)
+    version = None
+    # Максимум документов в одном upsert
+    max_batch_size: int = 5000
+
+    def upsert(self, ids: list[str], documents: list[str], embeddings, metadatas: list[dict]):
+        raise NotImplementedError
+
+    def delete(self, ids: list[str]):
+        raise NotImplementedError
+
+    def ids(self) -> list[str]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def documents(self) -> list[dict]:
+        """Все документы: [{"id", "content", "category", "title"}] (для лексического индекса)."""
+        raise NotImplementedError
+
+    def query(self, embedding, n_results: int, categories: Optional[list[str]] = None) -> list[dict]:
+        """
+        Ближайшие документы.
+
+        Returns:
+            [{"id", "content", "category", "title", "distance"}] по возрастанию distance
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def drop(self):
+        """Удалить индекс целиком (коллекцию или папку); экземпляром больше не пользуются."""
+        raise NotImplementedError
+
+    def refresh(self) -> bool:
+        """Перечитать индекс, если его переписал другой процесс. True — если перечитан."""
+        return False
+
+
+class ChromaVectorStore(VectorStore):
+    """Коллекция ChromaDB."""
+
+    def __init__(self, persist_dir: Path, name: str, embedding_fn, metadata: dict = None):
+        import chromadb
+
+        self.name = name
+        self.embedding_fn = embedding_fn
+        self.metadata = metadata
+        self.client = chromadb.PersistentClient(path=str(persist_dir))
+        self.max_batch_size = self.client.get_max_batch_size()
+        self.collection = self._open()
+
+    def _open(self):
+        return self.client.get_or_create_collection(
+            name=self.name,
+            embedding_function=self.embedding_fn,
+            metadata=self.metadata
+        )
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def ids(self) -> list[str]:
+        return self.collection.get(include=[])["ids"]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def documents(self) -> list[dict]:
+        results = self.collection.get(include=["documents", "metadatas"])
+        return [
+            {"id": doc_id, "content": doc, "category": metadata.get("category", ""), "title": metadata.get("title", "")}
+            for doc_id, doc, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+    def query(self, embedding, n_results, categories=None):
+        where_filter = None
+        if categories:
+            where_filter = {"$or": [{"category": category} for category in categories]}
+
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where=where_filter
+        )
+
+        documents = []
+        if results["documents"] and results["documents"][0]:
+            for i, doc in enumerate(results["documents"][0]):
+                metadata = results["metadatas"][0][i] if results["metadatas"] else {}
+                documents.append({
+                    "id": results["ids"][0][i],
+                    "content": doc,
+                    "category": metadata.get("category", ""),
+                    "title": metadata.get("title", ""),
+                    "distance": results["distances"][0][i] if results.get("distances") else None
+                })
+        return documents
+
+    def clear(self):
+        self.client.delete_collection(self.name)
+        self.collection = self._open()
+
+    def drop(self):
+        self.client.delete_collection(self.name)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Матрица нормированных эмбеддингов в памяти процесса.
+
+    На диске каждая запись — новое поколение <dir>/<поколение>/ с
+    vectors.npy (матрица) и documents.json (id, тексты, метаданные); файл
+    <dir>/CURRENT атомарно переключается на него. Матрица и документы
+    поэтому всегда из одной записи, а другие процессы (бот, API) замечают
+    запись по CURRENT и перечитывают индекс (refresh). Хранятся
+    GENERATIONS_KEEP последних поколений. С mmap=True матрица читается через
+    memory map — процессы делят одни страницы файла. distance = 2 - 2·cos,
+    как L2-расстояние Chroma для нормированных векторов.
+    """
+
+    GENERATIONS_KEEP = 2
+
+    def __init__(self, path: Path, name: str, mmap: bool = False):
+        self.path = Path(path)
+        self.name = name
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _current_path(self) -> Path:
+        return self.path / "CURRENT"
+
+    def _current_stat(self):
+        # CURRENT заменяется через rename — новый inode даже при совпадении времени изменения
+        try:
+            stat = self._current_path.stat()
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        for _ in range(3):
+            current_stat = self._current_stat()
+            try:
+                generation = self._current_path.read_text(encoding="utf-8").strip() or None
+            except FileNotFoundError:
+                generation = None
+            # Без CURRENT — файлы прямо в <dir> (формат до поколений)
+            directory = self.path / generation if generation else self.path
+            try:
+                data = json.loads((directory / "documents.json").read_text(encoding="utf-8"))
+                matrix = np.load(directory / "vectors.npy", mmap_mode="r" if self.mmap else None) if data["ids"] else None
+                break
+            except FileNotFoundError:
+                data, matrix = {"ids": [], "documents": [], "metadatas": []}, None
+                # Поколение удалили, пока читали, — CURRENT уже указывает на новое
+                if generation is None or self._current_stat() == current_stat:
+                    break
+        self._loaded_stat = current_stat
+        self.version = generation
+        self._set(data["ids"], data["documents"], data["metadatas"], matrix)
+
+    def refresh(self) -> bool:
+        if self._current_stat() == self._loaded_stat:
+            return False
+        with self._lock:
+            if self._current_stat() == self._loaded_stat:
+                return False
+            self._load()
+            return True
+
+    def _set(self, ids: list[str], documents: list[str], metadatas: list[dict], matrix: Optional[np.ndarray]):
+        self._ids = ids
+        self._documents = documents
+        self._metadatas = metadatas
+        self._index = {doc_id: i for i, doc_id in enumerate(ids)}
+        self._matrix = matrix
+        # Категории как коды: маска фильтра считается одним np.isin
+        self._categories = sorted({metadata.get("category", "") for metadata in metadatas})
+        codes = {category: code for code, category in enumerate(self._categories)}
+        category_codes = np.array([codes[metadata.get("category", "")] for metadata in metadatas], dtype=np.int32)
+        # Поиск читает одно поле — параллельный upsert не подменит матрицу посреди запроса
+        self._view = (matrix, self._categories, category_codes, ids, documents, metadatas)
+
+    def _save(self, ids, documents, metadatas, matrix: Optional[np.ndarray]):
+        """Записать новое поколение, переключить на него CURRENT и перечитать."""
+        generation = f"{time.time_ns():020d}_{os.getpid()}"
+        directory = self.path / generation
+        directory.mkdir(parents=True)
+        if matrix is not None:
+            np.save(directory / "vectors.npy", np.ascontiguousarray(matrix, dtype=np.float32))
+        (directory / "documents.json").write_text(
+            json.dumps({"ids": ids, "documents": documents, "metadatas": metadatas}, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        tmp_current = self.path / f"CURRENT.{os.getpid()}.tmp"
+        tmp_current.write_text(generation, encoding="utf-8")
+        tmp_current.replace(self._current_path)
+        self._load()
+        self._collect_garbage(generation)
+
+    def _collect_garbage(self, current: str):
+        """Удалить старые поколения (и файлы формата до поколений)."""
+        for legacy in ("vectors.npy", "documents.json"):
+            (self.path / legacy).unlink(missing_ok=True)
+        generations = sorted(entry.name for entry in self.path.iterdir() if entry.is_dir())
+        for generation in generations[:-self.GENERATIONS_KEEP]:
+            if generation != current:
+                shutil.rmtree(self.path / generation, ignore_errors=True)
+
+    def _refresh_locked(self):
+        """Перед записью — догнать чужие записи, чтобы не затереть их."""
+        if self._current_stat() != self._loaded_stat:
+            self._load()
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            self._refresh_locked()
+            all_ids, all_documents, all_metadatas = list(self._ids), list(self._documents), list(self._metadatas)
+            matrix = np.array(self._matrix) if self._matrix is not None else np.empty((0, vectors.shape[1]), np.float32)
+            new_rows = []
+            for doc_id, document, vector, metadata in zip(ids, documents, vectors, metadatas):
+                row = self._index.get(doc_id)
+                if row is None:
+                    all_ids.append(doc_id)
+                    all_documents.append(document)
+                    all_metadatas.append(metadata)
+                    new_rows.append(vector)
+                else:
+                    all_documents[row] = document
+                    all_metadatas[row] = metadata
+                    matrix[row] = vector
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self._save(all_ids, all_documents, all_metadatas, matrix)
+
+    def delete(self, ids):
+        with self._lock:
+            self._refresh_locked()
+            drop = {self._index[doc_id] for doc_id in ids if doc_id in self._index}
+            if not drop:
+                return
+            keep = [i for i in range(len(self._ids)) if i not in drop]
+            self._save(
+                [self._ids[i] for i in keep],
+                [self._documents[i] for i in keep],
+                [self._metadatas[i] for i in keep],
+                np.array(self._matrix[keep]) if keep else None
+            )
+
+    def ids(self) -> list[str]:
+        return list(self._ids)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def documents(self) -> list[dict]:
+        return [
+            {"id": doc_id, "content": doc, "category": metadata.get("category", ""), "title": metadata.get("title", "")}
+            for doc_id, doc, metadata in zip(self._ids, self._documents, self._metadatas)
+        ]
+
+    def query(self, embedding, n_results, categories=None):
+        matrix, all_categories, category_codes, ids, documents, metadatas = self._view
+        if matrix is None or not len(matrix):
+            return []
+
+        scores = matrix @ self._normalize(embedding)[0]
+        if categories:
+            allowed = [code for code, category in enumerate(all_categories) if category in categories]
+            scores = np.where(np.isin(category_codes, allowed), scores, -np.inf)
+
+        candidates = int(np.count_nonzero(scores > -np.inf))
+        k = min(n_results, candidates)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {
+                "id": ids[i],
+                "content": documents[i],
+                "category": metadatas[i].get("category", ""),
+                "title": metadatas[i].get("title", ""),
+                "distance": float(2 - 2 * scores[i]),
+            }
+            for i in top
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._save([], [], [], None)
+
+    def drop(self):
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._set([], [], [], None)
@@ -23,6 +23,10 @@ class Session(Base):
     # Данные сбора лида
     lead_data = Column(JSON, default=dict)
     
+    # Краткое резюме старой части диалога (то, что уже не влезает в историю промпта)
+    summary = Column(Text)
+    summary_message_id = Column(Integer)  # последнее сообщение, вошедшее в резюме
+    
     messages = relationship("Message", back_populates="session")
 
 
@@ -125,6 +129,10 @@ class Lead(Base):
     # Флаги
     sent_to_manager = Column(Boolean, default=False)
     
+    # Инкрементальное извлечение данных из переписки
+    extracted_message_id = Column(Integer)  # последнее сообщение, уже разобранное в заявку
+    field_sources = Column(JSON, default=dict)  # {поле: id сообщения или "profile"}
+    
     client = relationship("Client", back_populates="leads")
     
     def get_summary(self):
@@ -0,0 +1,37 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import DB_PATH
+
+
+def migrate():
+    print(f"Migrating database (Adding sessions.summary/summary_message_id) at {DB_PATH}...")
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    columns = [
+        ("summary", "TEXT"),
+        ("summary_message_id", "INTEGER"),
+    ]
+    for name, column_type in columns:
+        try:
+            cursor.execute(f"ALTER TABLE sessions ADD COLUMN {name} {column_type}")
+            print(f"✅ Added '{name}' column to 'sessions' table")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e):
+                print(f"ℹ️ Column '{name}' already exists in 'sessions' table")
+            else:
+                print(f"❌ Error adding '{name}' to 'sessions': {e}")
+
+    conn.commit()
+    conn.close()
+    print("Sessions summary migration completed.")
+
+
+if __name__ == "__main__":
+    migrate()
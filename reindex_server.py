@@ -1,6 +1,6 @@
-
 print("Starting reindex...")
 import sys
+import time
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
@@ -9,18 +9,20 @@ from db import init_db, SessionLocal, Document
 
 init_db()
 rag = RAGSystem("nn")
-rag.clear()
+# --full: полная переиндексация в новую версию индекса с переключением указателя —
+# запущенные боты ищут по старой версии до переключения (по умолчанию — только изменения по манифесту)
+full = "--full" in sys.argv
 
-# Index DB
+# Index DB + Files (эмбеддинги только для новых/изменённых чанков)
 db = SessionLocal()
 docs = db.query(Document).all()
-print(f"Docs in DB: {len(docs)}")
-for doc in docs:
-    rag.add_document(f"db_{doc.id}", doc.content, doc.category, doc.title)
 db.close()
+print(f"Docs in DB: {len(docs)}")
 
-# Index Files
-print("Indexing files...")
-count = rag.index_knowledge_files()
-print(f"Files indexed: {count}")
-print("Done.")
+start = time.perf_counter()
+chunks = rag.document_chunks(docs) + rag.knowledge_chunks()
+print(f"{'Rebuilding' if full else 'Syncing'} {len(chunks)} chunks...")
+diff = rag.rebuild(chunks) if full else rag.sync(chunks)
+print(rag.format_sync_summary(diff))
+print(f"Active index: {rag.store.name}")
+print(f"Done in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,111 @@
+"""Бенчмарк: пропускная способность агента при одновременных пользователях.
+
+Сравнивает старую схему (синхронный клиент внутри async-хендлера блокирует
+event loop) и async-агента с общим пулом и ограничением параллельности.
+LLM заменён заглушкой с фиксированной задержкой — сеть не нужна.
+
+Запуск:
+    python scripts/bench_agent_concurrency.py --users 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from core.agent import Agent
+
+
+def _completion(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class StubAsyncClient:
+    """Заглушка AsyncOpenAI: отвечает через `latency` секунд, не блокируя loop."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _completion("Привет! Чем помочь? 😊")
+
+
+def blocking_call(latency: float):
+    """Старое поведение: синхронный OpenAI клиент внутри async def."""
+    time.sleep(latency)
+    return _completion("Привет! Чем помочь? 😊").choices[0].message.content
+
+
+async def run_blocking(users: int, turns: int, latency: float) -> list[float]:
+    latencies = []
+    sent_at = time.perf_counter()  # все пишут одновременно
+
+    async def user_session(i: int):
+        start = sent_at
+        for _ in range(turns):
+            blocking_call(latency)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+            start = time.perf_counter()
+
+    await asyncio.gather(*(user_session(i) for i in range(users)))
+    return latencies
+
+
+async def run_async(users: int, turns: int, latency: float, concurrency: int) -> list[float]:
+    agent = Agent(client=StubAsyncClient(latency), max_concurrency=concurrency)
+    latencies = []
+    sent_at = time.perf_counter()
+
+    async def user_session(i: int):
+        start = sent_at
+        for turn in range(turns):
+            await agent.generate_response(f"Сколько стоит билет? ({i}/{turn})", intent="general")
+            latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+
+    await asyncio.gather(*(user_session(i) for i in range(users)))
+    return latencies
+
+
+def report(name: str, latencies: list[float], elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<28} запросов: {len(latencies):>4}  время: {elapsed:6.2f} с  "
+        f"пропускная: {len(latencies) / elapsed:6.1f} req/s  "
+        f"p50: {statistics.median(latencies):5.2f} с  p95: {p95:5.2f} с"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.5, help="задержка заглушки LLM, сек")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50])
+    args = parser.parse_args()
+
+    print(f"Пользователей: {args.users}, сообщений на пользователя: {args.turns}, задержка LLM: {args.latency} с\n")
+
+    start = time.perf_counter()
+    latencies = await run_blocking(args.users, args.turns, args.latency)
+    # Задержка считается от отправки сообщения: в блокирующей схеме это и ожидание чужих запросов
+    report("sync (блокирует loop)", latencies, time.perf_counter() - start)
+
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        latencies = await run_async(args.users, args.turns, args.latency, concurrency)
+        report(f"async, лимит {concurrency}", latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""Бенчмарк: birthday-ход до и после объединения вызовов LLM.
+
+Прогоняет записанный диалог из data/bot.db двумя способами:
+- старый: extract_lead_data по истории → generate_response →
+  extract_lead_data по ответу (+ ещё один при подтверждении заявки);
+- новый: один generate_turn (ответ + данные заявки в JSON).
+
+LLM заменён заглушкой: она возвращает записанные ответы бота, считает вызовы
+и токены (≈ 4 символа на токен) и «спит» пропорционально их числу.
+
+Запуск:
+    python scripts/bench_birthday_turns.py --session 3 --turns 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from core.agent import Agent
+
+DB_PATH = Path(__file__).parent.parent / "data" / "bot.db"
+
+EMPTY_LEAD = {
+    "customer_name": None, "child_name": None, "child_age": None, "event_date": None,
+    "time": None, "kids_count": None, "adults_count": None, "phone": None,
+    "room": None, "format": None, "extras": [],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubClient:
+    """Заглушка AsyncOpenAI с учётом вызовов, токенов и задержки."""
+
+    def __init__(self, base_latency: float, per_output_token: float):
+        self.base_latency = base_latency
+        self.per_output_token = per_output_token
+        self.reply = ""
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        if kwargs.get("response_format"):
+            content = json.dumps({"reply": self.reply, "lead": EMPTY_LEAD}, ensure_ascii=False)
+        elif kwargs["model"] == "gpt-4o-mini":
+            content = json.dumps(EMPTY_LEAD, ensure_ascii=False)
+        else:
+            content = self.reply
+
+        self.calls += 1
+        self.prompt_tokens += sum(estimate_tokens(m["content"]) for m in kwargs["messages"])
+        output_tokens = estimate_tokens(content)
+        self.completion_tokens += output_tokens
+        await asyncio.sleep(self.base_latency + output_tokens * self.per_output_token)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def load_turns(session_id: int, limit: int) -> list[tuple[list[dict], str, str]]:
+    """(история, сообщение пользователя, записанный ответ бота) для каждого хода."""
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute(
+        "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+    ).fetchall()
+    conn.close()
+
+    turns = []
+    for i, (role, content) in enumerate(rows[:-1]):
+        if role == "user" and rows[i + 1][0] == "assistant":
+            history = [{"role": r, "content": c} for r, c in rows[max(0, i - 10):i]]
+            turns.append((history, content, rows[i + 1][1]))
+    return turns[:limit]
+
+
+async def run_old(agent: Agent, client: StubClient, turns) -> list[float]:
+    latencies = []
+    for history, message, reply in turns:
+        client.reply = reply
+        start = time.perf_counter()
+        user_messages = [m["content"] for m in history if m["role"] == "user"][-10:] + [message]
+        lead_data = await agent.extract_lead_data("\n".join(user_messages), {})
+        response = await agent.generate_response(message, "birthday", history=history, lead_data=lead_data)
+        lead_data = await agent.extract_lead_data(response, lead_data)
+        if any(x in response.lower() for x in ["передана феям", "заявка принята", "передал заявку"]):
+            await agent.extract_lead_data(response, lead_data)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_new(agent: Agent, client: StubClient, turns) -> list[float]:
+    latencies = []
+    for history, message, reply in turns:
+        client.reply = reply
+        start = time.perf_counter()
+        await agent.generate_turn(message, history=history, lead_data={})
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, client: StubClient, latencies: list[float]):
+    turns = len(latencies)
+    print(
+        f"{name:<22} вызовов/ход: {client.calls / turns:4.2f}  "
+        f"токенов/ход: {(client.prompt_tokens + client.completion_tokens) / turns:7.0f} "
+        f"(prompt {client.prompt_tokens / turns:.0f}, completion {client.completion_tokens / turns:.0f})  "
+        f"задержка/ход: {sum(latencies) / turns:5.2f} с"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--session", type=int, default=3, help="ID сессии в data/bot.db")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.4, help="базовая задержка вызова, сек")
+    parser.add_argument("--per-token", type=float, default=0.01, help="задержка на токен ответа, сек")
+    args = parser.parse_args()
+
+    turns = load_turns(args.session, args.turns)
+    if not turns:
+        print(f"В сессии #{args.session} нет ходов пользователь → бот")
+        return
+    print(f"Сессия #{args.session}: {len(turns)} ходов\n")
+
+    for name, runner in (("до (3 вызова)", run_old), ("после (1 вызов)", run_new)):
+        client = StubClient(args.latency, args.per_token)
+        latencies = await runner(Agent(client=client), client, turns)
+        report(name, client, latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Бенчмарк: индексация базы знаний по одному чанку и пачками.
+
+Индексирует knowledge/<park> во временную ChromaDB. OpenAI embeddings
+заменены заглушкой с задержкой на запрос (сеть не нужна): по одному —
+запрос и upsert на каждый чанк, пачками — RAGSystem.add_documents.
+
+Запуск:
+    python scripts/bench_indexing.py --latency 0.3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from chromadb.api.types import EmbeddingFunction
+
+from core.rag import RAGSystem
+
+
+class StubEmbeddingFunction(EmbeddingFunction):
+    """Заглушка OpenAIEmbeddingFunction: задержка на запрос, случайные векторы."""
+
+    def __init__(self, latency: float, dim: int = 1536):
+        self.latency = latency
+        self.dim = dim
+        self.requests = 0
+
+    def __call__(self, input):
+        self.requests += 1
+        time.sleep(self.latency)
+        rng = np.random.default_rng(len(input))
+        return [vector for vector in rng.standard_normal((len(input), self.dim), dtype=np.float32)]
+
+    @staticmethod
+    def name() -> str:
+        return "bench-stub"
+
+    def get_config(self) -> dict:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "StubEmbeddingFunction":
+        return StubEmbeddingFunction(0)
+
+
+def run(park_id: str, latency: float, batched: bool) -> tuple[int, int, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        embedding_fn = StubEmbeddingFunction(latency)
+        rag = RAGSystem(park_id, persist_dir=Path(tmp), embedding_fn=embedding_fn)
+        chunks = rag.knowledge_chunks()
+        start = time.perf_counter()
+        if batched:
+            rag.add_documents(chunks)
+        else:
+            for chunk in chunks:
+                rag.add_document(chunk["id"], chunk["content"], chunk["category"], chunk["title"])
+        return len(chunks), embedding_fn.requests, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--park", default="nn")
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка запроса эмбеддингов, сек")
+    args = parser.parse_args()
+
+    for name, batched in [("по одному чанку", False), ("пачками", True)]:
+        chunks, requests, elapsed = run(args.park, args.latency, batched)
+        print(f"{name:<18} чанков: {chunks:>3}  запросов эмбеддингов: {requests:>3}  время: {elapsed:6.2f} с")
+
+
+if __name__ == "__main__":
+    main()
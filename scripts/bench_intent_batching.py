@@ -0,0 +1,98 @@
+"""Бенчмарк: LLM-классификация намерений по одному и пачками.
+
+Много пользователей одновременно пишут неоднозначные сообщения (правила
+не сработали). Сравнивается запрос на каждое сообщение и IntentBatcher,
+который собирает сообщения за короткое окно и классифицирует их одним
+запросом. LLM заменён заглушкой: задержка = база + время на токены ответа.
+
+Запуск:
+    python scripts/bench_intent_batching.py --users 200 --window-ms 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from core.intent_router import IntentBatcher
+from core.llm_gateway import LLMGateway
+from core.utils import estimate_tokens
+
+MESSAGES = ["Здравствуйте", "А можно вопрос?", "Подскажите пожалуйста", "Добрый вечер", "Мы в субботу хотим прийти"]
+
+
+class StubAsyncClient:
+    """Заглушка AsyncOpenAI: считает вызовы и токены промпта."""
+
+    def __init__(self, latency: float, per_item: float):
+        self.latency = latency
+        self.per_item = per_item
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, messages, **kwargs):
+        prompt = messages[0]["content"]
+        ids = [int(i) for i in re.findall(r"^(\d+)\. ", prompt, re.MULTILINE)]
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        await asyncio.sleep(self.latency + self.per_item * len(ids))
+        content = json.dumps({"items": [{"id": i, "intent": "unknown"} for i in ids]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+async def run(users: int, latency: float, per_item: float, window_ms: int, max_size: int, concurrency: int):
+    client = StubAsyncClient(latency, per_item)
+    batcher = IntentBatcher(window_ms=window_ms, max_size=max_size,
+                            gateway=LLMGateway(client=client, max_concurrency=concurrency))
+    latencies = []
+
+    async def user(i: int):
+        # Сообщения приходят вразброс в течение ~секунды
+        await asyncio.sleep(i / users)
+        start = time.perf_counter()
+        await batcher.classify(MESSAGES[i % len(MESSAGES)])
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return client, latencies
+
+
+def report(name: str, client: StubAsyncClient, latencies: list[float], users: int):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<26} запросов к LLM: {client.calls:>4}  токенов/сообщение: {client.prompt_tokens / users:6.1f}  "
+        f"p50: {statistics.median(latencies):5.2f} с  p95: {p95:5.2f} с"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.4, help="базовая задержка заглушки LLM, сек")
+    parser.add_argument("--per-item", type=float, default=0.01, help="доп. задержка на сообщение в пачке, сек")
+    parser.add_argument("--window-ms", type=int, default=30)
+    parser.add_argument("--max-size", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=20, help="LLM_MAX_CONCURRENCY")
+    args = parser.parse_args()
+
+    print(f"Сообщений: {args.users} за ~1 с, задержка LLM: {args.latency} с, лимит параллельности: {args.concurrency}\n")
+
+    client, latencies = await run(args.users, args.latency, args.per_item, 0, 1, args.concurrency)
+    report("по одному", client, latencies, args.users)
+
+    client, latencies = await run(args.users, args.latency, args.per_item, args.window_ms, args.max_size, args.concurrency)
+    report(f"пачки ({args.window_ms} мс / {args.max_size})", client, latencies, args.users)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""Бенчмарк: правила intent_router — по одному re.search против общего матчера.
+
+Берёт реальные сообщения пользователей из data/bot.db, проверяет, что
+MultiPatternMatcher находит ровно те же триггеры, что и поштучный
+re.search, и сравнивает время на сообщение.
+
+Запуск:
+    python scripts/bench_intent_rules.py --repeat 20
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from core.intent_router import BIRTHDAY_TRIGGERS, GENERAL_TRIGGERS, EVENTS_TRIGGERS, match_triggers
+
+DB_PATH = Path(__file__).parent.parent / "data" / "bot.db"
+
+TRIGGERS = {"birthday": BIRTHDAY_TRIGGERS, "general": GENERAL_TRIGGERS, "events": EVENTS_TRIGGERS}
+
+
+def match_triggers_sequential(message: str) -> dict[str, list[str]]:
+    """Старое поведение: lower() и отдельный re.search на каждый триггер."""
+    text = message.lower()
+    result = {}
+    for intent, triggers in TRIGGERS.items():
+        matched = [trigger for trigger in triggers if re.search(trigger, text)]
+        if matched:
+            result[intent] = matched
+    return result
+
+
+def bench(func, messages: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - start) / (repeat * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_PATH)
+    messages = [row[0] for row in conn.execute("SELECT content FROM messages WHERE role = 'user'")]
+    conn.close()
+
+    mismatches = [m for m in messages if match_triggers(m) != match_triggers_sequential(m)]
+    print(f"Сообщений: {len(messages)}, расхождений с re.search: {len(mismatches)}")
+    for message in mismatches[:5]:
+        print(f"  {message[:60]!r}: {match_triggers_sequential(message)} vs {match_triggers(message)}")
+
+    sequential = bench(match_triggers_sequential, messages, args.repeat)
+    combined = bench(match_triggers, messages, args.repeat)
+    print(f"\nre.search по триггерам   {sequential * 1e6:7.1f} мкс/сообщение")
+    print(f"MultiPatternMatcher      {combined * 1e6:7.1f} мкс/сообщение  (x{sequential / combined:.1f})")
+
+
+if __name__ == "__main__":
+    main()
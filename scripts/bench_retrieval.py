@@ -0,0 +1,213 @@
+"""Бенчмарк поиска RAG: полнота по эталонным вопросам и задержка.
+
+Вопросы — scripts/retrieval_gold.json (версионируется вместе с кодом):
+для каждого указаны intent и файлы базы знаний, где есть ответ.
+Индексирует knowledge/<park> во временную папку для каждой комбинации
+хранилища (chroma/numpy) и режима (только векторы / гибрид с BM25).
+Эмбеддинги — детерминированная заглушка (хеширование основ слов и
+триграмм), сеть не нужна, результаты воспроизводимы.
+
+Считает recall@k (найден ли ожидаемый файл среди первых k чанков), MRR,
+p50/p95 задержки search, средний размер контекста get_context в токенах
+и долю вопросов, где ожидаемый файл попал в контекст (context_recall),
+и проверяет бюджеты задержки из эталона. Параметры сборки контекста
+(core/context_budget.py) переопределяются флагами --context-*.
+JSON-отчёт удобно сравнивать между коммитами:
+
+    python scripts/bench_retrieval.py --output /tmp/before.json
+    python scripts/bench_retrieval.py --output /tmp/after.json
+    diff /tmp/before.json /tmp/after.json
+
+С --strict код возврата 1, если бюджет задержки превышен.
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from chromadb.api.types import EmbeddingFunction
+
+from config.settings import RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP, RAG_HYBRID_CANDIDATES, RAG_RRF_K
+from core.chunking import chunk_stats
+from core.context_budget import ContextBudget, format_context
+from core.lexical import tokenize
+from core.rag import RAGSystem
+from core.utils import estimate_tokens
+
+GOLD_PATH = Path(__file__).parent / "retrieval_gold.json"
+K_VALUES = (1, 3, 5)
+
+
+class StubEmbeddingFunction(EmbeddingFunction):
+    """Заглушка эмбеддингов: хеширование основ слов и символьных триграмм в вектор."""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> int:
+        return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "little") % self.dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for stem in tokenize(text):
+                vector[self._bucket(stem)] += 2
+                padded = f" {stem} "
+                for i in range(len(padded) - 2):
+                    vector[self._bucket(padded[i:i + 3])] += 1
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "bench-hash"
+
+    def get_config(self) -> dict:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "StubEmbeddingFunction":
+        return StubEmbeddingFunction()
+
+
+def source_file(chunk_id: str, park_id: str) -> str:
+    """nn_birthday_food_sets_2 → birthday/food_sets (категории без подчёркиваний)."""
+    category, _, rest = chunk_id[len(park_id) + 1:].partition("_")
+    return f"{category}/{rest.rsplit('_', 1)[0]}"
+
+
+def percentile(values: list[float], q: float) -> float:
+    return round(float(np.percentile(values, q * 100)), 3)
+
+
+def run(gold: dict, backend: str, hybrid: bool, repeats: int, budget: ContextBudget) -> dict:
+    park_id = gold["park_id"]
+    with tempfile.TemporaryDirectory() as tmp:
+        rag = RAGSystem(park_id, persist_dir=Path(tmp), embedding_fn=StubEmbeddingFunction(),
+                        backend=backend, hybrid=hybrid)
+        rag.context_budget = budget
+        rag.sync(rag.knowledge_chunks())
+
+        hits = {k: 0 for k in K_VALUES}
+        reciprocal_ranks, misses, context_tokens, context_hits = [], [], [], 0
+        for item in gold["questions"]:
+            docs = rag.search(item["question"], item.get("intent"), n_results=max(K_VALUES))
+            files = [source_file(doc["id"], park_id) for doc in docs]
+            rank = next((i for i, name in enumerate(files, start=1) if name in item["expected"]), None)
+            for k in K_VALUES:
+                hits[k] += rank is not None and rank <= k
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            if rank is None or rank > 3:
+                misses.append({"question": item["question"], "expected": item["expected"], "got": files[:3]})
+            context = rag.context_docs(item["question"], item.get("intent"))
+            context_tokens.append(estimate_tokens(format_context(context)))
+            context_hits += any(source_file(doc["id"], park_id) in item["expected"] for doc in context)
+
+        # Задержка: прогрев, затем repeats проходов по всем вопросам
+        for item in gold["questions"]:
+            rag.search(item["question"], item.get("intent"))
+        latencies = []
+        for _ in range(repeats):
+            for item in gold["questions"]:
+                start = time.perf_counter()
+                rag.search(item["question"], item.get("intent"))
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    total = len(gold["questions"])
+    return {
+        **{f"recall@{k}": round(hits[k] / total, 3) for k in K_VALUES},
+        "mrr": round(sum(reciprocal_ranks) / total, 3),
+        "search_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+        "context_tokens_mean": round(sum(context_tokens) / total, 1),
+        "context_recall": round(context_hits / total, 3),
+        "misses@3": misses,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent.parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gold", type=Path, default=GOLD_PATH)
+    parser.add_argument("--backends", default="numpy,chroma")
+    parser.add_argument("--repeats", type=int, default=20, help="проходов по вопросам для замера задержки")
+    parser.add_argument("--output", type=Path, help="куда сохранить JSON-отчёт")
+    parser.add_argument("--strict", action="store_true", help="код возврата 1 при превышении бюджета")
+    defaults = ContextBudget()
+    parser.add_argument("--context-budget", type=int, default=defaults.budget_tokens, help="бюджет контекста, токенов")
+    parser.add_argument("--context-candidates", type=int, default=defaults.candidates)
+    # Абсолютный порог подобран под расстояния OpenAI-эмбеддингов, у заглушки шкала другая
+    parser.add_argument("--context-max-distance", type=float, default=0.0)
+    parser.add_argument("--context-max-gap", type=float, default=defaults.max_gap)
+    parser.add_argument("--context-trim", action="store_true", default=defaults.trim_sentences,
+                        help="оставлять только предложения со словами запроса")
+    args = parser.parse_args()
+    budget = ContextBudget(args.context_budget, args.context_candidates, args.context_max_distance,
+                           args.context_max_gap, args.context_trim)
+
+    gold = json.loads(args.gold.read_text(encoding="utf-8"))
+    budgets = gold.get("budgets", {}).get("search_p95_ms", {})
+    with tempfile.TemporaryDirectory() as tmp:
+        probe = RAGSystem(gold["park_id"], persist_dir=Path(tmp), embedding_fn=StubEmbeddingFunction(), backend="numpy")
+        chunks = [chunk["content"] for chunk in probe.knowledge_chunks()]
+
+    report = {
+        "gold_version": gold["version"],
+        "commit": git_commit(),
+        "questions": len(gold["questions"]),
+        "config": {
+            "chunk_tokens": RAG_CHUNK_TOKENS,
+            "chunk_overlap": RAG_CHUNK_OVERLAP,
+            "hybrid_candidates": RAG_HYBRID_CANDIDATES,
+            "rrf_k": RAG_RRF_K,
+            "embedding": StubEmbeddingFunction.name(),
+            "context": vars(budget),
+        },
+        "chunks": chunk_stats(chunks),
+        "runs": {},
+    }
+
+    over_budget = []
+    for backend in args.backends.split(","):
+        for mode, hybrid in [("vector", False), ("hybrid", True)]:
+            result = run(gold, backend, hybrid, args.repeats, budget)
+            latency_budget = budgets.get(backend)
+            result["within_budget"] = latency_budget is None or result["search_ms"]["p95"] <= latency_budget
+            if not result["within_budget"]:
+                over_budget.append(f"{backend}/{mode}")
+            report["runs"][f"{backend}/{mode}"] = result
+            print(f"{backend + '/' + mode:<15} recall@1 {result['recall@1']:.2f}  recall@3 {result['recall@3']:.2f}  "
+                  f"recall@5 {result['recall@5']:.2f}  MRR {result['mrr']:.2f}  "
+                  f"p50 {result['search_ms']['p50']:.2f} мс  p95 {result['search_ms']['p95']:.2f} мс"
+                  f"{'' if result['within_budget'] else f' (бюджет {latency_budget} мс превышен)'}  "
+                  f"контекст ~{result['context_tokens_mean']:.0f} ток. (recall {result['context_recall']:.2f})")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Отчёт: {args.output}")
+    if over_budget and args.strict:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Бенчмарк: задержка поиска в хранилищах векторов RAG (ChromaDB и NumPy).
+
+Индексирует knowledge/<park> в оба хранилища во временной папке.
+Эмбеддинги — детерминированные случайные векторы размерности OpenAI
+(сеть не нужна); запросы эмбеддятся заранее, замеряется только поиск
+с фильтром по намерению, как в RAGSystem.search. Печатает p50/p95
+и долю совпадений top-k между хранилищами.
+
+Запуск:
+    python scripts/bench_vector_store.py --queries 2000
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from chromadb.api.types import EmbeddingFunction
+
+from core.rag import RAGSystem, INTENT_CATEGORIES
+from core.vector_store import NumpyVectorStore
+
+
+class StubEmbeddingFunction(EmbeddingFunction):
+    """Заглушка OpenAIEmbeddingFunction: вектор определяется текстом."""
+
+    def __init__(self, dim: int = 1536):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "bench-stub"
+
+    def get_config(self) -> dict:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "StubEmbeddingFunction":
+        return StubEmbeddingFunction()
+
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--park", default="nn")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--mmap", action="store_true", help="NumPy: читать матрицу через memory map")
+    args = parser.parse_args()
+
+    embedding_fn = StubEmbeddingFunction()
+    intents = [None, *INTENT_CATEGORIES]
+    rng = np.random.default_rng(0)
+    queries = [
+        (vector, intents[i % len(intents)])
+        for i, vector in enumerate(rng.standard_normal((args.queries, embedding_fn.dim), dtype=np.float32))
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for backend in ["chroma", "numpy"]:
+            rag = RAGSystem(args.park, persist_dir=Path(tmp), embedding_fn=embedding_fn, backend=backend)
+            chunks = rag.knowledge_chunks()
+            rag.add_documents(chunks)
+            if backend == "numpy" and args.mmap:
+                rag.store = NumpyVectorStore(rag.store.path, rag.store.name, mmap=True)
+
+            # Прогрев
+            for vector, intent in queries[:50]:
+                rag.store.query(vector, args.top_k, INTENT_CATEGORIES.get(intent))
+
+            latencies, top = [], []
+            for vector, intent in queries:
+                start = time.perf_counter()
+                docs = rag.store.query(vector, args.top_k, INTENT_CATEGORIES.get(intent))
+                latencies.append((time.perf_counter() - start) * 1e6)
+                top.append([doc["title"] for doc in docs])
+            results[backend] = top
+            print(f"{backend:<7} чанков: {len(chunks):>3}  p50: {percentile(latencies, 0.5):8.1f} мкс  "
+                  f"p95: {percentile(latencies, 0.95):8.1f} мкс")
+
+    same = sum(a == b for a, b in zip(results["chroma"], results["numpy"]))
+    print(f"Совпадение top-{args.top_k}: {same}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
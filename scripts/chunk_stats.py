@@ -0,0 +1,51 @@
+"""Статистика чанков базы знаний (core/chunking.py).
+
+По каждому файлу knowledge/<park> — число чанков и их размеры в токенах,
+в конце — сводка и оценка контекста на один ход (n_results чанков
+среднего размера). Помогает подобрать RAG_CHUNK_TOKENS / RAG_CHUNK_OVERLAP /
+RAG_CHUNK_MIN_TOKENS.
+
+Запуск:
+    python scripts/chunk_stats.py --tokens 600 --overlap 100 --min-tokens 300
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from config.settings import KNOWLEDGE_DIR, RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP, RAG_CHUNK_MIN_TOKENS
+from core.chunking import chunk_text, chunk_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--park", default="nn")
+    parser.add_argument("--tokens", type=int, default=RAG_CHUNK_TOKENS, help="размер чанка в токенах")
+    parser.add_argument("--overlap", type=int, default=RAG_CHUNK_OVERLAP, help="перекрытие в токенах")
+    parser.add_argument("--min-tokens", type=int, default=RAG_CHUNK_MIN_TOKENS, help="до скольких токенов склеивать короткие разделы")
+    parser.add_argument("--n-results", type=int, default=3, help="чанков в контексте на один ход")
+    parser.add_argument("--show", help="напечатать чанки файла (имя без .txt)")
+    args = parser.parse_args()
+
+    all_chunks = []
+    for file_path in sorted((KNOWLEDGE_DIR / args.park).rglob("*.txt")):
+        chunks = chunk_text(file_path.read_text(encoding="utf-8"), args.tokens, args.overlap, args.min_tokens)
+        all_chunks += chunks
+        stats = chunk_stats(chunks)
+        print(f"{file_path.parent.name + '/' + file_path.name:<32} чанков: {stats['chunks']:>2}  "
+              f"токенов: {stats['min']:>4}–{stats['max']:<4} (медиана {stats['median']})")
+        if args.show == file_path.stem:
+            for i, chunk in enumerate(chunks, start=1):
+                print(f"\n--- чанк {i} ---\n{chunk}")
+            print()
+
+    stats = chunk_stats(all_chunks)
+    print(f"\nВсего: {stats}")
+    print(f"Контекст на ход (~{args.n_results} чанка): ~{round(stats['mean'] * args.n_results)} токенов")
+
+
+if __name__ == "__main__":
+    main()
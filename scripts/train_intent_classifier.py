@@ -0,0 +1,107 @@
+"""Обучение локального классификатора намерений (core/intent_classifier.py).
+
+Данные — сессии из data/bot.db: метка sessions.intent (только намерения
+роутера, ROUTER_INTENTS), текст — первое сообщение пользователя в сессии
+(с --all-messages — все его сообщения).
+Часть сессий откладывается для проверки: печатается точность и доля
+сообщений, которые всё равно уйдут в LLM (уверенность ниже порога).
+
+Запуск:
+    python scripts/train_intent_classifier.py --test-size 0.3
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-train")
+
+from config.settings import DB_PATH, INTENT_MODEL_PATH, INTENT_CLASSIFIER_THRESHOLD
+from core.intent_classifier import IntentClassifier, ROUTER_INTENTS
+from core.intent_router import detect_intent_rules
+
+
+def load_sessions(all_messages: bool) -> list[tuple[int, str, str]]:
+    """[(session_id, intent, текст)] из базы."""
+    conn = sqlite3.connect(DB_PATH)
+    placeholders = ", ".join("?" * len(ROUTER_INTENTS))
+    rows = conn.execute(
+        "SELECT s.id, s.intent, m.content FROM sessions s JOIN messages m ON m.session_id = s.id "
+        f"WHERE m.role = 'user' AND s.intent IN ({placeholders}) ORDER BY s.id, m.id",
+        ROUTER_INTENTS
+    ).fetchall()
+    conn.close()
+
+    samples, seen = [], set()
+    for session_id, intent, content in rows:
+        if not content or not content.strip():
+            continue
+        if not all_messages and session_id in seen:
+            continue
+        seen.add(session_id)
+        samples.append((session_id, intent, content))
+    return samples
+
+
+def evaluate(model: IntentClassifier, samples: list[tuple[int, str, str]], threshold: float):
+    """Точность на отложенных сессиях и доля обращений к LLM."""
+    texts = [text for _, _, text in samples]
+    proba = model.predict_proba(texts)
+    confident = correct = confident_correct = 0
+    # Сообщения, которые не поймали правила, — раньше они все шли в LLM
+    no_rules = no_rules_local = 0
+    for (_, intent, text), row in zip(samples, proba):
+        predicted = model.classes[int(row.argmax())]
+        is_confident = row.max() >= threshold
+        correct += predicted == intent
+        confident += is_confident
+        confident_correct += is_confident and predicted == intent
+        if detect_intent_rules(text) is None:
+            no_rules += 1
+            no_rules_local += is_confident
+
+    total = len(samples)
+    majority, majority_count = Counter(intent for _, intent, _ in samples).most_common(1)[0]
+    print(f"Отложено сообщений: {total}")
+    print(f"  точность модели: {correct / total:.1%} (всегда «{majority}»: {majority_count / total:.1%})")
+    if confident:
+        print(f"  уверенных (>= {threshold}): {confident}/{total}, точность среди них: {confident_correct / confident:.1%}")
+    if no_rules:
+        print(f"  не пойманы правилами: {no_rules}, из них уйдут в LLM: {no_rules - no_rules_local} "
+              f"(fallback rate {(no_rules - no_rules_local) / no_rules:.1%}, без модели — 100%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all-messages", action="store_true", help="брать все сообщения сессии, а не только первое")
+    parser.add_argument("--test-size", type=float, default=0.3, help="доля сессий для проверки")
+    parser.add_argument("--threshold", type=float, default=INTENT_CLASSIFIER_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=INTENT_MODEL_PATH)
+    args = parser.parse_args()
+
+    samples = load_sessions(args.all_messages)
+    print(f"Сообщений: {len(samples)}, метки: {dict(Counter(intent for _, intent, _ in samples))}")
+
+    # Делим по сессиям, чтобы сообщения одного диалога не попали в обе части
+    sessions = sorted({session_id for session_id, _, _ in samples})
+    random.Random(args.seed).shuffle(sessions)
+    test_sessions = set(sessions[:max(1, int(len(sessions) * args.test_size))])
+    train = [s for s in samples if s[0] not in test_sessions]
+    test = [s for s in samples if s[0] in test_sessions]
+
+    model = IntentClassifier.train([text for _, _, text in train], [intent for _, intent, _ in train])
+    evaluate(model, test, args.threshold)
+
+    # Итоговая модель — на всех данных
+    model = IntentClassifier.train([text for _, _, text in samples], [intent for _, intent, _ in samples])
+    model.save(args.output)
+    print(f"\nМодель сохранена: {args.output} ({len(model.vocab)} n-грамм, классы: {model.classes})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.agent import Agent, MarkdownStreamCleaner, ReplyFieldDecoder, agent
+
+
+def chat_response(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+async def fake_stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+TURN_JSON = json.dumps({"reply": "Записала!", "lead": {"extras": ["аниматор"]}}, ensure_ascii=False)
+
+
+def stream_clean(chunks) -> tuple[list[str], str]:
+    """Прогнать куски через очистку markdown: (что показывалось после каждого куска, итоговый текст)."""
+    cleaner = MarkdownStreamCleaner(agent._clean_markdown)
+    shown = [cleaner.feed(chunk) for chunk in chunks]
+    return shown, "".join(shown) + cleaner.finish()
+
+
+class TestMarkdownStreamCleaner(unittest.TestCase):
+    def test_bold_split_across_chunks(self):
+        shown, text = stream_clean(["Цена **11", "90 руб** в ", "будни. "])
+        self.assertEqual(shown[0], "Цена ")
+        self.assertEqual(text, "Цена 1190 руб в будни. ")
+
+    def test_link_waits_until_closed(self):
+        shown, text = stream_clean(["Афиша: [сайт](https://", "jucity.ru) и ", "ещё"])
+        self.assertEqual(shown[:2], ["Афиша: ", "сайт: https://jucity.ru и "])
+        self.assertEqual(text, "Афиша: сайт: https://jucity.ru и ещё")
+
+    def test_bullet_list_is_not_held(self):
+        chunks = ["В пакет входит:\n", "* аниматор\n", "* пицца\n", "* торт "]
+        shown, text = stream_clean(chunks)
+        # Звёздочки пунктов — не курсив: текст отдаётся сразу, а не после MAX_PENDING символов
+        self.assertEqual(shown[:2], ["В пакет входит:\n", "- аниматор\n"])
+        self.assertEqual(text, "В пакет входит:\n- аниматор\n- пицца\n- торт ")
+
+    def test_unclosed_markup_released_after_max_pending(self):
+        cleaner = MarkdownStreamCleaner(agent._clean_markdown)
+        self.assertEqual(cleaner.feed("Считаем 5*3 "), "Считаем ")
+        self.assertEqual(cleaner.feed("слово "), "")
+        released = cleaner.feed("слово " * (MarkdownStreamCleaner.MAX_PENDING // 6 + 1))
+        self.assertTrue(released.startswith("5*3 слово"))
+
+
+class TestReplyFieldDecoder(unittest.TestCase):
+    def feed_all(self, raw: str, size: int) -> str:
+        decoder = ReplyFieldDecoder()
+        return "".join(decoder.feed(raw[i:i + size]) for i in range(0, len(raw), size))
+
+    def test_reply_decoded_in_any_split(self):
+        raw = json.dumps({"reply": "Привет! \"Круто\" — 45 мин\n🎉", "lead": {"phone": "8900"}})
+        for size in (1, 2, 3, 7, len(raw)):
+            self.assertEqual(self.feed_all(raw, size), "Привет! \"Круто\" — 45 мин\n🎉")
+
+    def test_escaped_unicode_and_emoji(self):
+        raw = json.dumps({"reply": "Ура 🎉!"}, ensure_ascii=True)
+        for size in (1, 5):
+            self.assertEqual(self.feed_all(raw, size), "Ура 🎉!")
+
+    def test_nothing_after_reply_closes(self):
+        decoder = ReplyFieldDecoder()
+        self.assertEqual(decoder.feed('{"reply": "Да"'), "Да")
+        self.assertEqual(decoder.feed(', "lead": {"customer_name": "Анна"}}'), "")
+        self.assertTrue(decoder.done)
+
+
+class TestParseTurn(unittest.TestCase):
+    def test_reply_and_lead_fields(self):
+        content = json.dumps({
+            "reply": "**Отлично!** Записала дату.",
+            "lead": {"customer_name": None, "event_date": "11 февраля", "kids_count": 8, "phone": "", "extras": []},
+        }, ensure_ascii=False)
+        result = agent._parse_turn(content)
+        self.assertEqual(result.reply, "Отлично! Записала дату.")
+        # Пустые значения модели — «не знаю», а не стирание уже собранных полей
+        self.assertEqual(result.lead_updates, {"event_date": "11 февраля", "kids_count": 8})
+
+    def test_not_json_is_shown_as_text(self):
+        result = agent._parse_turn("Извините, *не поняла* вопрос")
+        self.assertEqual(result.reply, "Извините, не поняла вопрос")
+        self.assertEqual(result.lead_updates, {})
+
+    def test_missing_fields(self):
+        self.assertEqual(agent._parse_turn('{"reply": null, "lead": null}').reply, "")
+        self.assertEqual(agent._parse_turn(None).lead_updates, {})
+
+
+class TestBuildMessages(unittest.TestCase):
+    HISTORY = [{"role": "user", "content": "Сколько стоит?"}, {"role": "assistant", "content": "1190 руб."}]
+
+    def build(self, **kwargs) -> list[dict]:
+        kwargs.setdefault("history", self.HISTORY)
+        return agent._build_messages("А в выходные?", "general", **kwargs)
+
+    def test_static_prefix_first(self):
+        messages = self.build(rag_context="Фрагмент базы знаний №42", summary="Клиент спрашивал про цены")
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertNotIn("№42", messages[0]["content"])
+        self.assertEqual(messages[1:3], self.HISTORY)
+        # Контекст хода — после истории, перед вопросом
+        self.assertEqual(messages[3]["role"], "system")
+        self.assertIn("Фрагмент базы знаний №42", messages[3]["content"])
+        self.assertIn("Клиент спрашивал про цены", messages[3]["content"])
+        self.assertEqual(messages[-1], {"role": "user", "content": "А в выходные?"})
+
+    def test_prefix_is_byte_identical_across_turns(self):
+        first = self.build(rag_context="Будни: 1190 руб")
+        second = self.build(rag_context="Выходные: 1590 руб", history=self.HISTORY + [
+            {"role": "user", "content": "А в выходные?"}, {"role": "assistant", "content": "1590 руб."}
+        ])
+        self.assertEqual(first[:3], second[:3])
+
+    def test_no_context_message_without_context(self):
+        messages = self.build(history=None)
+        self.assertEqual([m["role"] for m in messages], ["system", "user"])
+
+
+class TestTurnPrompt(unittest.TestCase):
+    LEAD = {"event_date": "11 февраля", "kids_count": 8, "time": "14:30", "customer_name": "Анна"}
+    MESSAGE = "Вот мой номер 89161234567, а пиццу можно заказать?"
+
+    def setUp(self):
+        self.agent = Agent(client=SimpleNamespace(), max_concurrency=2)
+
+    @staticmethod
+    def lead_state(messages: list[dict]) -> str:
+        return "\n".join(m["content"] for m in messages if m["role"] == "system")
+
+    @patch("core.agent.LLM_HEDGE_ENABLED", False)
+    def test_typed_phone_is_not_asked_again(self):
+        chat = AsyncMock(return_value=chat_response(TURN_JSON))
+        with patch.object(self.agent.llm, "chat", chat):
+            result = asyncio.run(self.agent.generate_turn(self.MESSAGE, lead_data=dict(self.LEAD)))
+
+        prompt = self.lead_state(chat.await_args.kwargs["messages"])
+        self.assertNotIn("→ Номер телефона", prompt)
+        self.assertIn("ВСЕ ОБЯЗАТЕЛЬНЫЕ ДАННЫЕ СОБРАНЫ", prompt)
+        self.assertEqual(result.lead_updates["phone"], "89161234567")
+
+    @patch("core.agent.LLM_HEDGE_ENABLED", False)
+    def test_stream_turn_prompt_sees_typed_phone(self):
+        requests = []
+
+        def stream(operation, **kwargs):
+            requests.append(kwargs)
+            return fake_stream(TURN_JSON)
+
+        async def collect():
+            return [text async for text in self.agent.stream_turn(self.MESSAGE, lead_data=dict(self.LEAD))]
+
+        with patch.object(self.agent.llm, "stream", stream):
+            asyncio.run(collect())
+
+        prompt = self.lead_state(requests[0]["messages"])
+        self.assertNotIn("→ Номер телефона", prompt)
+        self.assertIn("ВСЕ ОБЯЗАТЕЛЬНЫЕ ДАННЫЕ СОБРАНЫ", prompt)
+
+
+class TestAgentHedging(unittest.TestCase):
+    def setUp(self):
+        self.agent = Agent(client=SimpleNamespace(), max_concurrency=2)
+
+    @patch("core.agent.LLM_HEDGE_ENABLED", True)
+    def test_turn_and_streams_are_hedged(self):
+        hedged_chat = AsyncMock(return_value=chat_response(TURN_JSON))
+        with patch.object(self.agent.llm, "hedged_chat", hedged_chat), \
+                patch.object(self.agent.llm, "hedged_stream", lambda *a, **k: fake_stream("При", "вет")):
+            result = asyncio.run(self.agent.generate_turn("нужен аниматор"))
+
+            async def collect():
+                return [text async for text in self.agent.stream_response("привет", "general")]
+
+            streamed = asyncio.run(collect())
+
+        self.assertEqual(result.reply, "Записала!")
+        self.assertEqual(hedged_chat.await_args.args[0], "turn")
+        self.assertEqual("".join(streamed), "Привет")
+
+    @patch("core.agent.LLM_HEDGE_ENABLED", False)
+    def test_hedging_disabled_uses_plain_calls(self):
+        chat = AsyncMock(return_value=chat_response(TURN_JSON))
+        hedged_chat = AsyncMock()
+        with patch.object(self.agent.llm, "chat", chat), patch.object(self.agent.llm, "hedged_chat", hedged_chat):
+            asyncio.run(self.agent.generate_turn("нужен аниматор"))
+        chat.assert_awaited_once()
+        hedged_chat.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.answer_cache import AnswerCache, has_personal_data, mentions_name
+
+
+async def fake_embed(text: str) -> list[float]:
+    return [1.0, 0.0, 0.0]
+
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(embed=fake_embed)
+
+    def roundtrip(self, answer: str, message: str = "Сколько стоит билет?", **kwargs):
+        lookup = asyncio.run(self.cache.lookup(message, "general", **kwargs))
+        self.cache.store(lookup, answer)
+        return asyncio.run(self.cache.lookup("Сколько стоит билет?", "general")).answer
+
+    def test_fresh_dialog_answer_is_shared(self):
+        self.assertEqual(self.roundtrip("Билет в будни — 1190 руб."), "Билет в будни — 1190 руб.")
+
+    def test_answer_with_history_is_not_stored(self):
+        history = [{"role": "user", "content": f"сообщение {i}"} for i in range(4)]
+        self.assertIsNone(self.roundtrip("Как я говорила, 1190 руб.", history=history))
+        self.assertIsNone(self.roundtrip("1190 руб.", summary="Клиент спрашивал про банкет"))
+
+    def test_personal_data_is_not_stored(self):
+        self.assertIsNone(self.roundtrip("Анна, билет в будни — 1190 руб."))
+        self.assertIsNone(self.roundtrip("1190 руб., перезвоним.", message="Сколько стоит билет? 89161234567"))
+
+    def test_personal_data_detection(self):
+        self.assertTrue(has_personal_data("Меня зовут Ольга, сколько стоит?"))
+        self.assertTrue(has_personal_data("пишите на mama@example.com"))
+        self.assertFalse(has_personal_data("Сколько стоит билет в выходные?"))
+        self.assertFalse(mentions_name("Парк работает с 10:00. Носки обязательны!"))
+
+    def test_knowledge_version_is_throttled(self):
+        with patch("config.prompts.get_knowledge_version", return_value="v1") as version:
+            for _ in range(3):
+                asyncio.run(self.cache.lookup("Сколько стоит билет?", "general", park_id="test"))
+        version.assert_called_once_with("test")
+
+
+if __name__ == '__main__':
+    unittest.main()
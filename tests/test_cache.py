@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+import unittest
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.cache import TTLCache, SemanticCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "a" становится самым свежим
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_concurrent_access(self):
+        cache = TTLCache(maxsize=50, ttl=60)
+
+        def worker(offset):
+            for i in range(500):
+                cache.set((offset, i), i)
+                cache.get((offset, i - 1))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache), 50)
+        self.assertEqual(cache.stats()["evictions"], 4 * 500 - 50)
+
+    def test_ttl_expiry(self):
+        cache = TTLCache(maxsize=10, ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class TestSemanticCache(unittest.TestCase):
+    def test_similar_query_hits(self):
+        cache = SemanticCache(maxsize=10, ttl=60, threshold=0.9)
+        cache.set([1.0, 0.0, 0.0], ("general", "v1"), "ответ")
+        self.assertEqual(cache.get([0.95, 0.1, 0.0], ("general", "v1")), "ответ")
+        self.assertIsNone(cache.get([0.0, 1.0, 0.0], ("general", "v1")))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_namespace_isolation(self):
+        cache = SemanticCache(maxsize=10, ttl=60, threshold=0.9)
+        cache.set([1.0, 0.0], ("general", "v1"), "старый ответ")
+        # Новая версия базы знаний — старый ответ не находится
+        self.assertIsNone(cache.get([1.0, 0.0], ("general", "v2")))
+        self.assertIsNone(cache.get([1.0, 0.0], ("events", "v1")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import unittest
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.chunking import chunk_text, chunk_stats, is_heading
+from core.utils import estimate_tokens
+
+DOCUMENT = """Цены и скидки
+
+ДЕТСКИЙ БИЛЕТ (весь день):
+- Понедельник: 990 руб
+- Будни: 1190 руб
+- Выходные: 1590 руб
+
+Взрослые сопровождающие — БЕСПЛАТНО!
+
+---
+
+СКИДКИ:
+
+1. Дети 1-4 года: скидка 20% в будни
+
+2. Многодетные семьи: скидка 30%
+
+3. После 20:00: скидка 50%
+"""
+
+
+class TestChunking(unittest.TestCase):
+    def test_headings(self):
+        self.assertTrue(is_heading("ДЕТСКИЙ БИЛЕТ (весь день):"))
+        self.assertFalse(is_heading("Взрослые сопровождающие — БЕСПЛАТНО!"))
+        self.assertFalse(is_heading("- ВАЖНО:"))
+
+    def test_sections_and_lists_stay_whole(self):
+        chunks = chunk_text(DOCUMENT, max_tokens=300, overlap_tokens=0, min_tokens=0)
+        self.assertEqual(len(chunks), 2)
+        # Список цен не разрезан, у каждого чанка шапка с названием документа
+        self.assertIn("- Понедельник: 990 руб\n- Будни: 1190 руб\n- Выходные: 1590 руб", chunks[0])
+        self.assertTrue(all(chunk.startswith("Цены и скидки\n") for chunk in chunks))
+        self.assertTrue(chunks[1].startswith("Цены и скидки\nСКИДКИ:\n\n1. Дети"))
+
+    def test_small_budget_with_overlap(self):
+        chunks = chunk_text(DOCUMENT, max_tokens=30, overlap_tokens=20, min_tokens=0)
+        # Продолжение раздела получает его заголовок в шапке и повторяет последний пункт
+        self.assertEqual(chunks[1], "Цены и скидки\nДЕТСКИЙ БИЛЕТ (весь день):\n\nВзрослые сопровождающие — БЕСПЛАТНО!")
+        self.assertEqual(chunks[3], "Цены и скидки\nСКИДКИ:\n\n2. Многодетные семьи: скидка 30%\n\n3. После 20:00: скидка 50%")
+        self.assertIn("2. Многодетные семьи", chunks[2])
+
+    def test_short_sections_are_merged(self):
+        chunks = chunk_text(DOCUMENT, max_tokens=300, overlap_tokens=0, min_tokens=100)
+        self.assertEqual(len(chunks), 1)
+        # Заголовок второго раздела остаётся перед его пунктами
+        self.assertIn("БЕСПЛАТНО!\n\nСКИДКИ:\n1. Дети 1-4 года", chunks[0])
+
+    def test_oversized_paragraph_is_split(self):
+        text = "Правила\n\n" + " ".join(f"Пункт номер {i} правил посещения парка." for i in range(60))
+        chunks = chunk_text(text, max_tokens=50, overlap_tokens=0)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunk_stats(chunks)["chunks"], len(chunks))
+        self.assertLessEqual(chunk_stats(chunks)["max"], 50 + estimate_tokens("Правила\n\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import unittest
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.context_budget import ContextBudget, select_context, format_context, trim_to_query
+from core.lexical import tokenize
+from core.utils import estimate_tokens
+
+
+def doc(doc_id: str, content: str, distance: float, title: str = "") -> dict:
+    return {"id": doc_id, "content": content, "category": "general", "title": title or doc_id, "distance": distance}
+
+
+PRICES = """Цены и скидки
+ДЕТСКИЙ БИЛЕТ:
+
+- Будни: 1190 руб
+- Выходные: 1590 руб
+
+СКИДКИ:
+- Многодетные семьи: скидка 30%. Нужно удостоверение."""
+
+PACKAGES = """Пакетные предложения
+
+ПАКЕТ «КРУТО» (45 минут)
+Состав:
+- Игровая программа
+- Мини-дискотека
+
+ПАКЕТ «СУПЕР» (60 минут)
+Состав:
+- Шоу мыльных пузырей"""
+
+
+class TestSelectContext(unittest.TestCase):
+    def test_first_doc_is_always_kept(self):
+        budget = ContextBudget(max_distance=0.5, max_gap=0.1)
+        selected = select_context([doc("a", "Далёкий текст", 1.9)], "вопрос", budget)
+        self.assertEqual([d["id"] for d in selected], ["a"])
+
+    def test_distance_threshold_and_gap(self):
+        docs = [doc("a", "Первый", 0.8), doc("b", "Второй", 0.9), doc("c", "Третий", 1.05), doc("d", "Четвёртый", 1.6)]
+        self.assertEqual([d["id"] for d in select_context(docs, "", ContextBudget(max_distance=1.5, max_gap=0.2))],
+                         ["a", "b"])
+        self.assertEqual([d["id"] for d in select_context(docs, "", ContextBudget(max_distance=0, max_gap=1.0))],
+                         ["a", "b", "c", "d"])
+
+    def test_overlapping_paragraphs_are_not_repeated(self):
+        first = "Правила\n\nПервый абзац про носки.\n\nВторой абзац про еду."
+        second = "Правила\n\nВторой абзац про еду.\n\nТретий абзац про колясками."
+        duplicate = "Правила\n\nПервый абзац про носки."
+        budget = ContextBudget(max_distance=0, max_gap=1.0)
+        selected = select_context([doc("a", first, 0.5), doc("b", second, 0.6), doc("c", duplicate, 0.7)], "", budget)
+
+        self.assertEqual([d["id"] for d in selected], ["a", "b"])
+        # Шапка чанка остаётся, повтор абзаца — нет
+        self.assertEqual(selected[1]["content"], "Правила\n\nТретий абзац про колясками.")
+
+    def test_budget_skips_and_truncates(self):
+        long_text = "\n".join(f"- Пункт номер {i}: подробное описание услуги" for i in range(100))
+        budget = ContextBudget(budget_tokens=120, max_distance=0, max_gap=1.0)
+
+        selected = select_context([doc("a", long_text, 0.5), doc("b", "Коротко", 0.6)], "", budget)
+        self.assertEqual([d["id"] for d in selected], ["a"])
+        self.assertLessEqual(estimate_tokens(format_context(selected)), 120)
+
+        selected = select_context([doc("a", "Коротко", 0.5), doc("b", long_text, 0.6), doc("c", "Ещё", 0.6)], "", budget)
+        self.assertEqual([d["id"] for d in selected], ["a", "c"])
+
+    def test_trim_sentences(self):
+        budget = ContextBudget(max_distance=0, max_gap=1.0, trim_sentences=True)
+        selected = select_context([doc("a", PRICES, 0.5)], "Что для многодетных?", budget)
+        self.assertEqual(selected[0]["content"],
+                         "Цены и скидки\nДЕТСКИЙ БИЛЕТ:\n\nСКИДКИ:\n- Многодетные семьи: скидка 30%.")
+
+    def test_format_context(self):
+        self.assertEqual(format_context([doc("a", "Текст", 0.1, title="Цены"), {"content": "Без заголовка"}]),
+                         "### Цены\nТекст\n\nБез заголовка")
+
+
+class TestTrimToQuery(unittest.TestCase):
+    def test_paragraph_about_query_is_kept_whole(self):
+        trimmed = trim_to_query(PACKAGES, set(tokenize("Что входит в «Круто»?")))
+        self.assertIn("- Мини-дискотека", trimmed)
+        self.assertNotIn("СУПЕР", trimmed)
+        self.assertTrue(trimmed.startswith("Пакетные предложения"))
+
+    def test_no_matches_returns_chunk_unchanged(self):
+        self.assertEqual(trim_to_query(PRICES, set(tokenize("парковка"))), PRICES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.agent import Agent
+from core.embedding_cache import CachedEmbeddings, EmbeddingCache
+from core.rag import RAGSystem
+from tests.test_rag import HashEmbeddingFunction
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "cache.db"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_hits_skip_inner_function(self):
+        inner = HashEmbeddingFunction()
+        embedding_fn = CachedEmbeddings(inner, EmbeddingCache(self.path), model="test")
+        first = embedding_fn(["цены на билеты", "часы работы", "цены на билеты"])
+        self.assertEqual(inner.requests, 1)
+        second = embedding_fn(["часы работы", "цены на билеты"])
+        self.assertEqual(inner.requests, 1)
+        np.testing.assert_allclose(second[1], first[0])
+        self.assertEqual(embedding_fn.cache.stats()["hits"], 2)
+
+    def test_persists_and_keys_by_model(self):
+        EmbeddingCache(self.path).put_many(["привет"], [np.ones(4)], "model-a")
+        cache = EmbeddingCache(self.path)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get_many(["привет"], "model-a")[0])
+        self.assertIsNone(cache.get_many(["привет"], "model-b")[0])
+
+    def test_eviction_keeps_recent(self):
+        cache = EmbeddingCache(self.path, maxsize=10)
+        cache.put_many([f"text {i}" for i in range(10)], np.ones((10, 4)), "m")
+        cache.get_many(["text 0"], "m")
+        cache.put_many(["text 10"], np.ones((1, 4)), "m")
+        self.assertLessEqual(len(cache), 10)
+        self.assertIsNotNone(cache.get_many(["text 0"], "m")[0])
+        self.assertIsNone(cache.get_many(["text 1"], "m")[0])
+
+    def test_hits_do_not_write(self):
+        cache = EmbeddingCache(self.path)
+        cache.put_many(["привет"], [np.ones(4)], "m")
+        stored = cache._conn.execute("SELECT last_used FROM embeddings").fetchone()[0]
+        with patch("core.embedding_cache.time.time", return_value=stored + 60), \
+                patch.object(cache, "_conn", wraps=cache._conn) as conn:
+            for _ in range(3):
+                cache.get_many(["привет"], "m")
+        conn.executemany.assert_not_called()
+        conn.commit.assert_not_called()
+
+        # Время обращения пишется пачкой
+        cache.flush()
+        self.assertEqual(cache._conn.execute("SELECT last_used FROM embeddings").fetchone()[0], stored + 60)
+
+    def test_agent_embed_uses_cache_off_event_loop(self):
+        cache = EmbeddingCache(self.path)
+        threads = []
+        for name in ("get_many", "put_many"):
+            method = getattr(cache, name)
+            setattr(cache, name, lambda *args, _method=method: threads.append(threading.get_ident()) or _method(*args))
+
+        agent = Agent(client=SimpleNamespace(), max_concurrency=2)
+        with patch("core.agent.embedding_cache", cache), \
+                patch.object(agent.llm, "embed", AsyncMock(return_value=[0.5, 0.5])) as embed:
+            self.assertEqual(asyncio.run(agent.embed("часы работы")), [0.5, 0.5])
+            self.assertEqual(asyncio.run(agent.embed("часы работы")), [0.5, 0.5])
+
+        embed.assert_awaited_once()
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_reindex_after_clear_uses_cache(self):
+        inner = HashEmbeddingFunction()
+        rag = RAGSystem("nn", persist_dir=Path(self._tmp.name) / "chroma", embedding_fn=inner,
+                        cache=EmbeddingCache(self.path))
+        chunks = [{"id": f"doc_{i}", "content": f"документ {i}", "category": "general", "title": ""} for i in range(5)]
+        rag.add_documents(chunks)
+        rag.search("документ 1")
+        requests = inner.requests
+        rag.clear()
+        rag.add_documents(chunks)
+        rag.search("документ 1")
+        self.assertEqual(inner.requests, requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
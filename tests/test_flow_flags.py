@@ -0,0 +1,29 @@
+import os
+import unittest
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.notifications import detect_flow_flags, FlowFlags
+
+
+class TestFlowFlags(unittest.TestCase):
+    def test_lost_item_rules(self):
+        self.assertTrue(detect_flow_flags("Я потерял шапку").lost_item)
+        # Слабый триггер срабатывает только с контекстом потери
+        self.assertTrue(detect_flow_flags("Забыли телефон вчера").lost_item)
+        self.assertFalse(detect_flow_flags("Забыли спросить").lost_item)
+        # Контекст покупки отменяет потеряшки
+        self.assertFalse(detect_flow_flags("Потеряли носки, где купить новые?").lost_item)
+
+    def test_several_flags_in_one_pass(self):
+        flags = detect_flow_flags("Срочно! Хочу перенести бронь и заказать фотографа")
+        self.assertEqual(flags, FlowFlags(human_escalation=True, booking_change=True, photo_order=True))
+
+    def test_lost_exit(self):
+        self.assertTrue(detect_flow_flags("Стоп, я о другом").lost_exit)
+        self.assertEqual(detect_flow_flags("Сколько стоит вход?"), FlowFlags())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core import history
+from core.history import HistoryWindow, fold_summary, load_history, schedule_summary
+from db import Base, Message, Session
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        self.db = self.SessionLocal()
+        self.session = Session(telegram_id="1")
+        self.db.add(self.session)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_messages(self, count: int, words: int = 10) -> list[int]:
+        ids = []
+        for i in range(count):
+            message = Message(session_id=self.session.id, role="user" if i % 2 == 0 else "assistant",
+                              content=f"сообщение {i} " + "слово " * words)
+            self.db.add(message)
+            self.db.commit()
+            ids.append(message.id)
+        return ids
+
+    def test_short_dialog_fits_window(self):
+        self.add_messages(4)
+        window = load_history(self.db, self.session.id)
+        self.assertEqual(len(window.messages), 4)
+        self.assertEqual(window.overflow, [])
+        self.assertTrue(window.messages[0]["content"].startswith("сообщение 0"))
+
+    def test_latest_message_always_kept(self):
+        self.add_messages(1, words=500)
+        window = load_history(self.db, self.session.id, budget=10)
+        self.assertEqual(len(window.messages), 1)
+
+    def test_unfolded_overflow_stays_in_prompt(self):
+        ids = self.add_messages(6)
+        window = load_history(self.db, self.session.id, budget=60)
+        # Выпавшее ещё не свёрнуто (меньше HISTORY_SUMMARY_BATCH_TOKENS) — в промпте всё
+        self.assertEqual(window.overflow_ids, ids[:len(window.overflow)])
+        self.assertGreater(len(window.overflow), 0)
+        self.assertEqual(len(window.messages), 6)
+
+    def test_everything_after_watermark_reaches_overflow(self):
+        ids = self.add_messages(30)
+        with patch.object(history, "HISTORY_MAX_MESSAGES", 5):
+            window = load_history(self.db, self.session.id)
+        self.assertEqual(window.overflow_ids, ids[:25])
+        self.assertTrue(window.messages[-1]["content"].startswith("сообщение 29"))
+
+    def test_fold_moves_watermark_and_hides_folded(self):
+        ids = self.add_messages(8)
+        window = load_history(self.db, self.session.id, budget=60)
+        folded = len(window.overflow)
+
+        summarize = AsyncMock(return_value="Клиент спрашивал про цены")
+        with patch.object(history, "SessionLocal", self.SessionLocal), \
+                patch.object(history.agent, "summarize_history", summarize):
+            asyncio.run(fold_summary(self.session.id, window))
+
+        self.db.expire_all()
+        self.assertEqual(self.session.summary_message_id, ids[folded - 1])
+        self.assertEqual(len(summarize.await_args.args[1]), folded)
+        window = load_history(self.db, self.session.id, budget=60)
+        self.assertEqual(window.summary, "Клиент спрашивал про цены")
+        self.assertEqual(len(window.messages), 8 - folded)
+        self.assertEqual(window.overflow, [])
+
+    def test_fold_is_limited_per_call(self):
+        ids = self.add_messages(20, words=100)
+        window = load_history(self.db, self.session.id, budget=60)
+        summarize = AsyncMock(return_value="резюме")
+        with patch.object(history, "SessionLocal", self.SessionLocal), \
+                patch.object(history.agent, "summarize_history", summarize), \
+                patch.object(history, "SUMMARY_FOLD_MAX_TOKENS", 300):
+            asyncio.run(fold_summary(self.session.id, window))
+
+        batch = summarize.await_args.args[1]
+        self.assertLess(len(batch), len(window.overflow))
+        self.db.expire_all()
+        self.assertEqual(self.session.summary_message_id, ids[len(batch) - 1])
+
+    def test_lagging_summary_does_not_grow_scan(self):
+        self.add_messages(200, words=100)
+        with patch.object(history, "estimate_tokens", wraps=history.estimate_tokens) as tokens:
+            window = load_history(self.db, self.session.id, budget=60)
+        # Читается окно и overflow до OVERFLOW_PROMPT_TOKENS, а не все 200 сообщений
+        self.assertLess(tokens.call_count, 10)
+        self.assertGreater(window.overflow_tokens, history.OVERFLOW_PROMPT_TOKENS)
+
+    def test_fold_starts_from_oldest_unread_message(self):
+        ids = self.add_messages(200, words=100)
+        window = load_history(self.db, self.session.id, budget=60)
+        self.assertGreater(window.overflow_ids[0], ids[0])
+
+        summarize = AsyncMock(return_value="резюме")
+        with patch.object(history, "SessionLocal", self.SessionLocal), \
+                patch.object(history.agent, "summarize_history", summarize):
+            asyncio.run(fold_summary(self.session.id, window))
+
+        batch = summarize.await_args.args[1]
+        self.assertTrue(batch[0]["content"].startswith("сообщение 0 "))
+        self.db.expire_all()
+        self.assertEqual(self.session.summary_message_id, ids[len(batch) - 1])
+
+    def test_failed_summary_keeps_watermark(self):
+        self.add_messages(8)
+        window = load_history(self.db, self.session.id, budget=60)
+        with patch.object(history, "SessionLocal", self.SessionLocal), \
+                patch.object(history.agent, "summarize_history", AsyncMock(return_value="")):
+            asyncio.run(fold_summary(self.session.id, window))
+        self.db.expire_all()
+        self.assertIsNone(self.session.summary_message_id)
+
+    def test_schedule_waits_for_batch(self):
+        window = HistoryWindow(overflow=[{"role": "user", "content": "коротко"}], overflow_ids=[1])
+        with patch.object(history, "fold_summary") as fold:
+            asyncio.run(self._schedule(window))
+        fold.assert_not_called()
+
+    def test_schedule_folds_full_batch(self):
+        self.add_messages(20, words=100)
+        window = load_history(self.db, self.session.id, budget=60)
+        self.assertGreaterEqual(window.overflow_tokens, history.HISTORY_SUMMARY_BATCH_TOKENS)
+        with patch.object(history, "fold_summary", AsyncMock()) as fold:
+            asyncio.run(self._schedule(window))
+        fold.assert_awaited_once_with(self.session.id, window)
+
+    def test_prompt_keeps_newest_overflow_when_folding_lags(self):
+        ids = self.add_messages(20, words=100)
+        window = load_history(self.db, self.session.id, budget=60)
+        kept = len(window.messages) - 1
+        # Самые старые несвёрнутые — только в overflow, промпт ограничен
+        self.assertLess(kept, len(window.overflow))
+        self.assertLessEqual(sum(history.estimate_tokens(m["content"]) for m in window.messages[:-1]),
+                             history.OVERFLOW_PROMPT_TOKENS)
+        self.assertEqual(window.overflow_ids[-1], ids[-2])
+
+    async def _schedule(self, window):
+        schedule_summary(self.session.id, window)
+        await asyncio.sleep(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.intent_classifier import IntentClassifier, char_ngrams
+
+TEXTS = [
+    "хотим отметить день рождения сына", "заказать аниматора на праздник", "банкет для детей на 10 человек",
+    "сколько стоит билет", "какие цены на вход", "до скольки вы работаете",
+    "привет", "здравствуйте", "добрый день",
+]
+LABELS = ["birthday"] * 3 + ["general"] * 3 + ["unknown"] * 3
+
+
+class TestIntentClassifier(unittest.TestCase):
+    def test_char_ngrams(self):
+        grams = char_ngrams("Ёлка!")
+        self.assertIn(" ел", grams)
+        self.assertIn("ка ", grams)
+        self.assertNotIn("!", "".join(grams))
+
+    def test_train_predict_and_roundtrip(self):
+        model = IntentClassifier.train(TEXTS, LABELS)
+        self.assertEqual(model.predict("отметить день рождения дочки")[0], "birthday")
+        self.assertEqual(model.predict("цены на билеты")[0], "general")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "model.npz"
+            model.save(path)
+            loaded = IntentClassifier.load(path)
+        self.assertEqual(loaded.classes, model.classes)
+        self.assertAlmostEqual(loaded.predict("привет")[1], model.predict("привет")[1], places=5)
+
+    def test_missing_model(self):
+        self.assertIsNone(IntentClassifier.load(Path("/nonexistent/model.npz")))
+
+
+if __name__ == '__main__':
+    unittest.main()
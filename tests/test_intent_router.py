@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import re
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.intent_router import IntentBatcher, IntentResult, detect_intent
+from core.llm_gateway import LLMGateway
+
+
+class StubGatewayClient:
+    """Заглушка AsyncOpenAI: «праздник» → birthday, остальное → general."""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, messages, **kwargs):
+        self.calls += 1
+        items = [
+            {"id": int(i), "intent": "birthday" if "праздник" in text else "general"}
+            for i, text in re.findall(r"^(\d+)\. (.*)$", messages[0]["content"], re.MULTILINE)
+        ]
+        content = json.dumps({"items": items})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+class TestIntentBatcher(unittest.TestCase):
+    def test_concurrent_messages_share_one_request(self):
+        client = StubGatewayClient()
+        batcher = IntentBatcher(window_ms=20, max_size=16, gateway=LLMGateway(client=client))
+
+        async def run():
+            return await asyncio.gather(
+                batcher.classify("хотим праздник"),
+                batcher.classify("а вы где"),
+                batcher.classify("хм"),
+            )
+
+        results = asyncio.run(run())
+        self.assertEqual([r.intent for r in results], ["birthday", "general", "general"])
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(batcher.stats()["avg_batch_size"], 3)
+
+    def test_full_batch_is_sent_without_waiting(self):
+        client = StubGatewayClient()
+        batcher = IntentBatcher(window_ms=10_000, max_size=2, gateway=LLMGateway(client=client))
+
+        async def run():
+            return await asyncio.wait_for(
+                asyncio.gather(batcher.classify("раз"), batcher.classify("два")), timeout=1
+            )
+
+        self.assertEqual(len(asyncio.run(run())), 2)
+
+
+
+class StubClassifier:
+    def __init__(self, intent: str, confidence: float):
+        self.result = (intent, confidence)
+
+    def predict(self, text):
+        return self.result
+
+
+class TestLocalClassifierRouting(unittest.TestCase):
+    def detect(self, classifier):
+        llm = AsyncMock(return_value=IntentResult(intent="general", confidence=0.7, reason="LLM"))
+        with patch("core.intent_router.intent_classifier", classifier), \
+                patch("core.intent_router.detect_intent_llm", llm), \
+                patch("core.intent_router.intent_batcher.classify", llm):
+            return asyncio.run(detect_intent("хм, а вот такой вопрос")), llm
+
+    def test_confident_router_intent_skips_llm(self):
+        result, llm = self.detect(StubClassifier("events", 0.99))
+        self.assertEqual(result.intent, "events")
+        llm.assert_not_awaited()
+
+    def test_flow_intent_from_model_is_ignored(self):
+        result, llm = self.detect(StubClassifier("lost_item", 0.99))
+        self.assertEqual(result.intent, "general")
+        llm.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import re
+import sqlite3
+import unittest
+from pathlib import Path
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.lead_extractor import extract_local, MONTHS
+
+DB_PATH = Path(__file__).parent.parent / "data" / "bot.db"
+
+
+class TestLocalExtractor(unittest.TestCase):
+    def test_full_booking_message(self):
+        result = extract_local("8 августа\n8 детей\n14.30 , комната любая\nНаталья 89998887766")
+        self.assertFalse(result.unresolved)
+        self.assertEqual(result.fields, {
+            "phone": "89998887766",
+            "event_date": "8 августа",
+            "time": "14:30",
+            "kids_count": 8,
+            "format": "Тематическая комната",
+            "customer_name": "Наталья",
+        })
+
+    def test_slots_and_dates(self):
+        self.assertEqual(extract_local("14 30").fields, {"time": "14:30"})
+        self.assertEqual(extract_local("5мая").fields, {"event_date": "5 мая"})
+        self.assertEqual(extract_local("на 24.01").fields, {"event_date": "24 января"})
+        self.assertEqual(extract_local("Детей: 8\nВзрослых 5").fields, {"kids_count": 8, "adults_count": 5})
+
+    def test_confirmation_needs_no_llm(self):
+        result = extract_local("Да все правильно")
+        self.assertFalse(result.unresolved)
+        self.assertEqual(result.fields, {})
+
+    def test_unresolved_content(self):
+        # Возраст — не количество детей, а вопрос требует LLM
+        result = extract_local("А ребенку 11 лет интересно будет в нем?")
+        self.assertTrue(result.unresolved)
+        self.assertEqual(result.fields, {"child_age": 11})
+        # Голое число непонятно к чему относится
+        self.assertTrue(extract_local("8").unresolved)
+        # Доп. услуги разбирает LLM
+        self.assertTrue(extract_local("нужен аниматор и торт").unresolved)
+
+    def test_word_next_to_phone_is_name_only_if_it_looks_like_one(self):
+        self.assertEqual(extract_local("наталья 89998887766").fields,
+                         {"phone": "89998887766", "customer_name": "Наталья"})
+        self.assertEqual(extract_local("89998887766 Мирослава").fields["customer_name"], "Мирослава")
+        for message in ["звоните 89998887766", "завтра 89998887766", "Завтра 89998887766",
+                        "вацап 89998887766", "Мирослава 89998887766"]:
+            result = extract_local(message)
+            self.assertTrue(result.unresolved, message)
+            self.assertNotIn("customer_name", result.fields, message)
+
+    def test_age_without_child_reference_is_unresolved(self):
+        result = extract_local("мне 25 лет")
+        self.assertTrue(result.unresolved)
+        self.assertNotIn("child_age", result.fields)
+        self.assertTrue(extract_local("5 лет").unresolved)
+        self.assertEqual(extract_local("сыну исполняется 7 лет").fields, {"child_age": 7})
+
+
+def _normalize(field, value):
+    value = str(value).strip().lower()
+    if field == "phone":
+        return re.sub(r"\D", "", value)[-10:]
+    if field == "time":
+        return value.replace(".", ":")
+    if field == "event_date" and re.fullmatch(r"\d{1,2}\.\d{2}", value):
+        day, month = value.split(".")
+        return f"{int(day)} {MONTHS[int(month) - 1]}"
+    return value
+
+
+@unittest.skipUnless(DB_PATH.exists(), "нет data/bot.db")
+class TestExtractorCorpus(unittest.TestCase):
+    """
+    Прогон по реальным сообщениям birthday-сессий из data/bot.db.
+
+    skip rate — доля сообщений, для которых LLM для извлечения не нужен;
+    agreement — совпадение с итоговой заявкой клиента для последнего
+    сообщения, где поле упоминалось (более ранние могли быть переписаны).
+    """
+
+    def test_corpus(self):
+        conn = sqlite3.connect(DB_PATH)
+        fields = ["customer_name", "phone", "event_date", "time", "kids_count", "adults_count", "child_age"]
+        leads = {}
+        for row in conn.execute(f"SELECT telegram_id, {', '.join(fields)} FROM leads"):
+            leads.setdefault(row[0], []).append(dict(zip(fields, row[1:])))
+        rows = conn.execute(
+            "SELECT s.telegram_id, m.content FROM messages m JOIN sessions s ON s.id = m.session_id "
+            "WHERE m.role = 'user' AND s.intent = 'birthday' ORDER BY m.id"
+        ).fetchall()
+        conn.close()
+        if not rows:
+            self.skipTest("в базе нет birthday-сообщений")
+
+        skipped = 0
+        last_mention = {}
+        for telegram_id, content in rows:
+            result = extract_local(content)
+            skipped += not result.unresolved
+            for field, value in result.fields.items():
+                last_mention[(telegram_id, field)] = value
+
+        agreed = compared = 0
+        for (telegram_id, field), value in last_mention.items():
+            expected = [
+                _normalize(field, lead[field])
+                for lead in leads.get(telegram_id, []) if lead.get(field) is not None
+            ]
+            if expected:
+                compared += 1
+                agreed += _normalize(field, value) in expected
+
+        skip_rate = skipped / len(rows)
+        agreement = agreed / compared if compared else 1.0
+        print(f"\nLead extractor corpus: {len(rows)} сообщений, "
+              f"LLM skip rate {skip_rate:.1%}, agreement {agreement:.1%} ({agreed}/{compared})")
+
+        self.assertGreater(skip_rate, 0.1)
+        self.assertGreaterEqual(agreement, 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core import lead_service
+from core.lead_service import MAX_PENDING_MESSAGES, apply_lead_updates, get_unextracted_messages, mark_lead_extracted
+from db import Base, Lead, Message, Session
+
+
+class LeadServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        patcher = patch.object(lead_service, "SessionLocal", self.SessionLocal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        db = self.SessionLocal()
+        lead = Lead(telegram_id="1")
+        db.add(lead)
+        db.commit()
+        self.lead_id = lead.id
+        db.close()
+
+    def get_lead(self) -> Lead:
+        db = self.SessionLocal()
+        try:
+            return db.query(Lead).filter(Lead.id == self.lead_id).first()
+        finally:
+            db.close()
+
+
+class TestApplyLeadUpdates(LeadServiceTestCase):
+    def test_fields_saved_with_sources(self):
+        lead = apply_lead_updates(self.get_lead(), {"phone": "+7 (916) 123-45-67", "kids_count": 8}, message_id=10)
+        self.assertEqual(lead.phone, "9161234567")
+        self.assertEqual(lead.kids_count, 8)
+        self.assertEqual(lead.extracted_message_id, 10)
+        self.assertEqual(lead.field_sources, {"phone": 10, "kids_count": 10})
+
+    def test_extras_are_appended(self):
+        apply_lead_updates(self.get_lead(), {"extras": ["аниматор"]}, message_id=10)
+        lead = apply_lead_updates(self.get_lead(), {"extras": ["аниматор", "пицца"]}, message_id=11)
+        self.assertEqual(json.loads(lead.extras), ["аниматор", "пицца"])
+
+    def test_profile_name_only_as_fallback(self):
+        lead = apply_lead_updates(self.get_lead(), {}, fallback_name="Anna", message_id=10)
+        self.assertEqual(lead.customer_name, "Anna")
+        self.assertEqual(lead.field_sources, {"customer_name": "profile"})
+
+        lead = apply_lead_updates(lead, {"customer_name": "Анна"}, fallback_name="Anna", message_id=11)
+        self.assertEqual(lead.customer_name, "Анна")
+        self.assertEqual(lead.field_sources["customer_name"], 11)
+
+    def test_nothing_to_apply(self):
+        lead = apply_lead_updates(self.get_lead(), {})
+        self.assertIsNone(lead.extracted_message_id)
+        self.assertIsNone(lead.customer_name)
+
+
+
+class TestExtractionWatermark(LeadServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        db = self.SessionLocal()
+        session = Session(telegram_id="1")
+        db.add(session)
+        db.commit()
+        self.session_id = session.id
+        self.ids = []
+        for i in range(12):
+            message = Message(session_id=session.id, role="user" if i % 2 == 0 else "assistant", content=f"сообщение {i}")
+            db.add(message)
+            db.commit()
+            self.ids.append(message.id)
+        db.close()
+
+    def test_new_lead_gets_no_backlog(self):
+        self.assertEqual(get_unextracted_messages(self.get_lead(), self.session_id, self.ids[-1]), [])
+
+    def test_user_messages_after_watermark(self):
+        mark_lead_extracted(self.lead_id, self.ids[5])
+        pending = get_unextracted_messages(self.get_lead(), self.session_id, before_id=self.ids[10])
+        # Только сообщения клиента, без текущего и ответов бота
+        self.assertEqual(pending, ["сообщение 6", "сообщение 8"])
+
+    def test_backlog_is_limited_to_latest(self):
+        mark_lead_extracted(self.lead_id, self.ids[0])
+        pending = get_unextracted_messages(self.get_lead(), self.session_id, before_id=self.ids[-1] + 1)
+        self.assertEqual(len(pending), MAX_PENDING_MESSAGES)
+        self.assertEqual(pending[-1], "сообщение 10")
+
+    def test_watermark_never_moves_back(self):
+        mark_lead_extracted(self.lead_id, self.ids[8], {"phone": self.ids[8]})
+        lead = mark_lead_extracted(self.lead_id, self.ids[4], {"room": self.ids[4]})
+        self.assertEqual(lead.extracted_message_id, self.ids[8])
+        self.assertEqual(lead.field_sources, {"phone": self.ids[8], "room": self.ids[4]})
+
+    def test_missing_lead(self):
+        self.assertIsNone(mark_lead_extracted(999, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
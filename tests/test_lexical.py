@@ -0,0 +1,44 @@
+import os
+import unittest
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.lexical import BM25Index, reciprocal_rank_fusion, stem, tokenize
+
+
+class TestStemmer(unittest.TestCase):
+    def test_word_forms_share_stem(self):
+        for forms in [("носки", "носков", "носками"), ("опушка", "опушке", "опушку"), ("батуты", "батутах")]:
+            self.assertEqual(len({stem(word) for word in forms}), 1, forms)
+
+    def test_tokenize_drops_stop_words(self):
+        self.assertEqual(tokenize("А носки нужны?"), ["носк", "нужн"])
+
+
+class TestBM25(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("socks", "Вход на батуты только в специальных носках. Носки продаются на кассе.", "shared")
+        self.index.add("glade", "Опушка — праздничная зона на 15 гостей", "birthday", "Опушка")
+        self.index.add("hours", "Парк работает ежедневно с 10 до 22", "general")
+
+    def test_ranking_and_filter(self):
+        self.assertEqual(self.index.search("носки нужны?")[0]["id"], "socks")
+        self.assertEqual([doc["id"] for doc in self.index.search("сколько стоит опушка")], ["glade"])
+        self.assertEqual(self.index.search("опушка", categories=["general"]), [])
+
+    def test_replace_and_remove(self):
+        self.index.add("glade", "Лесная комната", "birthday")
+        self.assertEqual(self.index.search("опушка"), [])
+        self.index.remove("socks")
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search("носки"), [])
+
+    def test_rrf(self):
+        fused = reciprocal_rank_fusion([[{"id": "a"}, {"id": "b"}], [{"id": "b"}, {"id": "c"}]], n_results=3)
+        self.assertEqual([doc["id"] for doc in fused], ["b", "a", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
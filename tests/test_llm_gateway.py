@@ -0,0 +1,222 @@
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core import llm_gateway as gateway_module
+from core.llm_gateway import LLMGateway, CircuitBreaker, CircuitOpenError, QueueTimeoutError
+from core.metrics import llm_metrics
+
+
+class FlakyClient:
+    """Заглушка AsyncOpenAI: первые `failures` запросов падают по таймауту."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TimeoutError("upstream timeout")
+        message = SimpleNamespace(content="ok")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class SlowPrimaryClient:
+    """Заглушка AsyncOpenAI: основная модель «зависает», fallback отвечает сразу."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, **kwargs):
+        if model == "primary":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        message = SimpleNamespace(content=model)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class HangingStreamClient:
+    """Заглушка AsyncOpenAI: обычный запрос отвечает через `delay`, поток отдаёт кусок и зависает."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, stream: bool = False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.delay)
+        message = SimpleNamespace(content="ok")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    def _stream(self):
+        client = self
+
+        class Stream:
+            def __init__(self):
+                self.sent = False
+
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                if not self.sent:
+                    self.sent = True
+                    delta = SimpleNamespace(content="Привет")
+                    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+                await asyncio.sleep(10)
+
+            async def close(self):
+                client.closed = True
+
+        return Stream()
+
+
+class SlowPrimaryStreamClient:
+    """Заглушка AsyncOpenAI: поток основной модели молчит, fallback отвечает сразу."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, stream: bool = False, **kwargs):
+        return self._stream(model)
+
+    async def _stream(self, model):
+        if model == "primary":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        for text in (model, " ok"):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+class TestLLMGateway(unittest.TestCase):
+    def setUp(self):
+        # Без реальных пауз между повторами
+        self._base = gateway_module.BACKOFF_BASE
+        gateway_module.BACKOFF_BASE = 0.0
+
+    def tearDown(self):
+        gateway_module.BACKOFF_BASE = self._base
+
+    def test_retries_transient_errors(self):
+        client = FlakyClient(failures=2)
+        gateway = LLMGateway(client=client, max_retries=2, breaker=CircuitBreaker(threshold=10))
+        response = asyncio.run(gateway.chat("test", model="m", messages=[]))
+        self.assertEqual(response.choices[0].message.content, "ok")
+        self.assertEqual(client.calls, 3)
+
+    def test_gives_up_after_max_retries(self):
+        client = FlakyClient(failures=5)
+        gateway = LLMGateway(client=client, max_retries=1, breaker=CircuitBreaker(threshold=10))
+        with self.assertRaises(TimeoutError):
+            asyncio.run(gateway.chat("test", model="m", messages=[]))
+        self.assertEqual(client.calls, 2)
+
+    def test_circuit_opens_and_fails_fast(self):
+        client = FlakyClient(failures=100)
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        gateway = LLMGateway(client=client, max_retries=5, breaker=breaker)
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(gateway.chat("test", model="m", messages=[]))
+        # Цепь разомкнулась после двух ошибок — третьего запроса к API не было
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(breaker.state, "open")
+
+    def test_half_open_probe_closes_circuit(self):
+        client = FlakyClient(failures=2)
+        breaker = CircuitBreaker(threshold=2, cooldown=0)
+        gateway = LLMGateway(client=client, max_retries=2, breaker=breaker)
+        asyncio.run(gateway.chat("test", model="m", messages=[]))
+        self.assertEqual(breaker.state, "closed")
+
+    @patch.object(gateway_module, "LLM_HEDGE_MIN_DELAY", 0.0)
+    @patch.object(gateway_module, "LLM_HEDGE_DELAY", 0.01)
+    def test_hedge_wins_and_cancels_primary(self):
+        llm_metrics.reset()
+        client = SlowPrimaryClient()
+        gateway = LLMGateway(client=client)
+        response = asyncio.run(gateway.hedged_chat(
+            "test", hedge_key="general", fallback_model="fallback", model="primary", messages=[]
+        ))
+        self.assertEqual(response.choices[0].message.content, "fallback")
+        self.assertTrue(client.cancelled)
+        self.assertEqual(llm_metrics.hedge_summary()["general"]["hedge_wins"], 1)
+
+
+    def test_full_queue_does_not_open_circuit(self):
+        client = HangingStreamClient(delay=0.2)
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        gateway = LLMGateway(client=client, max_concurrency=1, breaker=breaker)
+
+        async def run():
+            busy = asyncio.create_task(gateway.chat("test", model="m", messages=[]))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(QueueTimeoutError):
+                await gateway.chat("test", timeout=0.05, model="m", messages=[])
+            return await busy
+
+        self.assertEqual(asyncio.run(run()).choices[0].message.content, "ok")
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_stream_read_deadline_releases_slot(self):
+        client = HangingStreamClient()
+        gateway = LLMGateway(client=client, max_concurrency=1, breaker=CircuitBreaker(threshold=10))
+
+        async def run():
+            received = []
+            with self.assertRaises(TimeoutError):
+                async for delta in gateway.stream("test", read_timeout=0.05, model="m", messages=[]):
+                    received.append(delta)
+            # Место в очереди освобождено — следующий запрос проходит
+            response = await gateway.chat("test", timeout=0.5, model="m", messages=[])
+            return received, response
+
+        received, response = asyncio.run(run())
+        self.assertEqual(received, ["Привет"])
+        self.assertTrue(client.closed)
+        self.assertEqual(response.choices[0].message.content, "ok")
+
+
+    @patch.object(gateway_module, "LLM_HEDGE_MIN_DELAY", 0.0)
+    @patch.object(gateway_module, "LLM_HEDGE_DELAY", 0.01)
+    def test_hedged_stream_switches_to_first_speaker(self):
+        llm_metrics.reset()
+        client = SlowPrimaryStreamClient()
+        gateway = LLMGateway(client=client, max_concurrency=2)
+
+        async def run():
+            deltas = [d async for d in gateway.hedged_stream(
+                "test", hedge_key="general_stream", fallback_model="fallback", model="primary", messages=[]
+            )]
+            # Оба места в очереди свободны
+            _, semaphore = gateway._get_client()
+            return deltas, semaphore._value
+
+        deltas, free_slots = asyncio.run(run())
+        self.assertEqual(deltas, ["fallback", " ok"])
+        self.assertTrue(client.cancelled)
+        self.assertEqual(free_slots, 2)
+        self.assertEqual(llm_metrics.hedge_summary()["general_stream"]["hedge_wins"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import re
+import unittest
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from core.matcher import MultiPatternMatcher
+
+
+class TestMultiPatternMatcher(unittest.TestCase):
+    def test_same_as_sequential_search(self):
+        patterns = {
+            "birthday": [r'\bдр\b', r'меропри', r'торт[аыуе]?\b', r'день\s*рождени'],
+            "events": [r'мероприяти[яею]', r'что\s*будет', r'на\s*выходн'],
+            "general": [r'цен[аыу]', r'(?:часы|время)\s+работы'],
+        }
+        matcher = MultiPatternMatcher(patterns)
+        texts = [
+            "хотим отметить др, какая цена торта?",
+            "что будет на выходных? есть мероприятия?",
+            "день рождения, время работы",
+            "кедр",
+            "",
+        ]
+        for text in texts:
+            expected = {}
+            for label, label_patterns in patterns.items():
+                matched = [p for p in label_patterns if re.search(p, text)]
+                if matched:
+                    expected[label] = matched
+            self.assertEqual(matcher.match(text), expected, text)
+
+    def test_keywords_are_literal(self):
+        matcher = MultiPatternMatcher.from_keywords({"lost": ["потерял", "забыли"], "human": ["позовите менеджера", "(с)"]})
+        self.assertEqual(matcher.labels("Позовите менеджера, я потерял шапку".lower()), {"lost", "human"})
+        self.assertEqual(matcher.labels("с"), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
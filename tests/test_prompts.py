@@ -0,0 +1,57 @@
+import os
+import unittest
+from unittest.mock import patch
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import core  # noqa: F401  (config.prompts импортирует core.utils — сначала пакет core)
+from config import prompts
+from config.prompts import PromptCompiler
+
+
+class TestPromptCompiler(unittest.TestCase):
+    def setUp(self):
+        self.version = "v1"
+        self.builds = 0
+        version_patch = patch.object(prompts, "get_knowledge_version", lambda park_id: self.version)
+        build_patch = patch.object(prompts, "_build_system_prompt", self.build)
+        version_patch.start()
+        build_patch.start()
+        self.addCleanup(version_patch.stop)
+        self.addCleanup(build_patch.stop)
+
+    def build(self, intent: str, park_id: str = "nn") -> str:
+        self.builds += 1
+        return f"{intent}:{park_id}:{self.version}"
+
+    def test_prompt_is_built_once(self):
+        compiler = PromptCompiler(recheck_interval=0)
+        first = compiler.get("general")
+        self.assertIs(compiler.get("general"), first)
+        self.assertEqual(self.builds, 1)
+        compiler.get("birthday")
+        self.assertEqual(self.builds, 2)
+
+    def test_knowledge_change_rebuilds(self):
+        compiler = PromptCompiler(recheck_interval=0)
+        compiler.get("general")
+        self.version = "v2"
+        compiled = compiler.get("general")
+        self.assertEqual(compiled.text, "general:nn:v2")
+        self.assertEqual(compiled.version, "v2")
+        self.assertEqual(self.builds, 2)
+
+    def test_version_check_is_throttled(self):
+        compiler = PromptCompiler(recheck_interval=3600)
+        compiler.get("general")
+        self.version = "v2"
+        # Изменение заметят только после интервала перепроверки
+        self.assertEqual(compiler.get("general").text, "general:nn:v1")
+        self.assertEqual(compiler.knowledge_version(), "v1")
+        compiler.invalidate()
+        self.assertEqual(compiler.get("general").text, "general:nn:v2")
+
+
+if __name__ == '__main__':
+    unittest.main()
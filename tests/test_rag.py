@@ -0,0 +1,309 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+
+import numpy as np
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from chromadb.api.types import EmbeddingFunction
+
+from core.rag import RAGSystem, get_rag, normalize_query, rag
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Детерминированные «эмбеддинги» по словам текста (без сети), считает запросы."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def __call__(self, input):
+        self.requests += 1
+        vectors = []
+        for text in input:
+            vector = np.zeros(64, dtype=np.float32)
+            for word in text.lower().split():
+                vector[hash(word) % 64] += 1
+            vectors.append(vector / max(np.linalg.norm(vector), 1e-6))
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "test-hash"
+
+    def get_config(self) -> dict:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction()
+
+
+class TestRAGIndexing(unittest.TestCase):
+    backend = "chroma"
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.embedding_fn = HashEmbeddingFunction()
+        self.rag = RAGSystem("nn", persist_dir=Path(self._tmp.name), embedding_fn=self.embedding_fn,
+                             backend=self.backend)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_bulk_add_in_token_batches(self):
+        chunks = [
+            {"id": f"doc_{i}", "content": f"документ номер {i} про батуты", "category": "general", "title": f"doc {i}"}
+            for i in range(10)
+        ]
+        # ~8 токенов на чанк, лимит 20 → по 2 чанка в запросе
+        count = self.rag.add_documents(chunks, batch_tokens=20, concurrency=3)
+        self.assertEqual(count, 10)
+        self.assertEqual(self.embedding_fn.requests, 5)
+        self.assertEqual(self.rag.store.count(), 10)
+
+    def test_search_filters_by_intent(self):
+        self.rag.add_documents([
+            {"id": "a", "content": "цены на билеты в парк", "category": "general", "title": "Цены"},
+            {"id": "b", "content": "цены на аниматоров для праздника", "category": "birthday", "title": "ДР"},
+        ])
+        docs = self.rag.search("цены на билеты", intent="general", n_results=2)
+        self.assertEqual([doc["title"] for doc in docs], ["Цены"])
+
+    def test_lexical_only_without_embeddings(self):
+        self.rag.add_documents([
+            {"id": "a", "content": "Вход на батуты только в носках", "category": "shared", "title": "Носки"},
+            {"id": "b", "content": "Опушка — зона для праздника", "category": "birthday", "title": "Опушка"},
+        ])
+
+        def broken_embed(texts):
+            raise ConnectionError("no network")
+
+        self.rag.embed = broken_embed
+        self.assertEqual(self.rag.search("носки нужны?", n_results=1)[0]["title"], "Носки")
+        self.assertEqual(self.rag.search("сколько стоит опушка", n_results=1)[0]["title"], "Опушка")
+
+    def test_lexical_index_follows_sync(self):
+        self.rag.sync([{"id": "a", "content": "аренда опушки", "category": "birthday", "title": ""}])
+        self.assertEqual(len(self.rag.search("опушка")), 1)
+        self.rag.sync([{"id": "b", "content": "носки продаются на кассе", "category": "shared", "title": ""}])
+        self.assertEqual([doc["id"] for doc in self.rag.search("опушка")], ["b"])
+
+
+class TestRAGSync(unittest.TestCase):
+    backend = "chroma"
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.embedding_fn = HashEmbeddingFunction()
+        self.rag = RAGSystem("nn", persist_dir=Path(self._tmp.name), embedding_fn=self.embedding_fn,
+                             backend=self.backend)
+        self.chunks = [
+            {"id": f"doc_{i}", "content": f"документ номер {i}", "category": "general", "title": f"doc {i}"}
+            for i in range(5)
+        ]
+        self.rag.sync(self.chunks)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_unchanged_tree_is_noop(self):
+        requests = self.embedding_fn.requests
+        diff = self.rag.sync(self.chunks)
+        self.assertEqual(diff, {"added": [], "changed": [], "removed": [], "unchanged": 5})
+        self.assertEqual(self.embedding_fn.requests, requests)
+
+    def test_changed_and_removed(self):
+        chunks = self.chunks[1:]
+        chunks[0] = dict(chunks[0], content="документ номер 1, новая редакция")
+        chunks.append({"id": "doc_new", "content": "новый документ", "category": "general", "title": "new"})
+        diff = self.rag.sync(chunks)
+        self.assertEqual(diff["added"], ["doc_new"])
+        self.assertEqual(diff["changed"], ["doc_1"])
+        self.assertEqual(diff["removed"], ["doc_0"])
+        self.assertEqual(diff["unchanged"], 3)
+        self.assertEqual(sorted(self.rag.store.ids()), sorted(c["id"] for c in chunks))
+
+    def test_manifest_survives_restart_and_model_change(self):
+        rag = RAGSystem("nn", persist_dir=Path(self._tmp.name), embedding_fn=self.embedding_fn,
+                        backend=self.backend)
+        self.assertEqual(rag.sync(self.chunks)["unchanged"], 5)
+        rag.embedding_model = "other-model"
+        self.assertEqual(len(rag.sync(self.chunks)["changed"]), 5)
+
+    def test_other_process_sees_sync(self):
+        reader = RAGSystem("nn", persist_dir=Path(self._tmp.name), embedding_fn=self.embedding_fn,
+                           backend=self.backend)
+        self.assertEqual(reader.search("документ номер 0", n_results=1)[0]["id"], "doc_0")
+
+        chunks = self.chunks[1:] + [{"id": "doc_new", "content": "про батуты", "category": "general", "title": "new"}]
+        self.rag.sync(chunks)
+
+        # Без перезапуска: векторы и BM25 читателя — из одной и той же записи
+        self.assertEqual(reader.search("про батуты", n_results=1)[0]["id"], "doc_new")
+        self.assertEqual(sorted(reader.store.ids()), sorted(c["id"] for c in chunks))
+        self.assertEqual(sorted(reader._lexical_index()._docs), sorted(reader.store.ids()))
+
+
+class TestRAGRebuild(unittest.TestCase):
+    backend = "chroma"
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.persist_dir = Path(self._tmp.name)
+        self.embedding_fn = HashEmbeddingFunction()
+        self.rag = RAGSystem("nn", persist_dir=self.persist_dir, embedding_fn=self.embedding_fn,
+                             backend=self.backend, hybrid=False)
+        self.chunks = [
+            {"id": f"doc_{i}", "content": f"документ номер {i}", "category": "general", "title": f"doc {i}"}
+            for i in range(5)
+        ]
+        self.rag.sync(self.chunks)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_rebuild_switches_to_new_version(self):
+        legacy = self.rag.store.name
+        chunks = self.chunks[1:] + [{"id": "doc_new", "content": "про батуты", "category": "general", "title": "new"}]
+        diff = self.rag.rebuild(chunks)
+
+        self.assertEqual(diff["added"], ["doc_new"])
+        self.assertEqual(diff["removed"], ["doc_0"])
+        self.assertTrue(self.rag.store.name.startswith(f"{legacy}__"))
+        self.assertEqual(sorted(self.rag.store.ids()), sorted(c["id"] for c in chunks))
+        self.assertEqual(self.rag.search("про батуты", n_results=1)[0]["id"], "doc_new")
+        # Без изменений после rebuild — sync ничего не делает
+        self.assertEqual(self.rag.sync(chunks)["unchanged"], 5)
+
+    def test_other_process_picks_up_switch(self):
+        reader = RAGSystem("nn", persist_dir=self.persist_dir, embedding_fn=self.embedding_fn,
+                           backend=self.backend, hybrid=False)
+        self.assertIn("### doc 0", reader.get_context("документ номер 0"))
+
+        self.rag.rebuild([{"id": "only", "content": "единственный документ", "category": "general", "title": "Один"}])
+        self.assertEqual(reader.search("документ")[0]["id"], "only")
+        self.assertEqual(reader.store.name, self.rag.store.name)
+        self.assertIn("### Один", reader.get_context("документ номер 0"))
+
+    def test_old_versions_are_garbage_collected(self):
+        legacy = self.rag.store.name
+        names = []
+        with patch("core.rag.RAG_INDEX_KEEP_VERSIONS", 2):
+            for _ in range(3):
+                self.rag.rebuild(self.chunks)
+                names.append(self.rag.store.name)
+
+        self.assertEqual(self.rag._read_pointer(), {"active": names[-1], "versions": names[-2:]})
+        manifests = sorted(path.name for path in self.persist_dir.glob("manifest_*.json"))
+        self.assertEqual(manifests, sorted(f"manifest_{name}.json" for name in names[-2:]))
+        for name in [legacy, names[0]]:
+            self.assertEqual(self.rag._open_store(name).count(), 0)
+
+    def test_failed_rebuild_keeps_active_version(self):
+        active = self.rag.store.name
+        with patch.object(self.rag, "add_documents", side_effect=RuntimeError("embeddings down")):
+            with self.assertRaises(RuntimeError):
+                self.rag.rebuild(self.chunks)
+
+        self.assertEqual(self.rag.store.name, active)
+        self.assertEqual(self.rag.store.count(), 5)
+        self.assertFalse(self.rag.pointer_path.exists())
+        self.assertEqual([path.name for path in self.persist_dir.glob("manifest_*.json")], [f"manifest_{active}.json"])
+
+
+class TestRAGContextCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.embedding_fn = HashEmbeddingFunction()
+        self.rag = RAGSystem("nn", persist_dir=Path(self._tmp.name), embedding_fn=self.embedding_fn)
+        self.rag.sync([{"id": "a", "content": "парк работает с 10 до 22", "category": "general", "title": "Часы"}])
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_normalized_queries_share_entry(self):
+        self.assertEqual(normalize_query("  Во сколько   открываетесь?! "), "во сколько открываетесь")
+        context = self.rag.get_context("До скольки работаете?", "general")
+        requests = self.embedding_fn.requests
+        self.assertEqual(self.rag.get_context("до скольки  работаете", "general"), context)
+        self.assertEqual(self.embedding_fn.requests, requests)
+        self.assertEqual(self.rag.context_cache.stats()["hits"], 1)
+
+    def test_reindex_invalidates(self):
+        self.rag.get_context("часы работы", "general")
+        self.rag.sync([{"id": "a", "content": "парк работает с 9 до 23", "category": "general", "title": "Часы"}])
+        self.assertIn("с 9 до 23", self.rag.get_context("часы работы", "general"))
+
+    def test_async_context_runs_off_event_loop(self):
+        threads = []
+        embed = self.rag.embed
+        self.rag.embed = lambda texts: threads.append(threading.get_ident()) or embed(texts)
+
+        context = asyncio.run(self.rag.aget_context("часы работы", "general"))
+        self.assertIn("с 10 до 22", context)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_registry_shares_instance(self):
+        self.assertIs(get_rag("nn"), rag)
+
+
+class TestNumpyRAGIndexing(TestRAGIndexing):
+    backend = "numpy"
+
+    def test_same_ranking_as_chroma(self):
+        chunks = [
+            {"id": f"doc_{i}", "content": text, "category": category, "title": text}
+            for i, (text, category) in enumerate([
+                ("цены на билеты в парк", "general"),
+                ("часы работы парка", "general"),
+                ("аниматоры на день рождения", "birthday"),
+                ("меню банкета для детей", "birthday"),
+                ("носки для батутов", "shared"),
+            ])
+        ]
+        chroma = RAGSystem("nn", persist_dir=Path(self._tmp.name) / "chroma", embedding_fn=self.embedding_fn,
+                           hybrid=False)
+        chroma.add_documents(chunks)
+        self.rag.hybrid = False
+        self.rag.add_documents(chunks)
+        for query, intent in [("цены на билеты", None), ("банкет на день рождения", "birthday"), ("носки", "general")]:
+            expected = chroma.search(query, intent, n_results=3)
+            actual = self.rag.search(query, intent, n_results=3)
+            # Порядок равных по сходству документов у бэкендов может отличаться
+            self.assertEqual(actual[0]["title"], expected[0]["title"])
+            np.testing.assert_allclose([doc["distance"] for doc in actual], [doc["distance"] for doc in expected], atol=1e-4)
+
+    def test_mmap_reload(self):
+        self.rag.add_documents([{"id": "a", "content": "часы работы", "category": "general", "title": "Часы"}])
+        with patch("core.rag.RAG_NUMPY_MMAP", True):
+            rag = RAGSystem("nn", persist_dir=Path(self._tmp.name), embedding_fn=self.embedding_fn, backend="numpy")
+        self.assertEqual(rag.search("часы работы")[0]["title"], "Часы")
+
+
+class TestNumpyRAGSync(TestRAGSync):
+    backend = "numpy"
+
+    def test_generations_are_atomic_and_collected(self):
+        store = self.rag.store
+        for i in range(3):
+            self.rag.sync(self.chunks + [{"id": "extra", "content": f"правка {i}", "category": "general", "title": "e"}])
+
+        generations = sorted(entry.name for entry in store.path.iterdir() if entry.is_dir())
+        self.assertEqual(len(generations), store.GENERATIONS_KEEP)
+        self.assertEqual((store.path / "CURRENT").read_text(encoding="utf-8"), generations[-1])
+        self.assertEqual(store.version, generations[-1])
+        self.assertTrue((store.path / generations[-1] / "vectors.npy").exists())
+
+
+class TestNumpyRAGRebuild(TestRAGRebuild):
+    backend = "numpy"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# Импорт пакета core создаёт глобальные agent/rag — им нужен ключ (запросов к API нет)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from bot.streaming import FALLBACK_REPLY, send_streamed_reply
+from tests.test_agent import fake_stream
+
+
+def fake_bot(edit_error: Exception = None):
+    return SimpleNamespace(
+        send_message=AsyncMock(return_value=SimpleNamespace(message_id=7)),
+        edit_message_text=AsyncMock(side_effect=edit_error),
+    )
+
+
+class TestSendStreamedReply(unittest.TestCase):
+    def test_first_chunk_sent_then_edited(self):
+        bot = fake_bot()
+        with patch("bot.streaming.STREAM_EDIT_INTERVAL", 0):
+            text = asyncio.run(send_streamed_reply(bot, 42, fake_stream("", "При", "вет", "!")))
+
+        self.assertEqual(text, "Привет!")
+        # Пустой кусок не отправляется, первое сообщение — с первым текстом
+        bot.send_message.assert_awaited_once_with(chat_id=42, text="При")
+        self.assertEqual(bot.edit_message_text.await_args.kwargs, {"chat_id": 42, "message_id": 7, "text": "Привет!"})
+
+    def test_edits_are_throttled_and_final_text_shown(self):
+        bot = fake_bot()
+        with patch("bot.streaming.STREAM_EDIT_INTERVAL", 3600):
+            text = asyncio.run(send_streamed_reply(bot, 42, fake_stream("Раз ", "два ", "три")))
+
+        self.assertEqual(text, "Раз два три")
+        # Промежуточных правок нет — только финальная
+        bot.edit_message_text.assert_awaited_once_with(chat_id=42, message_id=7, text="Раз два три")
+
+    def test_single_chunk_needs_no_edit(self):
+        bot = fake_bot()
+        self.assertEqual(asyncio.run(send_streamed_reply(bot, 42, fake_stream("Готово"))), "Готово")
+        bot.edit_message_text.assert_not_awaited()
+
+    def test_failed_edit_does_not_lose_reply(self):
+        bot = fake_bot(edit_error=RuntimeError("message is not modified"))
+        with patch("bot.streaming.STREAM_EDIT_INTERVAL", 0):
+            text = asyncio.run(send_streamed_reply(bot, 42, fake_stream("Раз ", "два")))
+        self.assertEqual(text, "Раз два")
+
+
+    def test_empty_stream_sends_fallback(self):
+        for chunks in ((), ("", "  ", "\n")):
+            bot = fake_bot()
+            self.assertEqual(asyncio.run(send_streamed_reply(bot, 42, fake_stream(*chunks))), "")
+            bot.send_message.assert_awaited_once_with(chat_id=42, text=FALLBACK_REPLY)
+            bot.edit_message_text.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()